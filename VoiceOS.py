@@ -1,13 +1,40 @@
+import time
+STARTUP_ORIGIN = time.perf_counter() # Taken before the other imports, for --profile-startup
 import os
 import sys
+import json
+import argparse
 import tkinter as tk
 import threading
-import speech_recognition as sr
 from tkinter import ttk
-import google.generativeai as genai
-import json
 from dotenv import load_dotenv
-import shutil
+import re
+from pipeline import Pipeline
+from ui_events import UIEventQueue
+from session_log import SessionLog, compile_matcher
+from jobs import JobRunner
+from collections import deque
+from metrics import StartupProfile
+from command_history import CommandHistory
+from session import Session
+from shell_engine import create_engine, load_intent_components, CommandResult
+from daemon_client import RemoteEngine, DaemonError, NO_SPEECH
+from shell_args import FailedOutput
+# speech_recognition, NumPy, the ASR model and the AI client are loaded by the background warm-up.
+
+startup = StartupProfile(origin=STARTUP_ORIGIN)
+startup.record("import.core", 0.0, startup.elapsed())
+
+parser = argparse.ArgumentParser(description="VoiceOS Shell")
+parser.add_argument("--profile-startup", action="store_true",
+                    help="Run one voice command as soon as possible, print per-phase startup times and exit")
+parser.add_argument("--profile-say", default="list files",
+                    help="Transcript used as the voice command in --profile-startup (default: 'list files')")
+parser.add_argument("--profile-output", help="Also write the startup profile as JSON to this file")
+parser.add_argument("--daemon", action="store_true", default=os.getenv("VOICEOS_DAEMON", "0") == "1",
+                    help="Be a client of the VoiceOS daemon (voiceosd.py), starting it if needed")
+args = parser.parse_args()
+daemon_mode = args.daemon
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,411 +52,525 @@ COLORS = {
 }
 
 
-# --- Gemini AI Setup ---
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-gemini_ready = False
-gemini_model = None
+# --- Shell Engine ---
+# Command parsing/execution, intent resolution (cache, local classifier, Gemini client), the trash
+# and metrics live in shell_engine.py; this file is only the Tk front end. With --daemon they, and
+# speech recognition, live in the daemon instead and the engine is a RemoteEngine talking to it;
+# the microphone and the commands registered below stay here.
+def report_trash_error(message):
+    ui_events.post_text(f"[trash] {message}\n", "error")
 
-if not GEMINI_API_KEY:
-    print("Error: GEMINI_API_KEY not found in .env file. Voice AI features will be limited.")
-else:
+with startup.phase("engine"):
+    if daemon_mode:
+        engine = RemoteEngine() # Connects (and starts the daemon) on first use, in the warm-up
+    else:
+        engine = create_engine(on_trash_error=report_trash_error, load_intents=False)
+DATA_DIR = os.getenv("VOICEOS_HOME", os.path.join(os.path.expanduser("~"), ".voiceos"))
+metrics = engine.metrics
+startup.attach(metrics)
+stats_in_status_bar = os.getenv("VOICEOS_STATS_STATUS", "0") == "1"
+STATUS_BAR_STAGES = ["voice.capture", "asr", "llm", "render"]
+
+# --- Background Warm-up ---
+# The window and prompt come up first. speech_recognition/NumPy, the ASR model, the microphone and the
+# AI client are then loaded on background threads. Each voice stage waits only for the part it
+# needs, so a command spoken during warm-up is delayed rather than refused.
+sr = None                 # speech_recognition, once imported
+asr_backend = None        # Selected with VOICEOS_ASR_BACKEND (google, vosk, whisper, stub)
+capture_service = None    # One long-lived microphone stream with a pre-roll buffer
+audio_preprocessor = None # Trims silence and resamples each utterance before recognition
+vad_enabled = os.getenv("VOICEOS_VAD", "1") != "0"
+mic_ready = threading.Event()     # Set once the capture service exists (opening the mic may have failed)
+asr_ready = threading.Event()
+intents_ready = threading.Event()
+
+def warm_up_speech():
+    global sr, capture_service, audio_preprocessor
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        gemini_ready = True
-        print(f"Gemini AI initialized successfully with model: {gemini_model.model_name if gemini_model else 'N/A'}.")
-    except Exception as e:
-        print(f"Error initializing Gemini AI: {e}. Voice AI features will be limited.")
-
-# --- Command History ---
-command_history = []
-history_index = 0
-
-def add_to_history(cmd_to_add):
-    global command_history, history_index
-    if not cmd_to_add:
-        return
-    if not command_history or command_history[-1] != cmd_to_add:
-        command_history.append(cmd_to_add)
-    history_index = len(command_history)
-
-
-# --- Shell functions with string outputs ---
-def removeDirectory(directories):
-    messages = []
-    if not directories:
-        return "No directories specified for removal."
-    for dir_name in directories:
-        if not dir_name.strip():
-            messages.append("Error: Empty directory name specified.")
-            continue
+        with startup.phase("import.speech"):
+            import speech_recognition as sr
+            from audio_capture import CaptureService
+        if not daemon_mode: # Otherwise the daemon trims and recognizes
+            from audio_preprocess import AudioPreprocessor
+            threading.Thread(target=warm_up_asr_backend, daemon=True, name="warm-asr").start()
+            audio_preprocessor = AudioPreprocessor()
+        capture_service = CaptureService(
+            preroll_seconds=float(os.getenv("VOICEOS_PREROLL_SECONDS", "1.0")),
+            pause_seconds=float(os.getenv("VOICEOS_PAUSE_SECONDS", "0.8")),
+        )
         try:
-            shutil.rmtree(dir_name) # Use shutil.rmtree for non-empty directories
-            messages.append(f"Directory '{dir_name}' and its contents removed.")
-        except FileNotFoundError:
-            messages.append(f"Directory '{dir_name}' not found.")
-        except NotADirectoryError:
-            messages.append(f"Error: '{dir_name}' is not a directory.")
-        except PermissionError:
-            messages.append(f"Permission denied to remove '{dir_name}'.")
-        except OSError as e:
-            messages.append(f"OS error removing '{dir_name}': {e}")
+            with startup.phase("mic_open"):
+                capture_service.start()
         except Exception as e:
-            messages.append(f"An unexpected error occurred with '{dir_name}': {e}")
-    return "\n".join(messages)
-
-def removeFile(files):
-    messages = []
-    if not files:
-        return "No files specified for removal."
-    for file_name in files:
-        if not file_name.strip():
-            messages.append("Error: Empty file name specified.")
-            continue
-        try:
-            os.remove(file_name)
-            messages.append(f"File '{file_name}' removed.")
-        except FileNotFoundError:
-            messages.append(f"File '{file_name}' not found.")
-        except PermissionError:
-            messages.append(f"Permission denied for '{file_name}'.")
-        except IsADirectoryError:
-             messages.append(f"Cannot remove '{file_name}'. It is a directory. Use 'rm -r' for directories.")
-        except OSError as e:
-            messages.append(f"OS error removing '{file_name}': {e}")
-        except Exception as e:
-            messages.append(f"An unexpected error occurred with '{file_name}': {e}")
-    return "\n".join(messages)
-
+            print(f"Error opening microphone: {e}. Voice commands will retry when requested.")
+    finally:
+        mic_ready.set()
+        warm_up_finished()
 
-def makeFile(file_name):
-    if not file_name.strip():
-        return "Error: No file name specified."
+def warm_up_asr_backend():
+    global asr_backend
     try:
-        with open(file_name, 'a') as f:
-            pass
-        return f"File '{file_name}' ensured/created."
-    except PermissionError:
-        return f"Permission denied: Unable to create/access '{file_name}'."
-    except Exception as e:
-        return f"An error occurred creating file '{file_name}': {e}"
-
-def makeDirectory(directory_name):
-    if not directory_name.strip():
-        return "Error: No directory name specified."
+        with startup.phase("asr"):
+            from asr_backends import load_asr_backend
+            asr_backend = load_asr_backend()
+    finally:
+        asr_ready.set()
+        warm_up_finished()
+
+def warm_up_intents():
     try:
-        os.mkdir(directory_name)
-        return f"Directory '{directory_name}' created."
-    except FileExistsError:
-        return f"Directory '{directory_name}' already exists."
-    except PermissionError:
-        return f"Permission denied: Unable to create '{directory_name}'."
-    except FileNotFoundError:
-        return f"Error creating directory '{directory_name}': Path not found. Create parent directories first."
-    except Exception as e:
-        return f"An error occurred creating directory '{directory_name}': {e}"
+        if daemon_mode:
+            with startup.phase("daemon"):
+                try:
+                    engine.wait_ready()
+                except DaemonError as e:
+                    print(f"VoiceOS daemon unavailable: {e}")
+        else:
+            load_intent_components(engine, DATA_DIR, profile=startup)
+    finally:
+        if daemon_mode:
+            asr_ready.set() # Recognition requests wait in the daemon until its model is loaded
+        intents_ready.set()
+        warm_up_finished()
+    if not engine.ai_ready:
+        ui_events.post_call(report_ai_not_configured)
+
+def warm_up_finished():
+    if mic_ready.is_set() and asr_ready.is_set() and intents_ready.is_set() and startup.mark("voice_ready"):
+        print(f"Voice ready after {startup.elapsed():.2f} s.")
+        if engine.ai_ready:
+            gui_status_update("Ready.")
+
+def warm_up_history(history):
+    with startup.phase("history"):
+        history.load()
+
+def start_warm_up():
+    threading.Thread(target=warm_up_history, args=(active_tab.session.history,), daemon=True,
+                     name="warm-history").start()
+    if not daemon_mode:
+        engine.dir_cache.prefetch(active_tab.session.cwd) # The first Tab is answered from the cache
+    engine.intents_pending = True
+    threading.Thread(target=warm_up_speech, daemon=True, name="warm-speech").start()
+    threading.Thread(target=warm_up_intents, daemon=True, name="warm-intents").start()
+
+def wait_until_ready(event, what):
+    if not event.is_set():
+        gui_status_update(f"Waiting for {what} to finish loading...")
+        event.wait()
+
+# --- Tabs ---
+# Each tab is a shell of its own: a Text widget backed by a Session (working directory, command
+# history, scrollback log) plus its own command queue, so a long job in one tab neither blocks
+# another nor changes the directory its paths are resolved against. Ctrl+T opens a tab in the
+# current directory, Ctrl+W closes one, Ctrl+Tab switches. Voice commands run in the active tab.
+class Tab:
+    def __init__(self, session, frame, text):
+        self.session = session
+        self.frame = frame  # Notebook page
+        self.text = text
+        self.closed = False
+        self.current_job = None
+        self.pending_commands = deque() # (command, batch) waiting for the running job; batch groups one utterance
+        self.pending_choice = None      # After an ambiguous spoken name: {"choices", "rest"}; keys 1-9 pick one
+        self.history_nav = None         # While Up/Down is walking: {"prefix", "seq", "typed"}
+        self.history_search = None      # While Ctrl+R is active: {"query", "seq", "original"}
+        self.search_screen = ""         # The widget's text, copied on the mainloop for a `search` job
+
+tabs = {}         # Notebook page name -> Tab
+active_tab = None # Updated by the mainloop; worker threads only read it
+
+def tab_for_session(session):
+    return next(tab for tab in list(tabs.values()) if tab.session is session) # list(): workers call this too
 
-def changeDirectory(path):
-    if not path.strip() and path != "..":
-        if not path.strip():
-          return "Error: No directory path specified for cd."
+# --- Command History ---
+# Persistent and shared by all windows and tabs (see command_history.py). The tabs of a window
+# share one CommandHistory, loaded and indexed once, so a command run in one tab is at once in the
+# others' Up/Down and Ctrl+R; other windows' commands show up after a restart. Up/Down walk the entries starting with whatever was typed before the first Up;
+# Ctrl+R searches for a substring, bash style.
+HISTORY_FILE = os.getenv("VOICEOS_HISTORY_FILE", os.path.join(DATA_DIR, "history"))
+HISTORY_SIZE = int(os.getenv("VOICEOS_HISTORY_SIZE", "10000"))
+command_history = CommandHistory(HISTORY_FILE, max_entries=HISTORY_SIZE)
+
+def add_to_history(tab, cmd_to_add):
+    tab.history_nav = None
+    if cmd_to_add:
+        tab.session.history.add(cmd_to_add)
+
+def history_command(session, arg_string):
     try:
-        os.chdir(path)
-        return f"Changed to {os.getcwd()}"
-    except FileNotFoundError:
-        return f"The system cannot find the path specified: '{path}'"
-    except NotADirectoryError:
-        return f"Not a directory: '{path}'"
-    except PermissionError:
-        return f"Permission denied for path: '{path}'"
-    except Exception as e:
-        return f"Error changing directory to '{path}': {e}"
-
-
-def getPresentWorkingDirectory():
-    return os.getcwd()
-
-def list_directory():
+        count = int(arg_string.strip() or "20")
+    except ValueError:
+        return FailedOutput("Usage: history [count]")
+    commands = session.history.recent(count)
+    first = len(session.history) - len(commands) + 1
+    return "\n".join(f"{first + i:>6}  {command}" for i, command in enumerate(commands))
+
+
+# --- Screen commands ---
+def clear_terminal_screen(tab):
+    tab.session.log.append(tab.text.get('1.0', 'end-1c')) # Cleared text stays searchable
+    tab.text.delete('1.0', tk.END)
+    tab.text.edit_reset()
+
+# --- Scrollback ---
+# Each widget keeps at most SCROLLBACK_LINES lines; older lines are spilled to its session's log.
+SCROLLBACK_LINES = int(os.getenv("VOICEOS_SCROLLBACK_LINES", "5000"))
+LOG_DIR = os.getenv("VOICEOS_LOG_DIR", os.path.join(DATA_DIR, "logs"))
+
+def enforce_scrollback(tab):
+    text = tab.text
+    line_count = int(text.index("end-1c").split(".")[0])
+    if line_count <= SCROLLBACK_LINES:
+        return
+    # Trim down to 90% of the cap in one go so this runs rarely instead of on every new line.
+    cut_line = line_count - int(SCROLLBACK_LINES * 0.9)
+    tab.session.log.append(text.get("1.0", f"{cut_line}.0"))
+    text.delete("1.0", f"{cut_line}.0")
+    text.edit_reset() # The undo stack would otherwise keep the trimmed text alive
+
+def on_text_inserted(text):
+    tab = tabs.get(str(text.master))
+    if tab is not None:
+        enforce_scrollback(tab)
+
+def search_session(tab, query, max_results=200):
+    # Runs as a job: the session log can be long. The screen is searched in the copy execute_command
+    # took on the mainloop, since workers must not touch the widget.
+    use_regex = False
+    if query.startswith("-r "):
+        use_regex, query = True, query[3:].strip()
+    if not query:
+        return "Usage: search [-r] <text or regex>"
     try:
-        return "  ".join(os.listdir(os.getcwd()))
-    except FileNotFoundError:
-        return "Error: Current working directory not found."
-    except PermissionError:
-        return "Error: Permission denied to list current directory."
-    except Exception as e:
-        return f"Error listing directory: {e}"
-
-def clear_terminal_screen():
-    text.delete('1.0', tk.END)
-    return "" # No output string, new prompt will be added
+        matcher = compile_matcher(query, use_regex)
+        results = [f"log:{n}: {line}" for n, line in tab.session.log.search(query, use_regex, max_results)]
+    except re.error as e:
+        return f"Invalid regular expression: {e}"
+    except OSError as e:
+        return f"Error reading session log: {e}"
+    for n, line in enumerate(tab.search_screen.splitlines(), start=1):
+        if len(results) >= max_results:
+            break
+        if matcher(line):
+            results.append(f"screen:{n}: {line}")
+    if not results:
+        return f"No matches for '{query}'."
+    if len(results) >= max_results:
+        results.append(f"(showing first {max_results} matches)")
+    return "\n".join(results)
 
 # --- Text Widget Redirection ---
+# print() may be called from any thread, so output is posted to the UI event queue and written
+# by the Tk mainloop instead of touching the widget directly. Printed text goes to the active tab;
+# job output goes to the tab that started the job.
+ui_events = UIEventQueue(metrics=metrics)
+
 class TextRedirector:
-    def __init__(self, text_widget):
-        self.text_widget = text_widget
+    def __init__(self, event_queue):
+        self.event_queue = event_queue
 
     def write(self, string):
-        self.text_widget.insert("end", string)
-        self.text_widget.see("end")
+        if threading.current_thread().name.startswith("warm-"):
+            # Warm-up messages arrive while the prompt is showing; keep them out of the line being typed.
+            self.event_queue.post_call(insert_above_prompt, string)
+        else:
+            self.event_queue.post_text(string)
 
     def flush(self):
         pass
 
-# --- AI Command Interpretation ---
-def get_command_from_ai(transcribed_text):
-    if not gemini_ready or not gemini_model:
-        return {"command": "unknown", "argument": "", "error": "Gemini AI not available."}
-
-    response = None
-
-    prompt = f"""
-    You are an AI assistant for a voice-controlled shell.
-    User's speech: "{transcribed_text}"
-
-    Your task is to identify which of the following 8 shell commands the user intends to execute and extract any necessary arguments.
-    The supported commands are:
-    1. ls (list directory contents)
-    2. pwd (print working directory)
-    3. cd <directory_name> (change directory to <directory_name>)
-    4. mkdir <directory_name> (make directory named <directory_name>)
-    5. touch <file_name> (create/update file named <file_name>)
-    6. rm <file_name> (remove file named <file_name>)
-    7. rm -r <directory_name> (remove directory named <directory_name>, recursively)
-    8. clear (clear the terminal screen)
-
-    Argument Processing Rules:
-    - Convert spoken numbers to digits (e.g., "one" to "1").
-    - Interpret spoken characters: "dot" or "period" -> ".", "underscore" or "underline" -> "_", "slash" -> "/", "backslash" -> "\\", "dash" or "hyphen" -> "-"
-    - File/directory names can contain spaces. Preserve them.
-
-    Respond ONLY with a JSON object in the following format:
-    {{"command": "COMMAND_NAME", "argument": "ARGUMENT_VALUE"}}
-
-    - If the command does not take an argument (ls, pwd, clear), "argument" should be an empty string.
-    - For commands like cd, mkdir, touch, rm, rm -r, "argument" should be the identified file/directory name.
-    - If the user's speech is unclear, ambiguous, or does not map to any of the supported commands, respond with:
-      {{"command": "unknown", "argument": ""}}
-
-    Examples:
-    User speech: "list the files" -> {{"command": "ls", "argument": ""}}
-    User speech: "where am I?" -> {{"command": "pwd", "argument": ""}}
-    User speech: "go to my project folder" -> {{"command": "cd", "argument": "my project folder"}}
-    User speech: "make a directory called test results version one" -> {{"command": "mkdir", "argument": "test results version one"}}
-    User speech: "create a file report dot txt" -> {{"command": "touch", "argument": "report.txt"}}
-    User speech: "delete the file log_backup_file.data" -> {{"command": "rm", "argument": "log_backup_file.data"}}
-    User speech: "remove the old_stuff directory" -> {{"command": "rm -r", "argument": "old_stuff"}}
-    User speech: "clear the screen" -> {{"command": "clear", "argument": ""}}
-    User speech: "what is two plus two" -> {{"command": "unknown", "argument": ""}}
-
-    User speech: "{transcribed_text}"
-    JSON Response:
-    """
-    try:
-        response = gemini_model.generate_content(prompt)
-        
-        if not response or not hasattr(response, 'text'):
-            error_message = "Gemini API call did not return a valid response object or text."
-            if response and hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
-                error_message += f" (Prompt blocked: {response.prompt_feedback.block_reason})"
-            print(error_message)
-            return {"command": "unknown", "argument": "", "error": error_message}
-
-        cleaned_response_text = response.text.strip()
-        if cleaned_response_text.startswith("```json"):
-            cleaned_response_text = cleaned_response_text[len("```json"):]
-        elif cleaned_response_text.startswith("```"):
-            cleaned_response_text = cleaned_response_text[len("```"):]
-        if cleaned_response_text.endswith("```"):
-            cleaned_response_text = cleaned_response_text[:-len("```")]
-        cleaned_response_text = cleaned_response_text.strip()
-
-        ai_json = json.loads(cleaned_response_text)
-        
-        if isinstance(ai_json, dict) and "command" in ai_json and "argument" in ai_json:
-            ai_json["argument"] = ai_json.get("argument") or ""
-            return ai_json
-        else:
-            print(f"Error: AI response malformed structure. Raw: {response.text}")
-            return {"command": "unknown", "argument": "", "error": "Malformed AI response structure."}
-
-    except json.JSONDecodeError as e:
-        raw_resp_text = "'No text in response'"
-        if response and hasattr(response, 'text'):
-            raw_resp_text = response.text
-        print(f"Error decoding JSON from AI: {e}. Raw response text: {raw_resp_text}")
-        return {"command": "unknown", "argument": "", "error": f"JSON decode error: {e}"}
-    except Exception as e:
-        error_message = f"Error calling Gemini API or processing response: {e}"
-        if response and hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
-             error_message += f" (Prompt blocked: {response.prompt_feedback.block_reason})"
-        print(error_message)
-        return {"command": "unknown", "argument": "", "error": error_message}
-
-
 # --- Command Execution ---
-def execute_command(command_str_input):
+# Commands that change the text widget itself run on the Tk mainloop; everything else runs as a
+# job on the worker pool so slow filesystem operations (and searching a long session log) never
+# freeze the window. Programs, and everything the daemon runs, may never finish and get threads of
+# their own (see jobs.py). Results come back through the UI event queue.
+MAIN_THREAD_COMMANDS = ["", "clear"]
+
+job_runner = JobRunner(max_workers=int(os.getenv("VOICEOS_JOB_WORKERS", "4")))
+
+# Commands that need the window or the voice components are registered with the engine.
+engine.register("search", lambda arg_string, _part2, _job, session: search_session(tab_for_session(session), arg_string),
+                takes_arguments=True)
+engine.register("history", lambda arg_string, _part2, _job, session: history_command(session, arg_string),
+                takes_arguments=True)
+engine.register("voice", lambda _args, _part2, _job, _session: voice_pipeline.describe())
+engine.register("asr", lambda _args, _part2, _job, _session: describe_speech())
+
+def describe_speech():
+    if daemon_mode:
+        try:
+            info = engine.describe()
+        except DaemonError as e:
+            return FailedOutput(f"VoiceOS daemon: {e}")
+        return f"{info['daemon']}\n{info['asr']}\n{info['preprocessor']}"
+    if not (asr_ready.is_set() and mic_ready.is_set()):
+        return "Speech recognition is still loading."
+    return f"{asr_backend.describe()}\n{audio_preprocessor.describe()}"
+
+def execute_command(tab, command_str_input, batch=None):
+    tab.pending_choice = None
     # Add command to history if it's not empty and not "clear"
     # "clear" is not typically part of bash history either that repopulates the command line
-    if command_str_input and command_str_input.strip().lower() != "clear":
-        add_to_history(command_str_input.strip())
+    # Spoken commands are added when they finish, with the names they were resolved to.
+    if batch is None and command_str_input and command_str_input.strip().lower() != "clear":
+        add_to_history(tab, command_str_input.strip())
 
     command_str = command_str_input.strip() # Use stripped version for processing
 
+    ui_events.flush() # Messages printed before this command go above it
     if command_str: # Only insert non-empty command to text widget
-        text.insert("end", f"{command_str}\n", "command")
-        text.see("end")
+        tab.text.insert("end", f"{command_str}\n", "command")
+        tab.text.see("end")
 
-    parts = command_str.split(maxsplit=2)
-    base_cmd_part1 = parts[0] if len(parts) > 0 else ""
-    base_cmd_part2 = parts[1] if len(parts) > 1 else ""
-    
-    full_base_command = base_cmd_part1.lower() # Match commands case-insensitively
-    arg_string = ""
-
-    if full_base_command == "rm" and base_cmd_part2.lower() == "-r":
-        full_base_command = "rm -r"
-        arg_string = parts[2] if len(parts) > 2 else ""
-    elif full_base_command in ["cd", "mkdir", "touch", "rm"]:
-        arg_string = command_str[len(base_cmd_part1):].strip()
-    
-    output = ""
-    if full_base_command == "pwd":
-        output = getPresentWorkingDirectory()
-    elif full_base_command == "ls":
-        output = list_directory()
-    elif full_base_command == "cd":
-        output = changeDirectory(arg_string)
-    elif full_base_command == "mkdir":
-        output = makeDirectory(arg_string)
-    elif full_base_command == "touch":
-        output = makeFile(arg_string)
-    elif full_base_command == "rm": 
-        if not arg_string: output = "No file specified for rm."
-        else: output = removeFile([arg_string])
-    elif full_base_command == "rm -r":
-        if not arg_string: output = "No directory specified for rm -r."
-        else: output = removeDirectory([arg_string])
-    elif full_base_command == "clear":
-        output = clear_terminal_screen() # Clears screen, then prompt will be added
-    elif not full_base_command : # Handles empty input after stripping
-        pass # Just go to new prompt
-    else:
-        output = f"Unknown command: '{command_str}'"
+    full_base_command = engine.parse(command_str)[0]
+    spoken = batch is not None
+    if full_base_command in MAIN_THREAD_COMMANDS:
+        finish_command(tab, engine.execute(command_str, spoken=spoken, session=tab.session), batch)
+        return
+    if full_base_command == "search":
+        tab.search_screen = tab.text.get("1.0", "end-1c") # Copied here; the job searches the copy
+
+    def on_done(job, result):
+        ui_events.post_call(finish_job, tab, job, command_str, full_base_command, result, batch)
+
+    tab.current_job = job_runner.submit(
+        command_str, lambda job: engine.execute(command_str, job, spoken, tab.session), on_done,
+        on_output=lambda string, tag: ui_events.post_text(string, tag, tab.text), on_progress=report_job_progress,
+        output_backlog=lambda: ui_events.backlog(tab.text), # Programs printing faster than the tab can show them are slowed down
+        open_ended=daemon_mode or engine.is_external(command_str, full_base_command))
+    gui_status_update(f"Running '{command_str}'... (Ctrl+C to cancel)")
 
-    if output: # Only print output if there is some
-        text.insert("end", f"{output}\n\n", "output")
-    elif full_base_command == "clear": # Special case for clear
+def report_job_progress(job, message):
+    gui_status_update(f"Running '{job.command}': {message} (Ctrl+C to cancel)")
+
+def finish_job(tab, job, command_str, full_base_command, result, batch=None):
+    tab.current_job = None
+    if tab.closed:
+        return
+    gui_status_update(f"'{command_str}' cancelled." if job.cancelled else "Ready.")
+    if not isinstance(result, CommandResult): # The job raised or was cancelled; result is the message
+        result = CommandResult(command_str, full_base_command, result, ok=False)
+    elif job.cancelled:
+        result.ok = False
+    finish_command(tab, result, batch)
+
+def finish_command(tab, result, batch=None):
+    ui_events.flush() # print()s from the command go above its result, as they came first
+    text = tab.text
+    command_str = result.command
+    if batch is not None and command_str and command_str.lower() != "clear" and not result.choices:
+        add_to_history(tab, command_str)
+    if batch is not None and startup.mark("first_voice_command"):
+        ui_events.post_call(finish_startup_profile)
+    if result.action == "clear":
+        clear_terminal_screen(tab)
+    if result.output: # Only print output if there is some
+        text.insert("end", f"{result.output}\n\n", "output")
+    elif result.action == "clear": # Special case for clear
         pass # Output already handled by clearing, just need prompt
     elif command_str : # If it was a known command with no output or an unknown command
         text.insert("end", "\n", "output") # Ensure a newline if command was processed
+    if batch is not None and not result.ok:
+        # Stop-on-error: the rest of a multi-command utterance is dropped.
+        skipped = [cmd for cmd, b in tab.pending_commands if b is batch]
+        if skipped:
+            remaining = [(cmd, b) for cmd, b in tab.pending_commands if b is not batch]
+            tab.pending_commands.clear()
+            tab.pending_commands.extend(remaining)
+            if result.choices:
+                text.insert("end", f"After your choice: {'; '.join(skipped)}\n\n", "output")
+            else:
+                text.insert("end", f"Stopped after '{command_str}' failed; skipped: {'; '.join(skipped)}\n\n", "error")
+        if result.choices:
+            # The rest of the utterance runs after the pick instead of being lost.
+            tab.pending_choice = {"choices": result.choices, "rest": skipped}
+    enforce_scrollback(tab)
+    insert_prompt(tab) # Prompt is inserted after command execution, including after clear
+    if stats_in_status_bar and batch is not None:
+        gui_status_update(metrics.status_summary(STATUS_BAR_STAGES)) # Voice commands end with their p95s
+    if tab.pending_choice is not None:
+        gui_status_update(f"Press 1-{len(tab.pending_choice['choices'])} to run a match, Esc to dismiss.")
+    if tab.pending_commands:
+        ui_events.post_call(run_next_command, tab)
+
+
+def run_command(tab, cmd, batch=None):
+    tab.pending_commands.append((cmd, batch))
+    if tab.current_job is not None:
+        gui_status_update(f"Queued '{cmd}' until '{tab.current_job.command}' finishes.")
+        return
+    run_next_command(tab)
+
+def run_command_batch(tab, commands):
+    # Commands from one utterance run one after another and stop at the first failure.
+    batch = object()
+    for cmd in commands:
+        tab.pending_commands.append((cmd, batch))
+    run_next_command(tab)
+
+def run_choice(tab, index):
+    choice, tab.pending_choice = tab.pending_choice, None
+    run_command_batch(tab, [choice["choices"][index]] + choice["rest"])
+
+def on_choice_key(tab, event):
+    # While a choice is offered and nothing has been typed: 1-9 runs a match, Esc dismisses the
+    # choice, anything else dismisses it and is handled as usual. Returns True when consumed.
+    if current_input(tab):
+        tab.pending_choice = None
+        return False
+    if event.char.isdigit() and 1 <= int(event.char) <= len(tab.pending_choice["choices"]):
+        run_choice(tab, int(event.char) - 1)
+    elif event.keysym == "Escape":
+        tab.pending_choice = None
+        gui_status_update("Ready.")
+    elif event.keysym.endswith(("_L", "_R")): # Shift, Control, Alt on their own
+        pass
+    else:
+        tab.pending_choice = None
+        return False
+    return True
 
-
-def run_command(cmd):
-    execute_command(cmd)
-    insert_prompt() # Prompt is inserted after command execution, including after clear
-
-# --- Voice Recognition ---
-def recognize_voice():
-    recognizer = sr.Recognizer()
-    with sr.Microphone() as source:
-        gui_status_update("Listening...")
-        print("Listening...")
+def run_next_command(tab):
+    if tab.closed or tab.current_job is not None or not tab.pending_commands:
+        return
+    cmd, batch = tab.pending_commands.popleft()
+    execute_command(tab, cmd, batch)
+
+def cancel_current_job(tab):
+    if tab.current_job is None:
+        return None # Nothing running: let Ctrl+C copy the selection as usual
+    tab.current_job.cancel()
+    again = " Press Ctrl+C again to force it." if tab.current_job.cancel_requests == 1 else ""
+    gui_status_update(f"Cancelling '{tab.current_job.command}'...{again}")
+    return "break"
+
+# --- Voice Pipeline ---
+# Voice commands flow through capture -> recognize -> intent -> execute stages, each on its own
+# worker, so the next utterance can be captured while the previous one is still being interpreted.
+def show_voice_error(message):
+    metrics.increment("voice_errors")
+    if startup.mark("first_voice_command"):
+        ui_events.post_call(finish_startup_profile)
+    print(message)
+    gui_status_update(message)
+    ui_events.post_text(message + "\n", "error")
+    ui_events.post_call(lambda: insert_prompt(active_tab))
+
+def capture_stage(_request):
+    wait_until_ready(mic_ready, "the microphone")
+    gui_status_update("Listening...")
+    print("Listening...")
+    try:
+        return capture_service.listen(timeout=7, phrase_time_limit=12)
+    except sr.WaitTimeoutError:
+        metrics.increment("listen_timeouts")
+        print("No speech detected within timeout.")
+        gui_status_update("No speech detected. Try again.")
+    except Exception as e:
+        metrics.increment("mic_errors")
+        print(f"Error during listening: {e}")
+        gui_status_update(f"Mic error: {e}")
+    return None
+
+def recognition_stage(audio):
+    wait_until_ready(asr_ready, "speech recognition")
+    if daemon_mode:
+        text_from_speech = recognize_in_daemon(audio)
+        if text_from_speech is None:
+            return None
+    else:
+        if vad_enabled:
+            with metrics.timer("vad"):
+                audio, trim_stats = audio_preprocessor.process(audio, target_rate=asr_backend.sample_rate)
+            if audio is None:
+                print("No speech found in the recording.")
+                gui_status_update("No speech detected. Try again.")
+                return None
+            print(f"Trimmed {trim_stats['seconds_saved']:.2f} s ({trim_stats['bytes_saved'] // 1024} KB) "
+                  f"of silence, {trim_stats['output_seconds']:.2f} s sent for recognition.")
+
+        gui_status_update("Recognizing speech...")
+        print("Recognizing speech...")
         try:
-            audio = recognizer.listen(source, timeout=7, phrase_time_limit=12)
-        except sr.WaitTimeoutError:
-            print("No speech detected within timeout.")
-            gui_status_update("No speech detected. Try again.")
-            return
-        except Exception as e:
-            print(f"Error during listening: {e}")
-            gui_status_update(f"Mic error: {e}")
-            return
-
+            with metrics.timer("asr"):
+                text_from_speech = asr_backend.recognize(audio).lower()
+        except sr.UnknownValueError:
+            show_voice_error(f"Speech recognition ({asr_backend.name}) could not understand audio.")
+            return None
+        except sr.RequestError as e:
+            show_voice_error(f"Speech recognition service error; {e}")
+            return None
+    print(f"Recognized: {text_from_speech}")
+    gui_status_update(f"Heard: {text_from_speech}. Processing with AI...")
+    return text_from_speech
+
+def recognize_in_daemon(audio):
+    # Silence trimming and recognition both happen in the daemon; "asr" here includes the round trip.
     gui_status_update("Recognizing speech...")
     print("Recognizing speech...")
     try:
-        text_from_speech = recognizer.recognize_google(audio).lower()
-        print(f"Recognized: {text_from_speech}")
-        gui_status_update(f"Heard: {text_from_speech}. Processing with AI...")
-
-        if not gemini_ready:
-            message = "Gemini AI is not initialized."
-            print(message)
-            gui_status_update(message)
-            root.after(0, lambda: text.insert("end", message + "\n", "error"))
-            root.after(0, insert_prompt)
-            return
-
-        ai_result = get_command_from_ai(text_from_speech)
-        
-        command_name = ai_result.get("command")
-        argument = ai_result.get("argument", "") 
-        error_msg = ai_result.get("error")
-
-        if error_msg:
-            gui_status_update(f"AI Error: {error_msg}")
-            if not command_name or command_name == "unknown":
-                 root.after(0, lambda: text.insert("end", f"AI Error: {error_msg}\n", "error"))
-                 root.after(0, insert_prompt)
-                 return
-
-        KNOWN_COMMANDS = ["ls", "pwd", "cd", "mkdir", "touch", "rm", "rm -r", "clear"] # Added clear
-
-        if command_name in KNOWN_COMMANDS:
-            full_command = command_name
-            if argument or command_name in ["cd", "mkdir", "touch", "rm", "rm -r"]:
-                full_command = f"{command_name} {argument}".strip()
-            
-            # add_to_history(full_command) # Handled by execute_command now
-            gui_status_update(f"AI Mapped to: {full_command}")
-            root.after(0, lambda cmd=full_command: run_command(cmd))
+        with metrics.timer("asr"):
+            return engine.recognize(audio)
+    except DaemonError as e:
+        if e.code == NO_SPEECH:
+            print("No speech found in the recording.")
+            gui_status_update("No speech detected. Try again.")
         else:
-            message = f"AI could not map speech to a known command. (AI result: '{command_name}')"
-            if command_name == "unknown" and not argument and not error_msg: 
-                 message = "Sorry, I didn't understand that command."
-            
-            print(message)
-            gui_status_update(message)
-            root.after(0, lambda m=message: text.insert("end", m + "\n", "error"))
-            root.after(0, insert_prompt)
-
-    except sr.UnknownValueError:
-        message = "Google Speech Recognition could not understand audio."
-        print(message)
-        gui_status_update(message)
-        root.after(0, lambda m=message: text.insert("end", m + "\n", "error"))
-        root.after(0, insert_prompt)
-    except sr.RequestError as e:
-        message = f"Speech recognition service error; {e}"
-        print(message)
-        gui_status_update(message)
-        root.after(0, lambda m=message: text.insert("end", m + "\n", "error"))
-        root.after(0, insert_prompt)
-    except Exception as e: 
-        message = f"An unexpected error in voice processing: {e}"
-        print(message)
-        gui_status_update(message)
-        root.after(0, lambda m=message: text.insert("end", m + "\n", "error"))
-        root.after(0, insert_prompt)
+            show_voice_error(str(e))
+        return None
+
+def intent_stage(text_from_speech):
+    wait_until_ready(intents_ready, "the AI client")
+    if not engine.ai_ready:
+        show_voice_error("Gemini AI is not initialized.")
+        return None
+
+    full_commands, error_message, ai_result = engine.interpret(text_from_speech)
+    if error_message:
+        show_voice_error(error_message)
+        return None
+
+    summary = " ; ".join(full_commands)
+    if ai_result.get("error"):
+        gui_status_update(f"AI Error: {ai_result['error']} -> {summary}")
+    elif ai_result.get("cached"):
+        cache_info = f" ({engine.intent_cache.describe()})" if engine.intent_cache else "" # None with --daemon
+        gui_status_update(f"Cache hit -> {summary}{cache_info}")
+    elif ai_result.get("fallback"):
+        gui_status_update(f"Gemini unavailable; local guess ({ai_result['confidence']:.2f}) -> {summary}")
+    elif ai_result.get("source") == "local":
+        gui_status_update(f"Resolved locally ({ai_result['confidence']:.2f}) -> {summary}")
+    else:
+        gui_status_update(f"AI Mapped to: {summary}")
+    return full_commands
+
+def execute_stage(full_commands):
+    # The UI event queue is drained in order, so commands execute in the order they were spoken.
+    ui_events.post_call(lambda: run_command_batch(active_tab, full_commands))
+    return full_commands
+
+def on_voice_pipeline_error(stage_name, item, e):
+    show_voice_error(f"An unexpected error in voice processing ({stage_name}): {e}")
+
+voice_pipeline = Pipeline(
+    [("capture", capture_stage), ("recognize", recognition_stage), ("intent", intent_stage),
+     ("execute", execute_stage)],
+    maxsize=int(os.getenv("VOICEOS_PIPELINE_QUEUE", "4")),
+    on_error=on_voice_pipeline_error,
+    metrics=metrics,
+)
+voice_pipeline.start()
 
 # --- GUI Setup ---
+window_started = startup.elapsed()
 root = tk.Tk()
 root.title("VoiceOS Shell")
 root.configure(bg=COLORS['background'])
 root.geometry("800x600")
 
-frame = tk.Frame(root, bg=COLORS['background'])
-frame.pack(fill="both", expand=True, padx=5, pady=(5,0))
-
-text = tk.Text(frame, wrap="word", bg=COLORS['background'], fg=COLORS['text'],
-               insertbackground=COLORS['cursor_insert_bg'], font=("Consolas", 11), borderwidth=0,
-               undo=True)
-text.pack(side="left", fill="both", expand=True, padx=5, pady=5)
-
-scrollbar = tk.Scrollbar(frame, command=text.yview, bg=COLORS['button_bg'], troughcolor=COLORS['background'],
-                         activebackground=COLORS['accent']) # Added activebackground
-scrollbar.pack(side="right", fill="y")
-text.config(yscrollcommand=scrollbar.set)
+notebook = ttk.Notebook(root)
+notebook.pack(fill="both", expand=True, padx=5, pady=(5,0))
 
 status_bar_text = tk.StringVar()
 status_bar = tk.Label(root, textvariable=status_bar_text, bd=1, relief=tk.SUNKEN, anchor=tk.W,
@@ -438,42 +579,157 @@ status_bar.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=(0,5))
 status_bar_text.set("Ready.")
 
 def gui_status_update(message):
-    status_bar_text.set(message)
-
-sys.stdout = TextRedirector(text) # Redirects print statements to the Text widget
-
-text.tag_configure("command", foreground=COLORS['accent'], font=("Consolas", 11, "bold"))
-text.tag_configure("output", foreground=COLORS['output_text']) # Using dedicated output color
-text.tag_configure("prompt", foreground=COLORS['prompt'], font=("Consolas", 11, "bold"))
-text.tag_configure("error", foreground=COLORS['error_fg'])
-
-def insert_prompt():
+    ui_events.post_status(message) # Safe from any thread; applied by the mainloop, throttled
+
+def create_tab(cwd=None):
+    # New tabs start in the active tab's directory, like a terminal's "new tab".
+    session = Session(cwd or (active_tab.session.cwd if active_tab else None),
+                      history=command_history)
+    session.log = SessionLog(LOG_DIR, label=str(session.id))
+    frame = tk.Frame(notebook, bg=COLORS['background'])
+    text = tk.Text(frame, wrap="word", bg=COLORS['background'], fg=COLORS['text'],
+                   insertbackground=COLORS['cursor_insert_bg'], font=("Consolas", 11), borderwidth=0,
+                   undo=True)
+    text.pack(side="left", fill="both", expand=True, padx=5, pady=5)
+    scrollbar = tk.Scrollbar(frame, command=text.yview, bg=COLORS['button_bg'], troughcolor=COLORS['background'],
+                             activebackground=COLORS['accent']) # Added activebackground
+    scrollbar.pack(side="right", fill="y")
+    text.config(yscrollcommand=scrollbar.set)
+    text.tag_configure("command", foreground=COLORS['accent'], font=("Consolas", 11, "bold"))
+    text.tag_configure("output", foreground=COLORS['output_text']) # Using dedicated output color
+    text.tag_configure("prompt", foreground=COLORS['prompt'], font=("Consolas", 11, "bold"))
+    text.tag_configure("error", foreground=COLORS['error_fg'])
+
+    tab = Tab(session, frame, text)
+    tabs[str(frame)] = tab
+    text.bind("<Key>", lambda event: on_key_press(tab, event))
+    text.bind("<Control-c>", lambda event: cancel_current_job(tab))
+    text.bind("<Control-t>", lambda event: open_new_tab())
+    text.bind("<Control-w>", lambda event: close_tab(tab))
+    text.bind("<Control-Tab>", lambda event: cycle_tabs(1))
+    for sequence in ["<Control-Shift-Tab>", "<Control-ISO_Left_Tab>"]:
+        try:
+            text.bind(sequence, lambda event: cycle_tabs(-1))
+        except tk.TclError:
+            pass # ISO_Left_Tab only exists on X11
+    notebook.add(frame, text=tab_title(session))
+    insert_prompt(tab)
+    select_tab(tab)
+    return tab
+
+def open_new_tab():
+    create_tab()
+    return "break"
+
+def close_tab(tab):
+    if len(tabs) == 1:
+        gui_status_update("This is the last tab; type 'exit' to quit.")
+        return "break"
+    if tab.current_job is not None:
+        tab.current_job.cancel() # Its result is dropped in finish_job
+    tab.closed = True
+    tab.pending_commands.clear()
+    del tabs[str(tab.frame)]
+    notebook.forget(tab.frame)
+    tab.frame.destroy()
+    engine.close_session(tab.session)
+    select_tab(tabs[notebook.select()])
+    return "break"
+
+def select_tab(tab):
+    global active_tab
+    active_tab = tab
+    notebook.select(tab.frame)
+    ui_events.set_target(tab.text) # print() output goes to the tab in front
+    tab.text.focus_set()
+
+def cycle_tabs(step):
+    pages = notebook.tabs()
+    index = (pages.index(notebook.select()) + step) % len(pages)
+    select_tab(tabs[pages[index]])
+    return "break"
+
+def on_tab_changed(event):
+    tab = tabs.get(notebook.select())
+    if tab is not None and tab is not active_tab: # Clicked on a tab
+        select_tab(tab)
+
+def tab_title(session):
+    return os.path.basename(session.cwd) or session.cwd
+
+notebook.bind("<<NotebookTabChanged>>", on_tab_changed)
+
+def insert_prompt(tab):
+    text = tab.text
     # Ensure the insert mark is at the end before inserting prompt, especially after clear
     text.mark_set(tk.INSERT, tk.END)
     text.see(tk.END)
-    try:
-        prompt_text = f"{os.getcwd()} $ "
-    except FileNotFoundError:
-        os.chdir(os.path.expanduser("~"))
-        prompt_text = f"{os.getcwd()} $ "
+    if tab.session.ensure_cwd():
         text.insert(tk.END, "Current directory was lost. Reverted to home.\n", "error")
+    prompt_text = f"{tab.session.cwd} $ "
 
     text.insert(tk.END, prompt_text, "prompt")
     text.mark_set("input_start", f"{tk.END}-1c") # Point right before the last char of prompt
     text.mark_gravity("input_start", "left")
     text.see(tk.END) # Scroll to prompt
+    notebook.tab(tab.frame, text=tab_title(tab.session)) # The directory may have changed
+
+ui_events.attach(root, None, status_bar_text, on_insert=on_text_inserted)
+create_tab()
+sys.stdout = TextRedirector(ui_events) # Redirects print statements to the active tab's Text widget
+
+def insert_above_prompt(string, tag="output"):
+    active_tab.text.insert("input_start linestart", string, tag)
 
-insert_prompt()
+def report_ai_not_configured():
+    insert_above_prompt("Gemini AI not configured. Check console (GEMINI_API_KEY).\n", "error")
+    gui_status_update("AI not ready. Check API key.")
 
-def start_voice_recognition_thread():
-    if not gemini_ready:
+def request_voice_command():
+    if intents_ready.is_set() and not engine.ai_ready:
         gui_status_update("Gemini AI not ready. Check API Key and console.")
-        text.insert("end", "Voice AI is not configured. Check console (GEMINI_API_KEY).\n", "error")
-        insert_prompt()
+        active_tab.text.insert("end", "Voice AI is not configured. Check console (GEMINI_API_KEY).\n", "error")
+        insert_prompt(active_tab)
         return
+    if voice_pipeline.submit("listen") is None:
+        gui_status_update("Voice queue is full. Wait for earlier commands to finish (Esc cancels them).")
+    elif voice_pipeline.pending() > 1:
+        gui_status_update(f"Queued voice command ({voice_pipeline.pending()} pending, Esc cancels).")
+    elif "voice_ready" not in startup.milestones:
+        gui_status_update("Voice is still warming up; your command will be heard as soon as it's ready.")
+
+def cancel_queued_voice_commands(event=None):
+    pending = voice_pipeline.pending()
+    voice_pipeline.cancel_all()
+    gui_status_update(f"Cancelled {pending} queued voice command(s).")
+
+# --- Continuous Listening ---
+# The capture service segments utterances itself; each one enters the pipeline at the recognize stage.
+def queue_continuous_audio(audio):
+    if voice_pipeline.submit(audio, stage="recognize") is None:
+        gui_status_update("Voice queue is full; an utterance was dropped.")
+
+def toggle_continuous_listening():
+    if not mic_ready.is_set():
+        gui_status_update("The microphone is still starting up. Try again in a moment.")
+        return
+    if capture_service.continuous:
+        capture_service.stop_continuous()
+        continuous_button.config(text="🔁 Continuous: Off")
+        voice_button.config(state=tk.NORMAL)
+        gui_status_update("Continuous listening stopped.")
+        return
+    if intents_ready.is_set() and not engine.ai_ready:
+        gui_status_update("Gemini AI not ready. Check API Key and console.")
+        return
+    try:
+        capture_service.start_continuous(queue_continuous_audio)
+    except Exception as e:
+        gui_status_update(f"Mic error: {e}")
+        return
+    continuous_button.config(text="🔁 Continuous: On")
     voice_button.config(state=tk.DISABLED)
-    gui_status_update("Initializing mic...")
-    root.after(100, lambda: threading.Thread(target=lambda: (recognize_voice(), voice_button.config(state=tk.NORMAL)), daemon=True).start())
+    gui_status_update("Continuous listening. Speak commands at any time.")
 
 
 style = ttk.Style()
@@ -490,11 +746,97 @@ style.map('TButton',
           background=[('active', COLORS['accent']), ('pressed', '#005f99')], # Darker accent on press
           foreground=[('active', '#FFFFFF'), ('pressed', '#FFFFFF')])
 
-voice_button = ttk.Button(root, text="🎤 Speak Command", command=start_voice_recognition_thread, style='TButton')
+voice_button = ttk.Button(root, text="🎤 Speak Command", command=request_voice_command, style='TButton')
 voice_button.pack(pady=10, fill=tk.X, padx=20)
 
-def on_key_press(event):
-    global history_index
+continuous_button = ttk.Button(root, text="🔁 Continuous: Off", command=toggle_continuous_listening, style='TButton')
+continuous_button.pack(pady=(0, 10), fill=tk.X, padx=20)
+
+def current_input(tab):
+    return tab.text.get("input_start", f"{tk.END}-1c")
+
+def replace_input(tab, new_input):
+    tab.text.delete("input_start", f"{tk.END}-1c")
+    tab.text.insert("input_start", new_input)
+    tab.text.mark_set(tk.INSERT, tk.END) # Move cursor to very end
+
+# --- Tab Completion ---
+# Completes the last word from the engine's directory cache, which `ls` shares. A cached directory is
+# answered on the spot (one stat); an uncached one is scanned on a background thread and the result
+# applied only if the line hasn't changed meanwhile, so a huge directory never freezes typing.
+def complete_input(tab):
+    line = current_input(tab)
+    result = engine.complete(line, scan=False, session=tab.session)
+    if result is None:
+        gui_status_update("Reading directory for completion...")
+        threading.Thread(target=lambda: ui_events.post_call(apply_completion, tab, line,
+                                                            engine.complete(line, session=tab.session)),
+                         daemon=True, name="complete").start()
+    else:
+        apply_completion(tab, line, result)
+
+def apply_completion(tab, line, result):
+    if tab.closed or tab.current_job is not None or current_input(tab) != line:
+        return # Typed on or started a command while the scan ran
+    new_line, candidates = result
+    if new_line != line:
+        replace_input(tab, new_line)
+    elif candidates:
+        tab.text.insert(tk.END, "\n" + "  ".join(candidates) + "\n", "output")
+        insert_prompt(tab)
+        tab.text.insert(tk.END, line)
+    gui_status_update("Ready.")
+
+def show_history_search(tab, failed=False):
+    search = tab.history_search
+    query, match = search["query"], current_input(tab) if search["seq"] else ""
+    gui_status_update(f"({'failed ' if failed else ''}reverse-i-search)`{query}': {match}    "
+                      f"[Ctrl+R older, Enter run, Esc cancel]")
+
+def search_history(tab, older=False):
+    search = tab.history_search
+    found = None
+    if search["query"]:
+        found = tab.session.history.find_substring(search["query"], before=search["seq"] if older else None)
+    if found:
+        search["seq"] = found[0]
+        replace_input(tab, found[1])
+    show_history_search(tab, failed=bool(search["query"]) and not found)
+
+def on_history_search_key(tab, event):
+    # Returns True when the key was consumed by the search; otherwise the search has ended with the
+    # match on the input line and the key is handled as usual (Enter runs it, arrows edit it).
+    search = tab.history_search
+    ctrl = event.state & 0x0004
+    if ctrl and event.keysym.lower() == "r":
+        search_history(tab, older=True)
+    elif event.keysym == "Escape" or (ctrl and event.keysym.lower() == "g"):
+        replace_input(tab, search["original"])
+        tab.history_search = None
+        gui_status_update("Ready.")
+    elif event.keysym == "BackSpace":
+        search["query"] = search["query"][:-1]
+        search_history(tab)
+    elif event.char and event.char.isprintable() and not ctrl:
+        search["query"] += event.char
+        search_history(tab)
+    elif event.keysym.endswith(("_L", "_R")): # Shift, Control, Alt on their own
+        pass
+    else:
+        tab.history_search = None
+        gui_status_update("Ready.")
+        return False
+    return True
+
+def on_key_press(tab, event):
+    text = tab.text
+    if tab.current_job is not None:
+        # The prompt returns when the job finishes; only scrolling and Ctrl shortcuts work meanwhile.
+        if event.keysym == "Return":
+            gui_status_update(f"'{tab.current_job.command}' is still running. Press Ctrl+C to cancel it.")
+        if event.keysym in ["Prior", "Next"] or event.state & 0x0004:
+            return None
+        return "break"
     current_cursor_pos = text.index(tk.INSERT)
     input_start_pos = text.index("input_start")
 
@@ -506,49 +848,57 @@ def on_key_press(event):
                      (event.state & 0x0004 and event.keysym.lower() == 'a') ): # Ctrl+C, Ctrl+A
             text.mark_set(tk.INSERT, input_start_pos)
 
+    if tab.history_search is not None and on_history_search_key(tab, event):
+        return "break"
+    if tab.pending_choice is not None and on_choice_key(tab, event):
+        return "break"
+    if event.state & 0x0004 and event.keysym.lower() == "r": # Ctrl+R: reverse search
+        tab.history_nav = None
+        tab.history_search = {"query": "", "seq": None, "original": current_input(tab)}
+        show_history_search(tab)
+        return "break"
+    if event.char: # Typing or deleting ends an Up/Down walk; the next Up uses the edited text
+        tab.history_nav = None
+
     if event.keysym == "Return":
         command_line_content = text.get("input_start", f"{tk.END}-1c") # Get text from prompt start to current end
         if command_line_content.strip() == "exit": # Handle exit command
-            root.quit()
+            if len(tabs) > 1:
+                close_tab(tab) # Like a terminal: exit closes the tab, the last one closes the window
+            else:
+                root.quit()
         elif command_line_content.strip(): # If there is a command
             text.insert(tk.END, "\n") # Move to next line for output
-            run_command(command_line_content.strip()) # Execute it
+            run_command(tab, command_line_content.strip()) # Execute it
         else: # Empty command, just show new prompt
             text.insert(tk.END, "\n")
-            insert_prompt()
+            insert_prompt(tab)
         return "break" 
     
+    elif event.keysym == "Tab":
+        complete_input(tab)
+        return "break"
+
     elif event.keysym == "Up":
-        if command_history:
-            if history_index > 0:
-                history_index -= 1
-            current_input_end = f"{tk.END}-1c"
-            if text.compare("input_start", "<", current_input_end): # if there is text after prompt
-                 text.delete("input_start", current_input_end)
-            elif text.index("input_start") == text.index(current_input_end): # if prompt is end-1c, meaning input start IS the end.
-                 pass # Nothing to delete if input area is empty
-
-            text.insert("input_start", command_history[history_index])
-            text.mark_set(tk.INSERT, tk.END) # Move cursor to very end
+        nav = tab.history_nav
+        if nav is None:
+            nav = tab.history_nav = {"prefix": current_input(tab), "seq": None, "typed": current_input(tab)}
+        found = tab.session.history.find_prefix(nav["prefix"], before=nav["seq"])
+        if found:
+            nav["seq"] = found[0]
+            replace_input(tab, found[1])
         return "break"
 
     elif event.keysym == "Down":
-        if command_history:
-            current_input_end = f"{tk.END}-1c"
-            if history_index < len(command_history) -1 :
-                history_index += 1
-                if text.compare("input_start", "<", current_input_end):
-                     text.delete("input_start", current_input_end)
-                elif text.index("input_start") == text.index(current_input_end):
-                     pass
-                text.insert("input_start", command_history[history_index])
-            elif history_index == len(command_history) - 1: # At last item, next is blank
-                history_index +=1
-                if text.compare("input_start", "<", current_input_end):
-                     text.delete("input_start", current_input_end)
-                elif text.index("input_start") == text.index(current_input_end):
-                     pass
-            text.mark_set(tk.INSERT, tk.END)
+        nav = tab.history_nav
+        if nav is not None and nav["seq"] is not None:
+            found = tab.session.history.find_prefix(nav["prefix"], after=nav["seq"])
+            if found:
+                nav["seq"] = found[0]
+                replace_input(tab, found[1])
+            else: # Past the newest match: back to what was typed
+                nav["seq"] = None
+                replace_input(tab, nav["typed"])
         return "break"
 
     elif event.keysym == "Backspace":
@@ -566,12 +916,39 @@ def on_key_press(event):
         text.mark_set(tk.INSERT, "input_start")
         return "break"
 
-text.bind("<Key>", on_key_press)
-text.focus_set()
+root.bind("<Escape>", cancel_queued_voice_commands)
+
+startup.record("window", window_started, startup.elapsed() - window_started)
+
+# --- Startup ---
+# The first mainloop callback marks the prompt as usable and only then starts the warm-up threads.
+# With --profile-startup a voice command (--profile-say, entering at the intent stage once the mic
+# and ASR are up) runs right away, and the per-phase report is printed when it finishes.
+def on_first_prompt():
+    startup.mark("first_prompt")
+    start_warm_up()
+    if args.profile_startup:
+        threading.Thread(target=submit_profile_command, daemon=True).start()
 
-if not gemini_ready:
-    initial_msg = "Gemini AI not configured. Check console (GEMINI_API_KEY).\n"
-    text.insert("1.0", initial_msg, "error")
-    status_bar_text.set("AI not ready. Check API key.")
+def submit_profile_command():
+    mic_ready.wait()
+    asr_ready.wait()
+    voice_pipeline.submit(args.profile_say.lower(), stage="intent")
 
-root.mainloop()
\ No newline at end of file
+def finish_startup_profile():
+    if not args.profile_startup:
+        return
+    if "voice_ready" not in startup.milestones: # A command can finish before the last warm-up thread
+        root.after(50, finish_startup_profile)
+        return
+    sys.__stdout__.write(startup.describe() + "\n")
+    if args.profile_output:
+        with open(args.profile_output, "w", encoding="utf-8") as f:
+            json.dump(startup.to_dict(), f, indent=2)
+    root.destroy()
+
+root.after(0, on_first_prompt)
+root.mainloop()
+for tab in list(tabs.values()):
+    engine.close_session(tab.session)
+engine.close()
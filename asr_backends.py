@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import threading
+
+import speech_recognition as sr
+
+
+# --- ASR backend interface ---
+# Every backend takes an sr.AudioData and returns the transcript. Failures are reported with the
+# same exceptions recognize_google uses (sr.UnknownValueError / sr.RequestError) so callers
+# handle all engines the same way.
+class ASRBackend:
+    name = "base"
+    sample_rate = None  # Rate the engine works at; None keeps the captured rate
+
+    def __init__(self):
+        self.latencies = []  # Seconds per recognize() call, for comparing engines
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        pass  # Backends with a model load it here, once
+
+    def recognize(self, audio):
+        start = time.perf_counter()
+        try:
+            return self._recognize(audio)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+
+    def _recognize(self, audio):
+        raise NotImplementedError
+
+    def describe(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return f"ASR backend '{self.name}': no utterances recognized yet."
+        mean_ms = sum(latencies) / len(latencies) * 1000
+        p50_ms = latencies[len(latencies) // 2] * 1000
+        return (f"ASR backend '{self.name}': {len(latencies)} utterances, mean {mean_ms:.0f} ms, "
+                f"p50 {p50_ms:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+
+
+class GoogleASRBackend(ASRBackend):
+    name = "google"
+    sample_rate = 16000
+
+    def __init__(self):
+        super().__init__()
+        self.recognizer = sr.Recognizer()
+
+    def _recognize(self, audio):
+        return self.recognizer.recognize_google(audio)
+
+
+class VoskASRBackend(ASRBackend):
+    name = "vosk"
+    sample_rate = 16000
+
+    def __init__(self, model_path):
+        super().__init__()
+        self.model_path = model_path
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def warm_up(self):
+        with self._model_lock:
+            if self._model is not None:
+                return
+            try:
+                import vosk
+            except ImportError:
+                raise RuntimeError("The 'vosk' package is not installed (pip install vosk).")
+            if not self.model_path or not os.path.isdir(self.model_path):
+                raise RuntimeError(f"Vosk model directory not found: '{self.model_path}'. "
+                                   "Set VOICEOS_VOSK_MODEL to an unpacked model from alphacephei.com/vosk/models.")
+            vosk.SetLogLevel(-1)
+            self._vosk = vosk
+            self._model = vosk.Model(self.model_path)
+
+    def _recognize(self, audio):
+        self.warm_up()
+        # A recognizer is cheap to create; the model behind it stays loaded between calls.
+        recognizer = self._vosk.KaldiRecognizer(self._model, self.sample_rate)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        transcript = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        if not transcript:
+            raise sr.UnknownValueError()
+        return transcript
+
+
+class WhisperASRBackend(ASRBackend):
+    name = "whisper"
+    sample_rate = 16000
+
+    def __init__(self, model_name="base.en", device="cpu", compute_type="int8"):
+        super().__init__()
+        self.model_name = model_name
+        self.device = device
+        self.compute_type = compute_type
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def warm_up(self):
+        with self._model_lock:
+            if self._model is not None:
+                return
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError:
+                raise RuntimeError("The 'faster-whisper' package is not installed (pip install faster-whisper).")
+            self._model = WhisperModel(self.model_name, device=self.device, compute_type=self.compute_type)
+
+    def _recognize(self, audio):
+        import numpy as np
+
+        self.warm_up()
+        raw = audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2)
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+        segments, _ = self._model.transcribe(samples, language="en", beam_size=1)
+        transcript = " ".join(segment.text.strip() for segment in segments).strip()
+        if not transcript:
+            raise sr.UnknownValueError()
+        return transcript
+
+
+class FileStubASRBackend(ASRBackend):
+    # Deterministic backend for tests and benchmarks: returns the lines of a text file in order,
+    # one per utterance, starting over at the end. A blank line simulates unintelligible audio.
+    name = "stub"
+
+    def __init__(self, transcript_path):
+        super().__init__()
+        self.transcript_path = transcript_path
+        self._lines = None
+        self._position = 0
+
+    def warm_up(self):
+        if self._lines is not None:
+            return
+        try:
+            with open(self.transcript_path, "r", encoding="utf-8") as f:
+                self._lines = [line.rstrip("\n") for line in f]
+        except (OSError, TypeError) as e:
+            raise RuntimeError(f"Could not read stub transcript file '{self.transcript_path}': {e}")
+        if not self._lines:
+            raise RuntimeError(f"Stub transcript file '{self.transcript_path}' is empty.")
+
+    def _recognize(self, audio):
+        self.warm_up()
+        with self._lock:
+            line = self._lines[self._position % len(self._lines)]
+            self._position += 1
+        if not line.strip():
+            raise sr.UnknownValueError()
+        return line
+
+
+ASR_BACKENDS = {
+    "google": lambda: GoogleASRBackend(),
+    "vosk": lambda: VoskASRBackend(os.getenv("VOICEOS_VOSK_MODEL", "")),
+    "whisper": lambda: WhisperASRBackend(os.getenv("VOICEOS_WHISPER_MODEL", "base.en")),
+    "stub": lambda: FileStubASRBackend(os.getenv("VOICEOS_ASR_STUB_FILE", "")),
+}
+
+
+def create_asr_backend(name=None):
+    name = (name or os.getenv("VOICEOS_ASR_BACKEND", "google")).strip().lower()
+    if name not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend '{name}'. Choose one of: {', '.join(ASR_BACKENDS)}")
+    return ASR_BACKENDS[name]()
+
+
+def load_asr_backend(name=None):
+    # create_asr_backend() with its model loaded, falling back to Google speech recognition when
+    # the configured engine is unknown or its model can't be loaded.
+    try:
+        backend = create_asr_backend(name)
+    except ValueError as e:
+        print(f"Error: {e}. Falling back to Google speech recognition.")
+        return GoogleASRBackend()
+    try:
+        backend.warm_up() # Local models are loaded once, here
+    except RuntimeError as e:
+        print(f"Error loading ASR backend '{backend.name}': {e} Falling back to Google speech recognition.")
+        backend = GoogleASRBackend()
+    return backend
+
+
+def compare_backends(names, wav_paths):
+    # Recognizes the same WAV files with each backend and reports per-utterance latency.
+    clips = []
+    for path in wav_paths:
+        with sr.AudioFile(path) as source:
+            clips.append((path, sr.Recognizer().record(source)))
+    for name in names:
+        backend = create_asr_backend(name)
+        load_start = time.perf_counter()
+        try:
+            backend.warm_up()
+        except RuntimeError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+        print(f"{name}: model ready in {(time.perf_counter() - load_start) * 1000:.0f} ms")
+        for path, audio in clips:
+            try:
+                transcript = backend.recognize(audio)
+            except sr.UnknownValueError:
+                transcript = "<not understood>"
+            except sr.RequestError as e:
+                transcript = f"<request error: {e}>"
+            print(f"  {os.path.basename(path)}: {backend.latencies[-1] * 1000:.0f} ms  {transcript!r}")
+        print(f"  {backend.describe()}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python asr_backends.py BACKEND[,BACKEND...] FILE.wav [FILE.wav ...]")
+        sys.exit(1)
+    compare_backends(sys.argv[1].split(","), sys.argv[2:])
@@ -0,0 +1,168 @@
+import time
+import threading
+from collections import deque
+
+import numpy as np
+import speech_recognition as sr
+
+
+def chunk_energy(chunk):
+    samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+
+# --- Long-lived microphone capture ---
+# The microphone is opened once and read continuously on a background thread. Recent audio is
+# kept in a ring buffer so an utterance that starts just before "Speak Command" is pressed is not
+# clipped, and the ambient noise level is tracked continuously instead of recalibrated per press.
+class CaptureService:
+    def __init__(self, device_index=None, sample_rate=16000, chunk_size=1024, preroll_seconds=1.0,
+                 pause_seconds=0.8, min_phrase_seconds=0.3, energy_ratio=1.5, min_energy_threshold=300.0):
+        self.device_index = device_index
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.sample_width = 2
+        self.pause_seconds = pause_seconds
+        self.min_phrase_seconds = min_phrase_seconds
+        self.energy_ratio = energy_ratio  # Speech must be this many times louder than the ambient level
+        self.min_energy_threshold = min_energy_threshold
+        self.phrase_time_limit = 12.0
+        self.ambient_energy = min_energy_threshold / energy_ratio
+        self.error = None
+
+        chunk_seconds = chunk_size / sample_rate
+        self._chunk_seconds = chunk_seconds
+        self._ring = deque(maxlen=max(1, int(preroll_seconds / chunk_seconds)))
+        self._segment = None        # Chunks of the utterance in progress, or None while silent
+        self._silent_chunks = 0
+        self._armed = False         # A listen() call is waiting for the next utterance
+        self._continuous_callback = None
+        self._utterance = None
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._source = None
+        self._start_lock = threading.Lock() # The warm-up thread and a voice request may both start it
+
+    @property
+    def energy_threshold(self):
+        return max(self.min_energy_threshold, self.ambient_energy * self.energy_ratio)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._start_lock:
+            if self.running: # Checked again under the lock: only one caller opens the stream
+                return
+            self._stop_event.clear()
+            self.error = None
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+            self._thread.start()
+            ready.wait()
+            if self.error:
+                raise self.error
+
+    def stop(self):
+        with self._start_lock:
+            self._stop_event.set()
+            if self._thread:
+                self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self, ready):
+        try:
+            self._source = sr.Microphone(device_index=self.device_index, sample_rate=self.sample_rate,
+                                         chunk_size=self.chunk_size)
+            self._source.__enter__()
+            self.sample_width = self._source.SAMPLE_WIDTH
+        except Exception as e:
+            self.error = e
+            ready.set()
+            return
+        ready.set()
+        try:
+            while not self._stop_event.is_set():
+                chunk = self._source.stream.read(self.chunk_size)
+                self._process_chunk(chunk)
+        except Exception as e:
+            self.error = e
+            with self._condition:
+                self._condition.notify_all()
+        finally:
+            self._source.__exit__(None, None, None)
+            self._source = None
+
+    def _process_chunk(self, chunk):
+        energy = chunk_energy(chunk)
+        with self._condition:
+            if self._segment is None:
+                if energy > self.energy_threshold:
+                    # Speech onset: the segment starts with the pre-roll so the first syllable survives.
+                    self._segment = list(self._ring)
+                    self._segment.append(chunk)
+                    self._silent_chunks = 0
+                else:
+                    # Incremental ambient recalibration while nobody is speaking.
+                    self.ambient_energy = 0.95 * self.ambient_energy + 0.05 * energy
+                self._ring.append(chunk)
+                return
+
+            self._segment.append(chunk)
+            self._ring.append(chunk)
+            self._silent_chunks = self._silent_chunks + 1 if energy <= self.energy_threshold else 0
+            segment_seconds = len(self._segment) * self._chunk_seconds
+            if self._silent_chunks * self._chunk_seconds >= self.pause_seconds or \
+                    segment_seconds >= self.phrase_time_limit:
+                segment, self._segment = self._segment, None
+                speech_seconds = segment_seconds - self._silent_chunks * self._chunk_seconds
+                if speech_seconds >= self.min_phrase_seconds:
+                    self._deliver(sr.AudioData(b"".join(segment), self.sample_rate, self.sample_width))
+
+    def _deliver(self, audio):
+        # Called with the condition held.
+        if self._armed:
+            self._utterance = audio
+            self._armed = False
+            self._condition.notify_all()
+        elif self._continuous_callback:
+            self._continuous_callback(audio)
+
+    def listen(self, timeout=7, phrase_time_limit=12):
+        # Returns the next utterance; an utterance already in progress (or just begun in the
+        # pre-roll window) is returned whole.
+        if not self.running:
+            self.start()
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self.phrase_time_limit = phrase_time_limit
+            self._armed = True
+            self._utterance = None
+            while self._utterance is None:
+                if self.error:
+                    self._armed = False
+                    raise self.error
+                remaining = deadline - time.monotonic()
+                if self._segment is None and remaining <= 0:
+                    self._armed = False
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                self._condition.wait(timeout=max(remaining, 0.05))
+            audio, self._utterance = self._utterance, None
+            return audio
+
+    # --- Continuous mode: every detected utterance is passed to the callback ---
+    # The callback runs on the capture thread, so it should only queue the audio and return.
+    def start_continuous(self, callback):
+        with self._condition:
+            self._continuous_callback = callback
+        self.start()
+
+    def stop_continuous(self):
+        with self._condition:
+            self._continuous_callback = None
+
+    @property
+    def continuous(self):
+        return self._continuous_callback is not None
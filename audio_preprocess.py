@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+import speech_recognition as sr
+
+
+def lowpass_taps(cutoff, n_taps):
+    # Windowed-sinc low-pass FIR: cutoff in cycles per sample (< 0.5), Blackman window, unity DC gain.
+    n = np.arange(n_taps) - (n_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.blackman(n_taps)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+# --- Voice activity detection and silence trimming ---
+# Runs between capture and ASR: finds the speech region with a frame-energy VAD, trims the
+# silence around it, gates the noise inside it, downmixes and resamples to the rate the ASR
+# backend wants. Smaller clips upload and decode faster for both remote and local engines.
+class AudioPreprocessor:
+    def __init__(self, frame_seconds=0.02, energy_ratio=2.5, min_energy=150.0, hangover_seconds=0.2,
+                 padding_seconds=0.15, gate_gain=0.1):
+        self.frame_seconds = frame_seconds
+        self.energy_ratio = energy_ratio      # Speech frames are this many times louder than the noise floor
+        self.min_energy = min_energy
+        self.hangover_seconds = hangover_seconds  # Short dips inside a word still count as speech
+        self.padding_seconds = padding_seconds    # Kept around the speech so word edges aren't cut
+        self.gate_gain = gate_gain
+        self.utterances = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+        self._lock = threading.Lock()
+
+    def speech_mask(self, samples, sample_rate):
+        frame_length = max(1, int(sample_rate * self.frame_seconds))
+        n_frames = len(samples) // frame_length
+        if n_frames == 0:
+            return np.zeros(0, dtype=bool), frame_length
+        frames = samples[:n_frames * frame_length].reshape(n_frames, frame_length)
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        noise_floor = np.percentile(energy, 10)
+        mask = energy > max(self.min_energy, noise_floor * self.energy_ratio)
+        hangover = int(self.hangover_seconds / self.frame_seconds)
+        if hangover and mask.any():
+            mask = np.convolve(mask, np.ones(2 * hangover + 1), mode="same") > 0
+        return mask, frame_length
+
+    def process(self, audio, target_rate=None, channels=1):
+        # Returns (AudioData or None if there is no speech, stats dict).
+        raw = audio.get_raw_data(convert_width=2)
+        sample_rate = audio.sample_rate
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32)
+        if channels > 1:
+            samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+        input_seconds = len(samples) / sample_rate
+
+        mask, frame_length = self.speech_mask(samples, sample_rate)
+        speech_frames = np.flatnonzero(mask)
+        if speech_frames.size == 0:
+            stats = self._record(len(audio.frame_data), 0, input_seconds, 0.0)
+            return None, stats
+
+        padding = int(self.padding_seconds * sample_rate)
+        start = max(0, speech_frames[0] * frame_length - padding)
+        end = min(len(samples), (speech_frames[-1] + 1) * frame_length + padding)
+
+        # Noise gate: attenuate the non-speech frames left between words.
+        gains = np.where(mask, 1.0, self.gate_gain).astype(np.float32)
+        gain_per_sample = np.repeat(gains, frame_length)
+        gain_per_sample = np.concatenate(
+            [gain_per_sample, np.full(len(samples) - len(gain_per_sample), self.gate_gain, dtype=np.float32)])
+        trimmed = samples[start:end] * gain_per_sample[start:end]
+
+        output_rate = sample_rate
+        if target_rate and target_rate != sample_rate:
+            if target_rate < sample_rate and len(trimmed):
+                # Anti-aliasing: interpolation alone would fold everything above the new Nyquist
+                # (8 kHz for 16 kHz) back into the speech band. Cutoff at 0.45 of the new rate, so
+                # the transition band ends about at its Nyquist.
+                ratio = sample_rate / target_rate
+                trimmed = np.convolve(trimmed, lowpass_taps(0.45 / ratio, int(64 * ratio) | 1), mode="same")
+            output_length = int(round(len(trimmed) * target_rate / sample_rate))
+            positions = np.linspace(0, len(trimmed) - 1, num=output_length) if output_length else np.zeros(0)
+            trimmed = np.interp(positions, np.arange(len(trimmed)), trimmed)
+            output_rate = target_rate
+
+        output = np.clip(trimmed, -32768, 32767).astype(np.int16).tobytes()
+        stats = self._record(len(audio.frame_data), len(output), input_seconds, len(trimmed) / output_rate)
+        return sr.AudioData(output, output_rate, 2), stats
+
+    def _record(self, input_bytes, output_bytes, input_seconds, output_seconds):
+        stats = {"bytes_saved": input_bytes - output_bytes, "seconds_saved": input_seconds - output_seconds,
+                 "input_seconds": input_seconds, "output_seconds": output_seconds}
+        with self._lock:
+            self.utterances += 1
+            self.bytes_saved += stats["bytes_saved"]
+            self.seconds_saved += stats["seconds_saved"]
+        return stats
+
+    def describe(self):
+        with self._lock:
+            return (f"Audio preprocessing: {self.utterances} utterances, {self.seconds_saved:.1f} s of audio and "
+                    f"{self.bytes_saved / 1024:.0f} KB trimmed before recognition")
@@ -0,0 +1,164 @@
+# Load-tests the VoiceOS daemon: many clients on one machine, each with its own connection and
+# session, send a mix of typed commands, spoken text and audio, and throughput and per-method
+# latency are reported for each number of clients.
+#
+#   python benchmarks/bench_daemon.py [--clients 1,4,16,64] [--requests 50] [--workers 8]
+#                                     [--max-pending 64] [--llm-latency 0.2] [--audio-seconds 1]
+#                                     [--warm]
+#
+# The daemon runs as a subprocess with the stub ASR backend, the fake LLM server and a scratch
+# VOICEOS_HOME; every client works in its own scratch directory. Each number of clients gets a
+# fresh daemon and VOICEOS_HOME, so every round starts with a cold intent cache and classifier
+# instead of answering from what the previous rounds taught it. --warm repeats each round on the
+# same daemon and reports it separately.
+import os
+import sys
+import time
+import shutil
+import base64
+import argparse
+import tempfile
+import threading
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from fake_llm_server import FakeLLMServer
+from daemon_client import DaemonClient, DaemonError
+
+COMMANDS = ["mkdir d{n}", "cd d{n}", "touch notes.txt", "ls", "cd ..", "pwd"]
+PHRASES = ["list the files", "where am i", "make a folder called reports", "go to reports", "go up a folder"]
+TRANSCRIPTS = ["list the files", "where am i", "create a file called todo dot txt"]
+MIX = ["execute", "execute", "execute", "say", "voice"] # Repeated by every client
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def start_daemon(env, socket_path, args):
+    process = subprocess.Popen([sys.executable, os.path.join(REPO, "voiceosd.py"), "--socket", socket_path,
+                                "--workers", str(args.workers), "--max-pending", str(args.max_pending)],
+                               env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            client = DaemonClient(socket_path).connect()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("The daemon did not start.")
+            time.sleep(0.05)
+    client.call("ping", {"wait": True}) # Intent side loaded
+    return process, client
+
+
+def run_client(socket_path, work_dir, requests, audio, results):
+    client = DaemonClient(socket_path).connect()
+    session = client.call("session.open", {"cwd": work_dir})["session"]
+    for i in range(requests):
+        method = MIX[i % len(MIX)]
+        if method == "execute":
+            params = {"command": COMMANDS[i % len(COMMANDS)].format(n=i), "session": session}
+        elif method == "say":
+            params = {"text": PHRASES[i % len(PHRASES)], "session": session}
+        else:
+            params = dict(audio, session=session)
+        start = time.perf_counter()
+        try:
+            client.call(method, params)
+            ok = True
+        except DaemonError:
+            ok = False # Unintelligible audio and the like are answers too, but counted
+        results.append((method, time.perf_counter() - start, ok))
+    client.close()
+
+
+def run(socket_path, work_dir, clients, requests, audio, label):
+    results = [] # (method, seconds, ok); list.append is atomic
+    threads = []
+    for c in range(clients):
+        client_dir = os.path.join(work_dir, f"{label}-{c}")
+        os.makedirs(client_dir)
+        threads.append(threading.Thread(target=run_client, args=(socket_path, client_dir, requests, audio, results)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    errors = sum(not ok for _, _, ok in results)
+    print(f"{clients:>4} clients {label}  {len(results):6d} requests in {wall:6.2f} s  {len(results) / wall:8.1f} req/s  "
+          f"errors {errors}")
+    for method in sorted(set(MIX)):
+        latencies = sorted(seconds for name, seconds, _ in results if name == method)
+        print(f"      {method:<10} p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+              f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+              f"({len(latencies)})")
+
+
+def run_round(env, work_dir, clients, args, audio, server):
+    # One fresh daemon and VOICEOS_HOME per number of clients: nothing is cached from earlier rounds.
+    round_dir = os.path.join(work_dir, f"round-{clients}")
+    socket_path = os.path.join(round_dir, "daemon.sock")
+    os.makedirs(round_dir)
+    process, control = start_daemon(dict(env, VOICEOS_HOME=os.path.join(round_dir, "home")), socket_path, args)
+    try:
+        llm_requests = server.requests
+        run(socket_path, os.path.join(round_dir, "clients"), clients, args.requests, audio, "cold")
+        if args.warm:
+            run(socket_path, os.path.join(round_dir, "clients"), clients, args.requests, audio, "warm")
+        stats = control.call("stats")
+        counters = stats["counters"]
+        print(f"      daemon side: intent cache hits {counters.get('intent_cache_hits', 0)}, misses "
+              f"{counters.get('intent_cache_misses', 0)}; fake LLM requests {server.requests - llm_requests}")
+        for name, summary in stats["stages"].items():
+            if name.startswith("daemon."):
+                print(f"      {name:<20} p50 {summary['p50_ms']:7.1f} ms  p95 {summary['p95_ms']:7.1f} ms  "
+                      f"p99 {summary['p99_ms']:7.1f} ms  ({summary['count']})")
+        control.call("shutdown")
+        process.wait(timeout=10)
+    finally:
+        control.close()
+        if process.poll() is None:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure VoiceOS daemon throughput with many concurrent clients.")
+    parser.add_argument("--clients", default="1,4,16,64", help="Comma-separated numbers of concurrent clients")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per client")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM response delay in seconds")
+    parser.add_argument("--audio-seconds", type=float, default=1.0, help="Length of the audio sent with 'voice'")
+    parser.add_argument("--warm", action="store_true", help="Repeat each round on the same daemon, caches warm")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(("127.0.0.1", 0), latency=args.llm_latency, jitter=0.0)
+    server.start()
+    work_dir = tempfile.mkdtemp(prefix="voiceos-daemon-")
+    env = dict(os.environ, VOICEOS_LLM_URL=server.url,
+               VOICEOS_ASR_BACKEND="stub", VOICEOS_ASR_STUB_FILE=os.path.join(work_dir, "transcripts.txt"),
+               VOICEOS_VAD="0", VOICEOS_TRASH="0")
+    with open(env["VOICEOS_ASR_STUB_FILE"], "w", encoding="utf-8") as f:
+        f.write("\n".join(TRANSCRIPTS) + "\n")
+    # Silence of the given length as 16 kHz, 16-bit PCM: the stub ignores it, but it is sent and decoded.
+    audio = {"audio": base64.b64encode(bytes(int(16000 * args.audio_seconds) * 2)).decode("ascii"),
+             "sample_rate": 16000, "sample_width": 2}
+
+    print(f"Daemon: {args.workers} workers, {args.max_pending} requests in flight at most; fake LLM latency "
+          f"{args.llm_latency:.2f}s; {args.requests} requests per client, mix {'/'.join(MIX)}")
+    try:
+        for clients in [int(n) for n in args.clients.split(",") if n.strip()]:
+            run_round(env, work_dir, clients, args, audio, server)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Load-tests the intent client against the local fake LLM server and compares policies:
+# a single attempt with no deadline handling, retries, and retries plus hedging.
+#
+#   python benchmarks/bench_intent_client.py [--requests 200] [--concurrency 8] [--latency 0.2]
+#                                            [--error-rate 0.05] [--slow-rate 0.05] [--slow-seconds 3]
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_llm_server import FakeLLMServer
+from intent_client import IntentClient, HTTPTransport, CircuitBreaker
+
+PHRASES = ["list the files", "where am i", "go to documents", "make a folder called reports",
+           "create a file notes dot txt", "delete the file old dot log", "clear the screen"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def run(label, client, requests, concurrency):
+    latencies = []
+    failures = 0
+
+    def one(i):
+        prompt = f'User speech: "{PHRASES[i % len(PHRASES)]}"\nJSON Response:'
+        start = time.perf_counter()
+        try:
+            client.generate(prompt)
+            return time.perf_counter() - start, True
+        except Exception:
+            return time.perf_counter() - start, False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for elapsed, ok in executor.map(one, range(requests)):
+            latencies.append(elapsed)
+            failures += not ok
+    wall = time.perf_counter() - start
+    latencies.sort()
+    s = client.stats()
+    print(f"{label:<26} p50 {percentile(latencies, 50) * 1000:7.0f} ms  p95 {percentile(latencies, 95) * 1000:7.0f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.0f} ms  failed {failures:4d}/{requests}  "
+          f"retries {s['retries']:4d}  hedges {s['hedges']:4d}  {requests / wall:6.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark intent client policies against a fake LLM.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(("127.0.0.1", 0), args.latency, args.jitter, args.error_rate, args.slow_rate,
+                           args.slow_seconds, seed=0)
+    server.start()
+    print(f"Fake LLM: latency {args.latency}s +/- {args.jitter}s, {args.error_rate:.0%} errors, "
+          f"{args.slow_rate:.0%} stalls of {args.slow_seconds}s; {args.requests} requests, "
+          f"concurrency {args.concurrency}")
+    # The breaker is effectively disabled so every policy sees the same request stream.
+    policies = [
+        ("single attempt", dict(max_retries=0, attempt_timeout=args.slow_seconds + 5, deadline=args.slow_seconds + 5)),
+        ("retries + deadline", dict(max_retries=2, attempt_timeout=1.0, deadline=4.0)),
+        ("retries + hedge", dict(max_retries=2, attempt_timeout=1.0, deadline=4.0,
+                                 hedge_after=args.latency * 2)),
+    ]
+    try:
+        for label, options in policies:
+            client = IntentClient(HTTPTransport(server.url), breaker=CircuitBreaker(failure_threshold=10 ** 9),
+                                  max_workers=args.concurrency * 3, **options)
+            run(label, client, args.requests, args.concurrency)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
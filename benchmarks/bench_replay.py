@@ -0,0 +1,139 @@
+# Replays a corpus of utterances through the headless ShellEngine with stubbed ASR and LLM
+# backends and reports commands/sec, end-to-end latency percentiles and intent accuracy.
+#
+#   python benchmarks/bench_replay.py [--corpus benchmarks/corpus/intents.jsonl] [--repeat 5]
+#                                     [--llm-latency 0.3] [--llm-error-rate 0.0] [--no-local]
+#                                     [--cache] [--asr whisper --wav-dir clips/] [--no-execute]
+#
+# Corpus lines are JSON: {"text": "...", "expected": [{"command": ..., "argument": ...}], "wav": "x.wav"}.
+# "wav" is optional and only used with --asr other than stub.
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import speech_recognition as sr
+
+from asr_backends import FileStubASRBackend, create_asr_backend
+from fake_llm_server import FakeLLMTransport
+from intent_cache import IntentCache
+from intent_classifier import LocalIntentClassifier, LocalIntentEngine
+from intent_client import IntentClient, HTTPTransport
+from metrics import Metrics, LatencyHistogram
+from shell_engine import ShellEngine, format_commands
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "intents.jsonl")
+
+
+def load_corpus(path):
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    return entries
+
+
+def build_engine(args, work_dir):
+    if args.llm_url:
+        transport = HTTPTransport(args.llm_url)
+    else:
+        transport = FakeLLMTransport(args.llm_latency, args.llm_jitter, args.llm_error_rate, seed=0)
+    client = IntentClient(transport, deadline=args.deadline, attempt_timeout=args.deadline / 2)
+    cache = IntentCache(os.path.join(work_dir, "intent_cache.json")) if args.cache else None
+    local = None if args.no_local else LocalIntentEngine(LocalIntentClassifier(), audit_rate=0.0)
+    return ShellEngine(intent_cache=cache, local_intent_engine=local, intent_client=client, metrics=Metrics())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay transcripts through the shell engine.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus")
+    parser.add_argument("--asr", default="stub", help="ASR backend; anything but stub needs --wav-dir")
+    parser.add_argument("--wav-dir", default=None, help="Directory the corpus 'wav' paths are relative to")
+    parser.add_argument("--llm-url", default=None, help="Use a running fake_llm_server.py instead of the in-process stub")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--deadline", type=float, default=8.0)
+    parser.add_argument("--no-local", action="store_true", help="Send every utterance to the LLM stub")
+    parser.add_argument("--cache", action="store_true", help="Enable the intent cache (repeats become hits)")
+    parser.add_argument("--no-execute", action="store_true", help="Only resolve intents, don't run commands")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    work_dir = tempfile.mkdtemp(prefix="voiceos-replay-")
+    scratch = os.path.join(work_dir, "scratch")
+    os.makedirs(scratch)
+
+    if args.asr == "stub":
+        transcript_path = os.path.join(work_dir, "transcripts.txt")
+        with open(transcript_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(entry["text"] for entry in corpus) + "\n")
+        asr = FileStubASRBackend(transcript_path)
+    else:
+        if not args.wav_dir:
+            parser.error("--asr other than stub needs --wav-dir")
+        asr = create_asr_backend(args.asr)
+    asr.warm_up()
+
+    engine = build_engine(args, work_dir)
+    end_to_end = LatencyHistogram()
+    utterances = correct = commands_right = commands_run = 0
+    wall_start = time.perf_counter()
+    for _ in range(args.repeat):
+        for entry in corpus:
+            audio = None
+            if args.asr != "stub":
+                if "wav" not in entry:
+                    continue
+                with sr.AudioFile(os.path.join(args.wav_dir, entry["wav"])) as source:
+                    audio = sr.Recognizer().record(source)
+
+            start = time.perf_counter()
+            try:
+                with engine.metrics.timer("asr"):
+                    transcript = asr.recognize(audio).lower()
+            except (sr.UnknownValueError, sr.RequestError):
+                transcript = ""
+            full_commands, error, _ = engine.interpret(transcript) if transcript else ([], "no speech", None)
+
+            engine.session.cwd = scratch # Every utterance starts in the scratch directory
+            if not args.no_execute:
+                for command in full_commands:
+                    commands_run += 1
+                    if not engine.execute(command).ok:
+                        break # Stop-on-error, as for a spoken batch
+            end_to_end.record(time.perf_counter() - start)
+
+            utterances += 1
+            expected = entry["expected"]
+            if [c["command"] for c in expected] == ["unknown"]:
+                hit = error is not None and not full_commands
+                commands_hit = hit
+            else:
+                hit = full_commands == format_commands(expected)
+                commands_hit = [c.split(" '")[0].split(" ")[0] for c in full_commands] == \
+                    [c["command"].split(" ")[0] for c in expected]
+            correct += hit
+            commands_right += commands_hit
+    wall = time.perf_counter() - wall_start
+
+    s = end_to_end.summary()
+    print(f"Corpus {os.path.basename(args.corpus)}: {len(corpus)} utterances x {args.repeat}, "
+          f"LLM {engine.intent_client.transport.describe()}, local intents {'off' if args.no_local else 'on'}, "
+          f"cache {'on' if args.cache else 'off'}")
+    print(f"Throughput: {utterances / wall:.1f} utterances/s, {commands_run / wall:.1f} commands/s "
+          f"({commands_run} commands in {wall:.2f} s)")
+    print(f"End-to-end latency: p50 {s['p50_ms']:.1f} ms  p95 {s['p95_ms']:.1f} ms  p99 {s['p99_ms']:.1f} ms  "
+          f"max {s['max_ms']:.1f} ms")
+    print(f"Intent accuracy: {correct / utterances:.1%} exact (command + argument), "
+          f"{commands_right / utterances:.1%} command only")
+    print(engine.metrics.describe())
+
+
+if __name__ == "__main__":
+    main()
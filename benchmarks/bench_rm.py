@@ -0,0 +1,70 @@
+# Compares wall time for removing a large tree with shutil.rmtree, with the parallel purger,
+# and the time `rm -r` now makes the user wait (rename into the trash staging area).
+#
+#   python benchmarks/bench_rm.py [--files 100000] [--fanout 100] [--workers 8] [--dir /tmp]
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trash import Trash, parallel_rmtree
+
+
+def build_tree(root, files, fanout):
+    # files spread over fanout directories, each with fanout subdirectories.
+    per_leaf = max(1, files // (fanout * fanout))
+    created = 0
+    for i in range(fanout):
+        for j in range(fanout):
+            leaf = os.path.join(root, f"d{i}", f"s{j}")
+            os.makedirs(leaf)
+            for k in range(per_leaf):
+                if created >= files:
+                    return created
+                with open(os.path.join(leaf, f"f{k}"), "w"):
+                    pass
+                created += 1
+    return created
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rm -r strategies on a large tree.")
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--fanout", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="Filesystem to benchmark on")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="voiceos-bench-", dir=args.dir)
+    try:
+        print(f"Tree: {args.files} files, fanout {args.fanout}, workers {args.workers}, in {work}")
+        tree = os.path.join(work, "tree")
+        timed("build tree", lambda: build_tree(tree, args.files, args.fanout))
+        timed("shutil.rmtree", lambda: shutil.rmtree(tree))
+
+        timed("build tree", lambda: build_tree(tree, args.files, args.fanout))
+        removed, errors = timed(f"parallel_rmtree ({args.workers} workers)",
+                                lambda: parallel_rmtree(tree, workers=args.workers))
+        print(f"  {removed} entries removed, {len(errors)} errors")
+
+        timed("build tree", lambda: build_tree(tree, args.files, args.fanout))
+        trash = Trash(os.path.join(work, "trash"), purge_delay=0, workers=args.workers)
+        item = timed("rm -r (stage into trash)", lambda: trash.stage(tree))
+        timed("background purge of staged tree", lambda: parallel_rmtree(item["staged_path"], args.workers))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Tracks cold-start latency: time to the first usable prompt and time until the first voice command
+# has run, measured from process spawn over several runs.
+#
+#   python benchmarks/bench_startup.py [--runs 5] [--llm-latency 0.3] [--no-gui]
+#
+# GUI runs start `VoiceOS.py --profile-startup` (needs a display) with the stub ASR backend and the
+# fake LLM server, and also report the median of each startup phase. CLI runs time
+# `shell_engine.py -c pwd` (first command) and `shell_engine.py --say "list files"` (first spoken
+# command, resolved through the AI client).
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from fake_llm_server import FakeLLMServer
+
+
+def run_gui(env, work_dir, say):
+    profile_path = os.path.join(work_dir, "profile.json")
+    spawned = time.time()
+    subprocess.run([sys.executable, os.path.join(REPO, "VoiceOS.py"), "--profile-startup", "--profile-say", say,
+                    "--profile-output", profile_path], env=env, cwd=work_dir, check=True, timeout=120,
+                   stdout=subprocess.DEVNULL)
+    with open(profile_path, "r", encoding="utf-8") as f:
+        profile = json.load(f)
+    # Profile offsets are relative to the first line of VoiceOS.py; shift them to process spawn.
+    spawn_ms = (profile["origin_epoch"] - spawned) * 1000
+    milestones = {name: offset + spawn_ms for name, offset in profile["milestones"].items()}
+    return milestones, profile["phases"]
+
+
+def run_cli(env, work_dir, args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(REPO, "shell_engine.py")] + args, env=env, cwd=work_dir,
+                   check=True, timeout=120, stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def describe(name, values):
+    return (f"{name:<34}median {statistics.median(values):>8.1f} ms   min {min(values):>8.1f} ms   "
+            f"max {max(values):>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure VoiceOS cold-start latency.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--say", default="list files", help="Transcript used as the first voice command")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake LLM response delay in seconds")
+    parser.add_argument("--no-gui", action="store_true", help="Only time the headless engine")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(("127.0.0.1", 0), latency=args.llm_latency, jitter=0.0)
+    server.start()
+    work_dir = tempfile.mkdtemp(prefix="voiceos-startup-")
+    env = dict(os.environ, VOICEOS_HOME=os.path.join(work_dir, "home"), VOICEOS_LLM_URL=server.url,
+               VOICEOS_ASR_BACKEND="stub", VOICEOS_ASR_STUB_FILE=os.path.join(work_dir, "transcripts.txt"),
+               VOICEOS_LOCAL_INTENTS="0") # The first voice command goes through the AI client
+    with open(env["VOICEOS_ASR_STUB_FILE"], "w", encoding="utf-8") as f:
+        f.write(args.say + "\n")
+
+    print(f"{args.runs} cold starts each, fake LLM latency {args.llm_latency:.2f}s")
+    first_command = [run_cli(env, work_dir, ["-c", "pwd"]) for _ in range(args.runs)]
+    first_voice = [run_cli(env, work_dir, ["--say", args.say]) for _ in range(args.runs)]
+    print("Headless engine (shell_engine.py, process wall time):")
+    print("  " + describe("first typed command", first_command))
+    print("  " + describe("first voice command", first_voice))
+
+    if args.no_gui:
+        return
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        print("GUI: skipped, no display (run under a desktop session or xvfb-run).")
+        return
+    milestones, phases = {}, {}
+    for _ in range(args.runs):
+        run_milestones, run_phases = run_gui(env, work_dir, args.say)
+        for name, offset in run_milestones.items():
+            milestones.setdefault(name, []).append(offset)
+        for phase in run_phases:
+            phases.setdefault(phase["name"], []).append(phase["ms"])
+    print("GUI (VoiceOS.py --profile-startup, from process spawn):")
+    for name in ["first_prompt", "voice_ready", "first_voice_command"]:
+        if name in milestones:
+            print("  " + describe(f"time to {name.replace('_', ' ')}", milestones[name]))
+    print("  Startup phases:")
+    for name, values in phases.items():
+        print("    " + describe(name, values))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import os
+import time
+import bisect
+import threading
+from array import array
+
+try:
+    import fcntl
+except ImportError: # Windows: appends are still single writes, compaction just isn't locked
+    fcntl = None
+
+
+# --- Persistent command history ---
+# One command per line in an append-only file shared by every VoiceOS window. Each window loads it
+# lazily, keeps at most max_entries distinct commands (re-running a command moves it to the newest
+# position) and appends with a single O_APPEND write per command, so concurrent windows never
+# interleave lines. When the file holds more than twice max_entries lines it is rewritten
+# deduplicated, under an exclusive lock that appenders respect.
+#
+# Entries are numbered with an increasing seq. Two indexes map keys to ascending arrays of seqs:
+#   prefix index:    every prefix up to PREFIX_DEPTH characters (a trie flattened into a dict)
+#   substring index: every trigram of the command
+# so "newest entry older than seq X starting with / containing Y" is a bisect into the shortest
+# posting list that Y's prefix or trigrams select, followed by a short backwards walk, independent
+# of the history size. Seqs of commands that were re-run or evicted stay in the arrays until the
+# next rebuild and are skipped.
+class CommandHistory:
+    PREFIX_DEPTH = 4
+    GRAM = 3
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._seq = 0
+        self._by_seq = {}          # seq -> command, live entries only
+        self._seq_by_command = {}  # command -> seq
+        self._oldest_seq = 1       # No live entry has a smaller seq
+        self._all = array("q")     # Every seq ever indexed, ascending
+        self._prefixes = {}        # prefix -> array of seqs
+        self._grams = {}           # trigram -> array of seqs
+        self._lines_on_disk = 0
+        self._write_error_reported = False
+
+    # --- Loading and persistence ---
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            # Newest occurrence of each command wins; one backwards pass instead of replaying.
+            kept = {}
+            for command in reversed(self._read_file()):
+                if command not in kept:
+                    kept[command] = True
+                    if len(kept) >= self.max_entries:
+                        break
+            for seq, command in enumerate(reversed(list(kept)), start=1):
+                self._by_seq[seq] = command
+                self._seq_by_command[command] = seq
+            self._seq = len(kept)
+            self._rebuild_index()
+            self._loaded = True
+            self.load_seconds = time.perf_counter() - started
+        if self._lines_on_disk > 2 * self.max_entries:
+            self.compact()
+
+    def _read_file(self):
+        commands = []
+        try:
+            with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+                commands = [line.rstrip("\n") for line in f if line.strip()]
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: could not read history '{self.path}': {e}")
+        self._lines_on_disk = len(commands)
+        return commands
+
+    def _file_lock(self, exclusive):
+        # Appenders take a shared lock and compaction an exclusive one, on a sidecar file so the
+        # history itself can be replaced.
+        if fcntl is None:
+            return None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(self.path + ".lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return lock_file
+
+    def _append_line(self, command):
+        lock_file = None
+        try:
+            lock_file = self._file_lock(exclusive=False)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, (command + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+            self._lines_on_disk += 1
+        except OSError as e:
+            if not self._write_error_reported: # History is a convenience; report once and carry on
+                print(f"Warning: could not write history '{self.path}': {e}")
+                self._write_error_reported = True
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def compact(self):
+        # Rewrites the file with the newest max_entries distinct commands, including what other
+        # windows appended since this one loaded.
+        lock_file = None
+        try:
+            lock_file = self._file_lock(exclusive=True)
+            latest = {}
+            for command in self._read_file():
+                latest.pop(command, None)
+                latest[command] = True
+            kept = list(latest)[-self.max_entries:]
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write("".join(command + "\n" for command in kept))
+            os.replace(temp_path, self.path)
+            self._lines_on_disk = len(kept)
+        except OSError as e:
+            print(f"Warning: could not compact history '{self.path}': {e}")
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    # --- Adding ---
+    def add(self, command):
+        command = " ".join(command.splitlines()).strip()
+        if not command:
+            return
+        with self._lock:
+            self.load()
+            if self._by_seq and self._seq_by_command.get(command) == self._seq:
+                return # Same as the newest entry; nothing changes on disk either
+            seq = self._remember(command)
+            self._all.append(seq)
+            self._index(seq, command)
+            if len(self._all) > 2 * len(self._by_seq) + 1000:
+                self._rebuild_index() # Mostly stale seqs from re-runs and evictions
+        self._append_line(command)
+        if self._lines_on_disk > 2 * self.max_entries:
+            self.compact()
+
+    def _remember(self, command):
+        old_seq = self._seq_by_command.pop(command, None)
+        if old_seq is not None:
+            del self._by_seq[old_seq]
+        self._seq += 1
+        self._by_seq[self._seq] = command
+        self._seq_by_command[command] = self._seq
+        while len(self._by_seq) > self.max_entries:
+            while self._oldest_seq not in self._by_seq:
+                self._oldest_seq += 1
+            del self._seq_by_command[self._by_seq.pop(self._oldest_seq)]
+        return self._seq
+
+    def _index(self, seq, command, prefixes=None, grams=None):
+        # A seq may be appended twice to a trigram's list (repeated trigram); lookups tolerate that.
+        prefixes = self._prefixes if prefixes is None else prefixes
+        grams = self._grams if grams is None else grams
+        for i in range(1, min(len(command), self.PREFIX_DEPTH) + 1):
+            postings = prefixes.get(command[:i])
+            if postings is None:
+                postings = prefixes[command[:i]] = array("q")
+            postings.append(seq)
+        for i in range(len(command) - self.GRAM + 1):
+            postings = grams.get(command[i:i + self.GRAM])
+            if postings is None:
+                postings = grams[command[i:i + self.GRAM]] = array("q")
+            postings.append(seq)
+
+    def _rebuild_index(self):
+        prefixes = {}
+        grams = {}
+        for seq, command in self._by_seq.items(): # Insertion order is ascending seq
+            self._index(seq, command, prefixes, grams)
+        self._all = array("q", self._by_seq)
+        self._prefixes = prefixes
+        self._grams = grams
+
+    # --- Lookups ---
+    # Each returns (seq, command) or None; pass the seq back to continue from that entry.
+    def find_prefix(self, prefix, before=None, after=None):
+        with self._lock:
+            self.load()
+            if len(prefix) <= self.PREFIX_DEPTH:
+                postings = self._prefixes.get(prefix, array("q")) if prefix else self._all
+                return self._walk(postings, None, before, after)
+            # Longer prefixes: every trigram of the prefix is one of the command's too, so walk the
+            # shortest of those posting lists and the PREFIX_DEPTH one, as find_substring does.
+            candidates = [self._prefixes.get(prefix[:self.PREFIX_DEPTH], array("q"))]
+            candidates += [self._grams.get(prefix[i:i + self.GRAM], array("q"))
+                           for i in range(len(prefix) - self.GRAM + 1)]
+            postings = min(candidates, key=len)
+            return self._walk(postings, lambda command: command.startswith(prefix), before, after)
+
+    def find_substring(self, text, before=None, after=None):
+        with self._lock:
+            self.load()
+            if len(text) < self.GRAM:
+                postings = self._all
+            else:
+                grams = {text[i:i + self.GRAM] for i in range(len(text) - self.GRAM + 1)}
+                postings = min((self._grams.get(gram, array("q")) for gram in grams), key=len)
+            return self._walk(postings, lambda command: text in command, before, after)
+
+    def _walk(self, postings, check, before, after):
+        # Newest match older than `before`, or (when `after` is given) oldest match newer than it.
+        if after is not None:
+            for i in range(bisect.bisect_right(postings, after), len(postings)):
+                found = self._match(postings[i], check)
+                if found:
+                    return found
+            return None
+        end = len(postings) if before is None else bisect.bisect_left(postings, before)
+        for i in range(end - 1, -1, -1):
+            found = self._match(postings[i], check)
+            if found:
+                return found
+        return None
+
+    def _match(self, seq, check):
+        command = self._by_seq.get(seq)
+        if command is not None and (check is None or check(command)):
+            return seq, command
+        return None
+
+    def recent(self, count):
+        # The newest `count` commands, oldest first.
+        with self._lock:
+            self.load()
+            commands = []
+            for i in range(len(self._all) - 1, -1, -1):
+                if len(commands) >= count:
+                    break
+                command = self._by_seq.get(self._all[i])
+                if command is not None:
+                    commands.append(command)
+            return commands[::-1]
+
+    def __len__(self):
+        with self._lock:
+            self.load()
+            return len(self._by_seq)
+
+    def describe(self):
+        with self._lock:
+            self.load()
+            return (f"History: {len(self._by_seq)}/{self.max_entries} commands in '{self.path}' "
+                    f"({self._lines_on_disk} lines on disk), index {len(self._prefixes)} prefixes / "
+                    f"{len(self._grams)} trigrams, loaded in {self.load_seconds * 1000:.0f} ms")
@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import time
+import socket
+import base64
+import queue
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future
+
+from metrics import Metrics
+from session import Session
+from shell_engine import CommandResult, parse_command, ARGUMENT_COMMANDS
+from shell_args import FailedOutput
+
+
+# --- VoiceOS daemon protocol ---
+# JSON-RPC 2.0 over a Unix domain socket, one JSON object per line. Besides responses the daemon
+# sends "output" notifications ({"request": id, "text", "tag"}) while a command streams output.
+# See voiceosd.py for the methods.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+NOT_UNDERSTOOD = 1  # Speech recognition could not understand the audio
+NO_SPEECH = 2       # The audio was silence
+ASR_ERROR = 3       # Speech recognition service error
+AI_UNAVAILABLE = 4
+UNKNOWN_SESSION = 5
+BUSY = 6            # The client already has as many requests in flight as the daemon allows
+
+MAX_MESSAGE = 32 * 1024 * 1024 # Audio is sent base64-encoded inside a message
+OUTPUT_BACKLOG = 256 * 1024
+
+
+def default_socket_path(data_dir=None):
+    data_dir = data_dir or os.getenv("VOICEOS_HOME", os.path.join(os.path.expanduser("~"), ".voiceos"))
+    return os.getenv("VOICEOS_DAEMON_SOCKET", os.path.join(data_dir, "daemon.sock"))
+
+def encode_message(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class DaemonError(Exception):
+    def __init__(self, message, code=INTERNAL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+# --- Client ---
+# One connection, usable from any number of threads: requests are written under a lock and a
+# reader thread hands each response to the Future of its request, so calls from several threads
+# are in flight at once. Output notifications go to the on_output callback of their request.
+class DaemonClient:
+    def __init__(self, path=None):
+        self.path = path or default_socket_path()
+        self._sock = None
+        self._ids = itertools.count(1)
+        self._pending = {} # Request id -> Future
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed = False
+
+    def connect(self, timeout=5.0):
+        if not hasattr(socket, "AF_UNIX"):
+            raise DaemonError("The VoiceOS daemon needs Unix domain sockets, which this platform lacks.")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        self._sock = sock
+        threading.Thread(target=self._read_responses, daemon=True, name="daemon-client").start()
+        return self
+
+    @property
+    def connected(self):
+        return self._sock is not None and not self._closed
+
+    def request(self, method, params=None, on_output=None):
+        # Sends a request and returns a Future for its result; future.request_id names it for
+        # "cancel". on_output(text, tag) receives the output it streams, on the reader thread.
+        if not self.connected:
+            raise DaemonError("Not connected to the VoiceOS daemon.")
+        request_id = next(self._ids)
+        future = Future()
+        future.request_id = request_id
+        future.on_output = on_output
+        with self._lock:
+            self._pending[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}
+        try:
+            with self._send_lock:
+                self._sock.sendall(encode_message(message))
+        except OSError as e:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise DaemonError(f"Lost connection to the VoiceOS daemon: {e}")
+        return future
+
+    def notify(self, method, params=None):
+        # A JSON-RPC notification: no id, no response.
+        message = {"jsonrpc": "2.0", "method": method, "params": params or {}}
+        try:
+            with self._send_lock:
+                self._sock.sendall(encode_message(message))
+        except (OSError, AttributeError) as e:
+            raise DaemonError(f"Lost connection to the VoiceOS daemon: {e}")
+
+    def call(self, method, params=None, timeout=None, on_output=None):
+        return self.request(method, params, on_output).result(timeout)
+
+    def _read_responses(self):
+        error = "Connection to the VoiceOS daemon closed."
+        try:
+            with self._sock.makefile("rb") as f:
+                for line in f:
+                    message = json.loads(line)
+                    if message.get("method") == "output":
+                        params = message["params"]
+                        with self._lock:
+                            future = self._pending.get(params.get("request"))
+                        if future is not None and future.on_output:
+                            future.on_output(params["text"], params.get("tag", "output"))
+                        continue
+                    with self._lock:
+                        future = self._pending.pop(message.get("id"), None)
+                    if future is None:
+                        continue
+                    if "error" in message:
+                        future.set_exception(DaemonError(message["error"].get("message", "Unknown error"),
+                                                         message["error"].get("code", INTERNAL_ERROR)))
+                    else:
+                        future.set_result(message.get("result"))
+        except (OSError, ValueError) as e:
+            if not self._closed:
+                error = f"Connection to the VoiceOS daemon failed: {e}"
+        finally:
+            self._closed = True
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(DaemonError(error))
+
+    def close(self):
+        self._closed = True
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+
+
+def connect_or_start(path=None, timeout=30.0, log_path=None):
+    # Connects to the daemon, starting voiceosd.py in the background first if nothing listens on
+    # the socket. The daemon outlives the window that started it, so the next one finds it warm.
+    path = path or default_socket_path()
+    try:
+        return DaemonClient(path).connect()
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+    log_path = log_path or os.path.join(os.path.dirname(path) or ".", "daemon.log")
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voiceosd.py")
+    with open(log_path, "ab") as log:
+        subprocess.Popen([sys.executable, script, "--socket", path], stdin=subprocess.DEVNULL,
+                         stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return DaemonClient(path).connect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise DaemonError(f"The VoiceOS daemon did not start within {timeout:.0f} s; see '{log_path}'.")
+            time.sleep(0.05)
+
+
+# --- Remote engine ---
+# Stands in for ShellEngine in a front end whose commands, intent resolution and speech
+# recognition run in the daemon. Commands registered by the front end (they need its window)
+# and "clear" still run locally. Each local Session is mirrored by a daemon session, opened on
+# first use; its cwd is updated from every result. Connects on first use.
+class RemoteEngine:
+    def __init__(self, path=None, start_daemon=True):
+        self.path = path or default_socket_path()
+        self.start_daemon = start_daemon
+        self.metrics = Metrics(enabled=os.getenv("VOICEOS_METRICS", "1") != "0") # Front-end timings only
+        self.intent_cache = None     # In the daemon
+        self.intents_pending = False
+        self.session = Session() # Default session, as in ShellEngine
+        self.argument_commands = list(ARGUMENT_COMMANDS)
+        self.daemon_info = {}
+        self._client = None
+        self._handlers = {}
+        self._remote_sessions = {} # Local Session id -> daemon session id
+        self._connect_lock = threading.Lock()
+
+    @property
+    def ai_ready(self):
+        return bool(self.daemon_info.get("ai_ready"))
+
+    def client(self):
+        with self._connect_lock:
+            if self._client is None or not self._client.connected:
+                self._client = connect_or_start(self.path) if self.start_daemon else DaemonClient(self.path).connect()
+                self._remote_sessions = {} # A restarted daemon has none of them
+            return self._client
+
+    def call(self, method, params=None, on_output=None, job=None):
+        if job is None:
+            return self.client().request(method, params, on_output).result()
+        return self.call_streaming(method, dict(params or {}, ack=True), job)
+
+    def call_streaming(self, method, params, job):
+        # The connection's reader thread only queues this request's output; this (the job's) thread
+        # writes it to the job, waiting while the window is behind, and acks what it wrote. The
+        # daemon holds the command back while too much is unacked, so a flood in one tab never
+        # stalls the reader and with it the other tabs' results.
+        output = queue.Queue()
+        client = self.client()
+        future = client.request(method, params, on_output=lambda text, tag: output.put((text, tag)))
+        future.add_done_callback(lambda _: output.put(None)) # Queued after all of its output
+        # Ctrl+C is forwarded: each press sends "cancel", so external commands escalate as locally.
+        forwarded = 0
+        while True:
+            try:
+                item = output.get(timeout=0.05)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                return future.result()
+            if item:
+                text, tag = item
+                job.wait_for_output_room(OUTPUT_BACKLOG)
+                job.write(text, tag)
+                try:
+                    client.notify("ack", {"request": future.request_id, "chars": len(text)})
+                except DaemonError:
+                    pass # The response (an error) follows
+            while forwarded < job.cancel_requests:
+                forwarded += 1
+                client.request("cancel", {"request": future.request_id})
+
+    def wait_ready(self):
+        # Blocks until the daemon has loaded the AI side; returns its status.
+        self.daemon_info = self.call("ping", {"wait": True})
+        return self.daemon_info
+
+    def register(self, name, func, takes_arguments=False):
+        self._handlers[name] = func
+        if takes_arguments and name not in self.argument_commands:
+            self.argument_commands.append(name)
+
+    def parse(self, command_str):
+        return parse_command(command_str, self.argument_commands)
+
+    def remote_session(self, session):
+        self.client() # Reconnecting forgets the sessions of the daemon that went away
+        remote_id = self._remote_sessions.get(session.id)
+        if remote_id is None:
+            remote_id = self.call("session.open", {"cwd": session.cwd})["session"]
+            self._remote_sessions[session.id] = remote_id
+        return remote_id
+
+    def close_session(self, session):
+        remote_id = self._remote_sessions.pop(session.id, None)
+        if remote_id is not None and self._client is not None and self._client.connected:
+            self._client.request("session.close", {"session": remote_id})
+        session.close()
+
+    def execute(self, command_str, job=None, spoken=False, session=None):
+        command_str = command_str.strip()
+        session = session or self.session
+        full_base_command, base_cmd_part2, arg_string = self.parse(command_str)
+        if not command_str or full_base_command == "clear" or full_base_command in self._handlers:
+            start = time.perf_counter()
+            output = "" if full_base_command == "clear" else \
+                self._handlers[full_base_command](arg_string, base_cmd_part2, job, session)
+            return CommandResult(command_str, full_base_command, str(output or ""), not isinstance(output, FailedOutput),
+                                 time.perf_counter() - start, "clear" if full_base_command == "clear" else None)
+
+        try:
+            result = self.call("execute", {"command": command_str, "session": self.remote_session(session),
+                                           "spoken": spoken, "stream": job is not None}, job=job)
+        except DaemonError as e:
+            if e.code == UNKNOWN_SESSION:
+                self._remote_sessions.pop(session.id, None)
+            return CommandResult(command_str, full_base_command, f"VoiceOS daemon: {e}", ok=False)
+        session.cwd = result.pop("cwd", session.cwd)
+        return CommandResult.from_dict(result)
+
+    def complete(self, line, scan=True, session=None):
+        if not scan:
+            return None # Always a round trip; let the caller do it off the UI thread
+        session = session or self.session
+        try:
+            result = self.call("complete", {"line": line, "session": self.remote_session(session)})
+        except DaemonError:
+            return line, []
+        return result["line"], result["candidates"]
+
+    def interpret(self, transcribed_text):
+        try:
+            result = self.call("interpret", {"text": transcribed_text})
+        except DaemonError as e:
+            return [], f"VoiceOS daemon: {e}", {"commands": [], "error": str(e)}
+        return result["commands"], result["error"], result["ai_result"]
+
+    def recognize(self, audio):
+        # audio: sr.AudioData from the local microphone. Silence trimming and recognition happen
+        # in the daemon; raises DaemonError (code NO_SPEECH, NOT_UNDERSTOOD or ASR_ERROR).
+        return self.call("recognize", {"audio": base64.b64encode(audio.frame_data).decode("ascii"),
+                                       "sample_rate": audio.sample_rate, "sample_width": audio.sample_width})["text"]
+
+    def describe(self):
+        return self.call("describe")
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
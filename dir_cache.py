@@ -0,0 +1,180 @@
+import os
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+
+# --- Directory listing cache ---
+# Shared by `ls` and Tab completion. A listing is reused while the directory's mtime is unchanged,
+# so repeated completions cost one os.stat instead of a rescan. Listings taken within
+# RACY_SECONDS of the directory's last change aren't trusted (a coarse-mtime filesystem could hide
+# a later change in the same tick) and are rescanned, as git does for racily-clean files.
+# The stdlib has no inotify; one stat per lookup keeps invalidation exact without it.
+RACY_SECONDS = 2.0
+
+
+class CachedEntry:
+    # Stands in for os.DirEntry when a listing is served from the cache. The type comes from the
+    # scan (it only changes through a rename, which bumps the directory mtime); stat() is always
+    # fresh because file sizes and times change without touching the directory.
+    __slots__ = ("name", "parent", "_is_dir")
+
+    def __init__(self, name, parent, is_dir):
+        self.name = name
+        self.parent = parent
+        self._is_dir = is_dir
+
+    @property
+    def path(self):
+        return os.path.join(self.parent, self.name)
+
+    def is_dir(self, follow_symlinks=True):
+        return self._is_dir
+
+    def stat(self, follow_symlinks=True):
+        return os.stat(self.path) if follow_symlinks else os.lstat(self.path)
+
+
+class DirectoryListing:
+    def __init__(self, path, mtime_ns, entries, scanned_ns, scan_seconds):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.entries = entries            # CachedEntry in scandir order
+        self.scanned_ns = scanned_ns
+        self.scan_seconds = scan_seconds
+        self.names = sorted(e.name for e in entries)
+        self.dir_names = sorted(e.name for e in entries if e._is_dir)
+        self.is_dir = {e.name: e._is_dir for e in entries}
+        self._folded = None               # Sorted (lowercase, name) pairs, built on first use
+
+    @property
+    def racy(self):
+        return self.scanned_ns - self.mtime_ns < RACY_SECONDS * 1e9
+
+    def matching(self, prefix, dirs_only=False, include_hidden=None):
+        # Names starting with prefix, sorted, by bisecting the sorted names. Hidden names are only
+        # included when the prefix starts with "." (unless include_hidden says otherwise).
+        names = self.dir_names if dirs_only else self.names
+        if include_hidden is None:
+            include_hidden = prefix.startswith(".")
+        lo = bisect.bisect_left(names, prefix)
+        hi = bisect.bisect_left(names, prefix + "\U0010ffff")
+        matches = names[lo:hi]
+        if not include_hidden and not prefix:
+            hidden_lo = bisect.bisect_left(matches, ".")
+            hidden_hi = bisect.bisect_left(matches, "/") # "/" sorts right after "." and never occurs in names
+            matches = matches[:hidden_lo] + matches[hidden_hi:]
+        return matches
+
+    def matching_folded(self, prefix, dirs_only=False):
+        # Case-insensitive fallback for completion when nothing matches exactly.
+        if self._folded is None:
+            self._folded = sorted((name.lower(), name) for name in self.names)
+        folded = prefix.lower()
+        lo = bisect.bisect_left(self._folded, (folded,))
+        hi = bisect.bisect_left(self._folded, (folded + "\U0010ffff",))
+        return [name for _, name in self._folded[lo:hi]
+                if (not dirs_only or self.is_dir[name]) and (prefix.startswith(".") or not name.startswith("."))]
+
+
+class DirectoryCache:
+    def __init__(self, max_directories=64):
+        self.max_directories = max_directories
+        self.hits = 0
+        self.misses = 0
+        self._listings = OrderedDict() # Absolute path -> DirectoryListing, least recently used first
+        self._scanning = {}            # Absolute path -> callbacks waiting for a running scan
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        # The cached listing if it is still valid, else None. Costs one os.stat.
+        path = os.path.abspath(path)
+        with self._lock:
+            listing = self._listings.get(path)
+        if listing is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            listing = None
+        else:
+            if st.st_mtime_ns != listing.mtime_ns or listing.racy:
+                listing = None
+        with self._lock:
+            if listing is None:
+                self._listings.pop(path, None)
+                return None
+            self._listings.move_to_end(path)
+            self.hits += 1
+        return listing
+
+    def listing(self, path):
+        # Cached listing, or a fresh scan (which is then cached). Raises OSError like os.scandir.
+        listing = self.get(path)
+        if listing is None:
+            for _ in self.scan(path):
+                pass
+            with self._lock:
+                listing = self._listings.get(os.path.abspath(path))
+        return listing
+
+    def scan(self, path):
+        # Yields os.DirEntry objects straight from os.scandir (so `ls` can stream the first ones)
+        # and caches the listing once the iteration completes. Stopping early caches nothing.
+        path = os.path.abspath(path)
+        started = time.perf_counter()
+        mtime_ns = os.stat(path).st_mtime_ns # Taken first, so a change during the scan invalidates it
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                entries.append(CachedEntry(entry.name, path, is_dir))
+                yield entry
+        listing = DirectoryListing(path, mtime_ns, entries, time.time_ns(), time.perf_counter() - started)
+        with self._lock:
+            self.misses += 1
+            self._listings[path] = listing
+            self._listings.move_to_end(path)
+            while len(self._listings) > self.max_directories:
+                self._listings.popitem(last=False)
+
+    def prefetch(self, path, callback=None):
+        # Makes sure `path` is cached without blocking the caller; a scan already running for it
+        # is joined. callback(listing, or None if unreadable) runs on the scanning thread.
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._scanning:
+                if callback:
+                    self._scanning[path].append(callback)
+                return
+            self._scanning[path] = [callback] if callback else []
+
+        def run():
+            try:
+                listing = self.listing(path)
+            except OSError:
+                listing = None
+            with self._lock:
+                callbacks = self._scanning.pop(path)
+            for callback in callbacks:
+                callback(listing)
+
+        threading.Thread(target=run, daemon=True, name="dir-scan").start()
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.path.abspath(path), None)
+
+    def describe(self):
+        with self._lock:
+            entries = sum(len(listing.entries) for listing in self._listings.values())
+            return (f"Directory cache: {len(self._listings)}/{self.max_directories} directories, {entries} entries, "
+                    f"{self.hits} hits, {self.misses} scans")
+
@@ -0,0 +1,262 @@
+import io
+import os
+import time
+import codecs
+import locale
+import shutil
+import signal
+import threading
+import subprocess
+
+from shell_args import split_arguments, split_pipeline, expand_globs, FailedOutput
+
+
+# --- External commands ---
+# Anything that isn't a built-in runs as a program. There is no shell in between: quotes and globs
+# are handled by shell_args as for the built-ins and "a | b" connects the programs' stdout and
+# stdin, but redirection, variables and && are passed through as plain arguments. Programs get no
+# keyboard input (stdin is empty), run in their session's directory and stream their output:
+#   reader threads  one per pipe (the last stdout, every stderr) read whatever is available into a
+#                   shared buffer of at most MAX_BUFFERED bytes. A full buffer blocks the readers,
+#                   the pipe fills up and the program waits in write(), as behind a slow terminal.
+#   the job thread  takes everything buffered every FLUSH_INTERVAL, or as soon as CHUNK_SIZE bytes
+#                   are waiting, so a burst of small writes becomes one job.write per stream, and
+#                   first waits while the job's consumer (the window) is MAX_BACKLOG characters behind.
+# Ctrl+C (job.cancel) sends SIGINT to each program's process group (CTRL_BREAK on Windows). A
+# program still running KILL_GRACE seconds later gets SIGTERM, then SIGKILL; pressing Ctrl+C
+# again escalates at once.
+READ_SIZE = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+MAX_BUFFERED = 256 * 1024
+MAX_BACKLOG = 256 * 1024
+FLUSH_INTERVAL = 0.05
+KILL_GRACE = 2.0
+EXIT_DRAIN = 0.5 # After the last program exits, how long to wait for pipes a child process still holds
+
+SIGNALS = ["SIGINT", "SIGTERM", "SIGKILL"]
+
+
+def parse_pipeline(command_str, cwd=None):
+    # [[program, arg, ...], ...] with globs expanded against cwd. Raises ValueError for unbalanced
+    # quotes or a missing command.
+    stages = []
+    for stage in split_pipeline(command_str):
+        argv = expand_globs(split_arguments(stage), cwd)
+        if not argv:
+            raise ValueError("missing command")
+        stages.append(argv)
+    return stages
+
+def program_name(program):
+    # "/usr/bin/git" -> "git", "Git.EXE" -> "git" on Windows; what the voice allowlist names.
+    name = os.path.basename(program)
+    if os.name == "nt":
+        name = os.path.splitext(name)[0].lower()
+    return name
+
+def voice_program(program):
+    # The full path of the program a voice command may run, or None. Voice names programs, never
+    # paths: "./git" or "/tmp/x/git" would pass an allowlist of "git" by basename, so anything with a
+    # path separator is refused and bare names are looked up on PATH only, never in the cwd.
+    if "/" in program or os.sep in program or (os.altsep and os.altsep in program):
+        return None
+    return shutil.which(program)
+
+def describe_status(returncode):
+    if returncode >= 0:
+        return f"exit status {returncode}"
+    try:
+        return f"killed by {signal.Signals(-returncode).name}"
+    except ValueError:
+        return f"killed by signal {-returncode}"
+
+
+class OutputBuffer:
+    # Bytes read from the pipes, in arrival order, shared by the reader threads and the job thread.
+    def __init__(self, max_bytes=MAX_BUFFERED, chunk_size=CHUNK_SIZE):
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.open_streams = 0
+        self.total_bytes = 0
+        self._chunks = [] # (tag, bytes)
+        self._size = 0
+        self._discard = False
+        self._cond = threading.Condition()
+
+    def start_reader(self, stream, tag):
+        with self._cond:
+            self.open_streams += 1
+        threading.Thread(target=self._read, args=(stream, tag), daemon=True, name=f"pipe-{tag}").start()
+
+    def _read(self, stream, tag):
+        try:
+            while True:
+                data = stream.read1(READ_SIZE) # Whatever is available, without waiting for READ_SIZE
+                if not data:
+                    break
+                with self._cond:
+                    while self._size >= self.max_bytes and not self._discard:
+                        self._cond.wait() # Backpressure: leave the rest in the pipe
+                    if self._discard:
+                        continue
+                    self._chunks.append((tag, data))
+                    self._size += len(data)
+                    self.total_bytes += len(data)
+                    if self._size >= self.chunk_size:
+                        self._cond.notify_all()
+        except (OSError, ValueError):
+            pass # Pipe closed under us
+        finally:
+            stream.close()
+            with self._cond:
+                self.open_streams -= 1
+                self._cond.notify_all()
+
+    def take(self, timeout):
+        # Waits up to timeout for chunk_size bytes or the end of all streams, then returns what was
+        # read as [(tag, bytes)], consecutive chunks of one stream joined.
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._size < self.chunk_size and self.open_streams:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            chunks, self._chunks, self._size = self._chunks, [], 0
+            self._cond.notify_all()
+        merged = []
+        for tag, data in chunks:
+            if merged and merged[-1][0] == tag:
+                merged[-1][1].append(data)
+            else:
+                merged.append((tag, [data]))
+        return [(tag, b"".join(parts)) for tag, parts in merged]
+
+    def discard(self):
+        # Nobody reads on: readers keep draining their pipes (so no program blocks) but drop the data.
+        with self._cond:
+            self._discard = True
+            self._chunks, self._size = [], 0
+            self._cond.notify_all()
+
+
+def start_pipeline(stages, cwd=None):
+    # Starts every program of the pipeline, each in its own process group so signals reach the
+    # processes it starts too. If one can't be started, the ones already running are killed.
+    kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else \
+             {"start_new_session": True}
+    env = dict(os.environ, PWD=cwd) if cwd else None
+    processes = []
+    stdin = subprocess.DEVNULL
+    try:
+        for i, argv in enumerate(stages):
+            last = i == len(stages) - 1
+            process = subprocess.Popen(argv, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       cwd=cwd, env=env, **kwargs)
+            if stdin is not subprocess.DEVNULL:
+                stdin.close() # Only the next program holds the pipe now, so it sees SIGPIPE/EOF properly
+            processes.append(process)
+            stdin = None if last else process.stdout
+    except BaseException:
+        if stdin not in (None, subprocess.DEVNULL):
+            stdin.close()
+        signal_processes(processes, len(SIGNALS) - 1)
+        for process in processes:
+            process.wait()
+        raise
+    return processes
+
+def signal_processes(processes, level):
+    # level indexes SIGNALS: interrupt, terminate, kill.
+    for process in processes:
+        if process.poll() is not None:
+            continue
+        try:
+            if os.name == "nt":
+                if level == 0:
+                    process.send_signal(signal.CTRL_BREAK_EVENT)
+                elif level == 1:
+                    process.terminate()
+                else:
+                    process.kill()
+            else:
+                os.killpg(process.pid, getattr(signal, SIGNALS[level]))
+        except OSError:
+            pass # Exited in the meantime
+
+
+def run_pipeline(stages, job=None, cwd=None):
+    # Runs the programs until they exit and their output has been delivered: to job.write as it
+    # arrives, or collected into the output when there is no job. Returns (output, exit status of
+    # the last program, as in sh); output is a FailedOutput unless the status is 0. Raises OSError
+    # when a program can't be started.
+    processes = start_pipeline(stages, cwd)
+    buffer = OutputBuffer()
+    buffer.start_reader(processes[-1].stdout, "output")
+    for process in processes:
+        buffer.start_reader(process.stderr, "error")
+
+    decoders = {}
+    collected = []
+    encoding = locale.getpreferredencoding(False)
+
+    def deliver(chunks, final=False):
+        for tag, data in chunks:
+            decoder = decoders.get(tag)
+            if decoder is None:
+                # Universal newlines: \r\n from Windows programs and \r progress updates become lines.
+                decoder = decoders[tag] = io.IncrementalNewlineDecoder(
+                    codecs.getincrementaldecoder(encoding)(errors="replace"), translate=True)
+            text = decoder.decode(data, final)
+            if not text:
+                continue
+            if job:
+                job.wait_for_output_room(MAX_BACKLOG)
+                job.write(text, tag)
+            else:
+                collected.append(text)
+
+    interrupts = 0   # Ctrl+C presses seen so far
+    level = -1       # Strongest signal sent (index into SIGNALS)
+    signalled_at = 0.0
+    exited_at = None
+    try:
+        while True:
+            try:
+                chunks = buffer.take(FLUSH_INTERVAL)
+            except KeyboardInterrupt: # Command-line runner: Ctrl+C reaches us, not the programs
+                interrupts += 1
+                chunks = []
+            deliver(chunks)
+            if job:
+                interrupts = max(interrupts, job.cancel_requests)
+                if buffer.total_bytes:
+                    job.report_progress(f"{buffer.total_bytes / 1024:.0f} KB of output")
+            now = time.monotonic()
+            if level < len(SIGNALS) - 1 and (interrupts > level + 1 or (level >= 0 and now - signalled_at > KILL_GRACE)):
+                level += 1
+                signalled_at = now
+                signal_processes(processes, level)
+            if exited_at is None and all(process.poll() is not None for process in processes):
+                exited_at = now
+            if not buffer.open_streams and exited_at is not None:
+                break
+            if exited_at is not None and now - exited_at > EXIT_DRAIN:
+                break # A background child kept a pipe open; stop waiting for it
+        deliver(buffer.take(0))
+        deliver([(tag, b"") for tag in decoders], final=True)
+    finally:
+        buffer.discard()
+        if any(process.poll() is None for process in processes):
+            signal_processes(processes, len(SIGNALS) - 1)
+        for process in processes:
+            process.wait()
+
+    returncode = processes[-1].returncode
+    output = "".join(collected).rstrip("\n") # Like the built-ins; streamed output is left as it was
+    if returncode == 0:
+        return output, returncode
+    status = f"[{describe_status(returncode)}]"
+    if level >= 0:
+        status = f"[interrupted, {describe_status(returncode)}]"
+    return FailedOutput(f"{output}\n{status}" if output.strip() else status), returncode
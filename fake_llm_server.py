@@ -0,0 +1,159 @@
+# Local stand-in for Gemini, for load-testing the intent client without network or quota.
+# Answers POST {"prompt": ...} with {"text": "<JSON command array>"} using the local classifier,
+# after an injected delay, and fails or stalls a configurable fraction of requests.
+# FakeLLMTransport gives the same behaviour in-process.
+#
+#   python fake_llm_server.py [--port 8765] [--latency 0.3] [--jitter 0.1] [--error-rate 0.05]
+#                             [--slow-rate 0.05] [--slow-seconds 5]
+# then run VoiceOS with VOICEOS_LLM_URL=http://127.0.0.1:8765/generate
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from intent_classifier import LocalIntentClassifier
+from intent_client import Transport, TransportError
+
+SPEECH_LINE = re.compile(r'User speech: "([^"\n]*)"\s*\n\s*JSON Response:')
+
+
+def answer_prompt(classifier, prompt):
+    # Plays the model: picks the spoken text out of the intent prompt and answers in its format.
+    match = SPEECH_LINE.search(prompt)
+    speech = match.group(1) if match else prompt
+    prediction = classifier.predict(speech)
+    if prediction["confidence"] < 0.5:
+        return json.dumps([{"command": "unknown", "argument": ""}])
+    return json.dumps([{"command": prediction["command"], "argument": prediction["argument"]}])
+
+
+# In-process variant of the server for benchmarks: same answers and injected latency/errors,
+# without HTTP.
+class FakeLLMTransport(Transport):
+    name = "fake"
+
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.classifier = LocalIntentClassifier()
+        self.classifier.fit()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, timeout):
+        with self._lock:
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+            fail = self._random.random() < self.error_rate
+        if delay > timeout:
+            time.sleep(timeout)
+            raise TransportError(f"Timed out after {timeout:.1f}s")
+        time.sleep(delay)
+        if fail:
+            raise TransportError("Injected failure")
+        return answer_prompt(self.classifier, prompt)
+
+    def describe(self):
+        return f"fake (latency {self.latency:.2f}s +/- {self.jitter:.2f}s, {self.error_rate:.0%} errors)"
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.3, jitter=0.1, error_rate=0.0, slow_rate=0.0, slow_seconds=5.0,
+                 seed=None):
+        super().__init__(address, FakeLLMHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate      # Fraction of requests delayed by slow_seconds (tail latency)
+        self.slow_seconds = slow_seconds
+        self.classifier = LocalIntentClassifier()
+        self.classifier.fit()
+        self.requests = 0
+        self.errors_injected = 0
+        self.slow_injected = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/generate"
+
+    def plan_request(self):
+        # Decides up front how this request misbehaves: (delay seconds, fail?)
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+            fail = self._random.random() < self.error_rate
+            if self._random.random() < self.slow_rate:
+                delay += self.slow_seconds
+                self.slow_injected += 1
+            if fail:
+                self.errors_injected += 1
+        return delay, fail
+
+    def answer(self, prompt):
+        return answer_prompt(self.classifier, prompt)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True, name="fake-llm")
+        thread.start()
+        return thread
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        try:
+            self.answer_request()
+        except OSError:
+            pass  # Client gave up (timeout or lost hedge), whatever the answer was going to be
+
+    def answer_request(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            prompt = json.loads(self.rfile.read(length).decode("utf-8"))["prompt"]
+        except (ValueError, KeyError):
+            self.send_error(400, "Expected JSON body {\"prompt\": ...}")
+            return
+        delay, fail = self.server.plan_request()
+        time.sleep(delay)
+        if fail:
+            self.send_error(503, "Injected failure")
+            return
+        body = json.dumps({"text": self.server.answer(prompt)}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep load tests quiet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake LLM server with injected latency and errors.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="Mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Standard deviation of the delay")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fraction of requests answered with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Fraction of requests that stall")
+    parser.add_argument("--slow-seconds", type=float, default=5.0, help="Extra delay of a stalled request")
+    args = parser.parse_args()
+    server = FakeLLMServer((args.host, args.port), args.latency, args.jitter, args.error_rate,
+                           args.slow_rate, args.slow_seconds)
+    print(f"Fake LLM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError: # Windows: saves are still atomic replaces, just not merged under a lock
+    fcntl = None
+
+# Words that carry no meaning for command intent and are dropped from the cache key.
+FILLER_WORDS = {"um", "umm", "uh", "uhh", "er", "erm", "ah", "hmm", "please", "kindly", "okay", "ok", "hey"}
+
+# Punctuation stripped from the edges of each word. Characters inside a word
+# ("report.txt", "old_stuff", "src/app") are kept because they change the argument.
+EDGE_PUNCTUATION = ".,!?;:\"'`()[]{}"
+
+
+def normalize_transcript(transcribed_text):
+    words = []
+    for word in (transcribed_text or "").lower().split():
+        word = word.strip(EDGE_PUNCTUATION)
+        if word and word not in FILLER_WORDS:
+            words.append(word)
+    return " ".join(words)
+
+
+# --- Normalized transcript -> {commands: [{command, argument}, ...]} cache ---
+# The file is shared by every process using the same VOICEOS_HOME (windows, the daemon). A put
+# schedules a save SAVE_DELAY seconds later, so a burst of new entries is written once; flush()
+# writes pending entries at once (engine.close calls it). Each save merges with what is on disk,
+# under an exclusive lock on a sidecar file, so entries other processes saved are kept.
+class IntentCache:
+    SAVE_DELAY = 2.0
+
+    def __init__(self, path=None, max_entries=512, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (result, stored_at), oldest first
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+        self._cleared = False # The next save replaces the file instead of merging with it
+        self.load()
+
+    def get(self, transcribed_text):
+        key = normalize_transcript(transcribed_text)
+        with self._lock:
+            entry = self._entries.get(key) if key else None
+            if entry is not None and self._is_expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return {"commands": [dict(c) for c in entry[0]["commands"]]}
+
+    def put(self, transcribed_text, result):
+        key = normalize_transcript(transcribed_text)
+        if not key or not isinstance(result, dict) or result.get("error"):
+            return
+        commands = result.get("commands")
+        if not commands:
+            return
+        value = {"commands": [{"command": c["command"], "argument": c.get("argument") or ""} for c in commands]}
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            if self.path and self._save_timer is None:
+                self._save_timer = threading.Timer(self.SAVE_DELAY, self._timed_save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self._cleared = True
+        self.save()
+
+    def flush(self):
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+            dirty = self._dirty
+        if timer:
+            timer.cancel()
+        if dirty:
+            self.save()
+
+    def _timed_save(self):
+        with self._lock:
+            self._save_timer = None
+        self.save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": hit_rate}
+
+    def describe(self):
+        s = self.stats()
+        return (f"Intent cache: {s['entries']} entries, {s['hits']} hits, {s['misses']} misses "
+                f"({s['hit_rate']:.1f}% hit rate)")
+
+    def _is_expired(self, stored_at):
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    # --- Persistence ---
+    def load(self):
+        entries = self._read_entries()
+        with self._lock:
+            self._entries.update(entries)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_entries(self):
+        # The unexpired entries on disk, oldest first. Malformed ones (a hand edit, an older format
+        # gone wrong) are skipped one by one rather than failing the whole load.
+        entries = OrderedDict()
+        if not self.path or not os.path.exists(self.path):
+            return entries
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw_entries = json.load(f).get("entries", [])
+            if not isinstance(raw_entries, list):
+                raise ValueError("'entries' is not a list")
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Warning: could not load intent cache '{self.path}': {e}")
+            return entries
+        for raw in raw_entries:
+            try:
+                key, value, stored_at = raw
+                if "commands" not in value:
+                    # Entries written before multi-command support held a single command.
+                    value = {"commands": [{"command": value.get("command", "unknown"),
+                                           "argument": value.get("argument") or ""}]}
+                value = {"commands": [{"command": str(c["command"]), "argument": str(c.get("argument") or "")}
+                                      for c in value["commands"]]}
+                if not isinstance(key, str) or not value["commands"]:
+                    continue
+                stored_at = float(stored_at)
+            except (ValueError, TypeError, KeyError, AttributeError):
+                continue
+            if not self._is_expired(stored_at):
+                entries.pop(key, None)
+                entries[key] = (value, stored_at)
+        return entries
+
+    def _file_lock(self):
+        # Held while the file is read, merged and replaced, on a sidecar file as in trash.py.
+        if fcntl is None:
+            return None
+        lock_file = open(self.path + ".lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            lock_file = None
+            tmp_path = None
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                lock_file = self._file_lock()
+                with self._lock:
+                    cleared = self._cleared
+                on_disk = OrderedDict() if cleared else self._read_entries()
+                with self._lock:
+                    # Other processes' entries are kept, and adopted here too; for a key both
+                    # have, the newer answer wins.
+                    merged = on_disk
+                    for key, entry in self._entries.items():
+                        if key not in merged or entry[1] >= merged[key][1]:
+                            merged.pop(key, None)
+                            merged[key] = entry
+                    while len(merged) > self.max_entries:
+                        merged.popitem(last=False)
+                    self._entries = OrderedDict(merged)
+                    raw_entries = [[key, value, stored_at] for key, (value, stored_at) in merged.items()]
+                    self._dirty = self._cleared = False
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".",
+                                                suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"version": 1, "entries": raw_entries}, f)
+                os.replace(tmp_path, self.path)  # Atomic, so a crash never leaves a half-written cache
+                tmp_path = None
+            except OSError as e:
+                print(f"Warning: could not save intent cache '{self.path}': {e}")
+            finally:
+                if tmp_path:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                if lock_file:
+                    lock_file.close()
@@ -0,0 +1,447 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import threading
+import zlib
+
+import numpy as np
+
+from intent_cache import normalize_transcript
+
+COMMANDS_WITH_ARGUMENT = ["cd", "mkdir", "touch", "rm", "rm -r"]
+
+# Hand-written examples so the classifier works before any Gemini history exists.
+SEED_EXAMPLES = [
+    ("list the files", "ls"), ("list files", "ls"), ("show me everything", "ls"),
+    ("what's in this folder", "ls"), ("show the directory contents", "ls"), ("list everything here", "ls"),
+    ("show files", "ls"), ("what files are here", "ls"),
+    ("where am i", "pwd"), ("print working directory", "pwd"), ("what directory am i in", "pwd"),
+    ("show current path", "pwd"), ("which folder is this", "pwd"), ("current directory", "pwd"),
+    ("go to documents", "cd"), ("go to my project folder", "cd"), ("change directory to downloads", "cd"),
+    ("open the folder photos", "cd"), ("move into src", "cd"), ("enter the music directory", "cd"),
+    ("switch to desktop", "cd"), ("go back", "cd"), ("go up one level", "cd"), ("cd into projects", "cd"),
+    ("make a directory called test results", "mkdir"), ("create a folder named photos", "mkdir"),
+    ("make a new folder called backup", "mkdir"), ("new directory reports", "mkdir"),
+    ("create directory build", "mkdir"), ("make folder archive", "mkdir"),
+    ("create a file report dot txt", "touch"), ("make a new file called notes dot md", "touch"),
+    ("create file main dot py", "touch"), ("touch readme", "touch"), ("new file named todo dot txt", "touch"),
+    ("create an empty file index dot html", "touch"),
+    ("delete the file log dot data", "rm"), ("remove file notes dot txt", "rm"), ("delete report dot txt", "rm"),
+    ("erase the file old dot log", "rm"), ("remove the file called temp", "rm"), ("delete file backup dot zip", "rm"),
+    ("remove the old_stuff directory", "rm -r"), ("delete the folder called temp", "rm -r"),
+    ("remove directory build", "rm -r"), ("delete the directory cache", "rm -r"),
+    ("remove the folder photos", "rm -r"), ("delete folder archive and everything in it", "rm -r"),
+    ("clear the screen", "clear"), ("clear", "clear"), ("clean the terminal", "clear"),
+    ("wipe the screen", "clear"), ("clear terminal", "clear"), ("clear the console", "clear"),
+    ("what is two plus two", "unknown"), ("tell me a joke", "unknown"), ("what's the weather like", "unknown"),
+    ("play some music", "unknown"), ("send an email to bob", "unknown"), ("how are you", "unknown"),
+]
+SEED_KEYS = frozenset((normalize_transcript(text), command) for text, command in SEED_EXAMPLES)
+
+# --- Rule-based argument extraction (mirrors the rules in the Gemini prompt) ---
+SPOKEN_SYMBOLS = {"dot": ".", "period": ".", "underscore": "_", "underline": "_", "slash": "/",
+                  "backslash": "\\", "dash": "-", "hyphen": "-"}
+NUMBER_UNITS = {"zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+                "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19}
+NUMBER_TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70,
+               "eighty": 80, "ninety": 90}
+# Words after which the rest of the utterance is the name ("a folder called X").
+NAME_MARKERS = {"called", "named", "titled", "name"}
+# Leading words that describe the action rather than the target.
+LEADING_COMMAND_WORDS = {
+    "go", "to", "into", "in", "change", "directory", "dir", "folder", "file", "make", "create", "new", "a", "an",
+    "the", "delete", "remove", "erase", "open", "enter", "switch", "move", "cd", "mkdir", "touch", "rm", "empty",
+}
+TYPE_NOUNS = {"directory", "folder", "file", "dir"}
+# Words that usually join several commands in one utterance ("make x and go into it"); those go to Gemini.
+MULTI_COMMAND_WORDS = {"and", "then", "also", "after", "afterwards"}
+PARENT_DIRECTORY_WORDS = {"back", "up", "parent", "up one level", "back one level", "one level up"}
+
+
+def words_to_numbers(words):
+    result = []
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in NUMBER_TENS:
+            value = NUMBER_TENS[word]
+            if i + 1 < len(words) and words[i + 1] in NUMBER_UNITS and NUMBER_UNITS[words[i + 1]] < 10:
+                value += NUMBER_UNITS[words[i + 1]]
+                i += 1
+            result.append(str(value))
+        elif word in NUMBER_UNITS:
+            result.append(str(NUMBER_UNITS[word]))
+        else:
+            result.append(word)
+        i += 1
+    return result
+
+
+def apply_spoken_symbols(words):
+    # "report dot txt" -> "report.txt": symbols glue their neighbours together without spaces.
+    argument = ""
+    glue_next = False
+    for word in words:
+        symbol = SPOKEN_SYMBOLS.get(word)
+        if symbol is not None:
+            argument = argument.rstrip() + symbol
+            glue_next = True
+        else:
+            argument += word if (glue_next or not argument) else f" {word}"
+            glue_next = False
+    return argument.strip()
+
+
+def extract_argument(transcribed_text, command):
+    if command not in COMMANDS_WITH_ARGUMENT:
+        return ""
+    words = normalize_transcript(transcribed_text).split()
+
+    marker_positions = [i for i, w in enumerate(words) if w in NAME_MARKERS]
+    if marker_positions:
+        words = words[marker_positions[-1] + 1:]
+    else:
+        leading = []
+        while words and words[0] in LEADING_COMMAND_WORDS:
+            leading.append(words.pop(0))
+        # "remove the old_stuff directory" -> "old_stuff"
+        if "the" in leading and len(words) > 1 and words[-1] in TYPE_NOUNS:
+            words = words[:-1]
+        if command == "rm -r" and len(words) > 3 and words[-3:] == ["and", "everything", "inside"]:
+            words = words[:-3]
+        if command == "rm -r" and len(words) > 4 and words[-4:] == ["and", "everything", "in", "it"]:
+            words = words[:-4]
+
+    if command == "cd" and " ".join(words) in PARENT_DIRECTORY_WORDS:
+        return ".."
+    return apply_spoken_symbols(words_to_numbers(words))
+
+
+# --- Hashed n-gram TF-IDF classifier ---
+def _hash_feature(feature, n_features):
+    return zlib.crc32(feature.encode("utf-8")) % n_features
+
+
+def extract_features(text, n_features):
+    normalized = normalize_transcript(text)
+    features = []
+    words = normalized.split()
+    features.extend(f"w:{w}" for w in words)
+    features.extend(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    padded = f" {normalized} "
+    for n in (3, 4):
+        features.extend(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+    return [_hash_feature(f, n_features) for f in features]
+
+
+class _SparseIndex:
+    # Examples as L2-normalized TF-IDF vectors in an inverted index: feature -> [(row, weight)].
+    # Append-only, so predict() reads it without the lock: it takes n_rows once and ignores rows
+    # added after that.
+    def __init__(self, idf, n_examples):
+        self.idf = idf                  # feature -> weight; features first seen by add() are weighted as seen once
+        self.n_examples = n_examples    # How many examples the IDF weights were computed over
+        self.postings = {}
+        self.row_labels = []            # Label index per row
+        self.labels = []
+        self.label_first_row = []       # A label only counts for readers that can see one of its rows
+        self._label_index = {}
+        self.n_rows = 0
+
+    def add(self, counts, label):
+        # counts: feature -> occurrences in the example. Writers hold the classifier's lock.
+        for feature in counts:
+            if feature not in self.idf:
+                self.idf[feature] = math.log((1 + self.n_rows + 1) / 2) + 1.0
+        weights = _weigh(counts, self.idf)
+        if label not in self._label_index:
+            self._label_index[label] = len(self.labels)
+            self.labels.append(label)
+            self.label_first_row.append(self.n_rows)
+        row = self.n_rows
+        self.row_labels.append(self._label_index[label])
+        for feature, weight in weights.items():
+            self.postings.setdefault(feature, []).append((row, weight))
+        self.n_rows = row + 1 # Last: readers that see the row see all of it
+
+
+def _weigh(counts, idf):
+    # Sublinear TF times IDF, L2-normalized; features without an IDF weight are dropped.
+    weights = {}
+    for feature, count in counts.items():
+        weight = math.log1p(count) * idf.get(feature, 0.0)
+        if weight:
+            weights[feature] = weight
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {feature: weight / norm for feature, weight in weights.items()} if norm else {}
+
+
+class LocalIntentClassifier:
+    # Gemini's decisions are kept deduplicated by (normalized text, command), at most max_history of
+    # them (oldest dropped first) on top of the seeds. Each one is added to the index as it is
+    # recorded; the IDF weights are recomputed over everything once the examples have grown by
+    # REFIT_GROWTH since the last fit, so a decision never costs a full refit.
+    REFIT_GROWTH = 0.25
+
+    def __init__(self, history_path=None, n_features=2 ** 14, temperature=12.0, max_history=5000):
+        self.history_path = history_path
+        self.n_features = n_features
+        self.temperature = temperature
+        self.max_history = max_history
+        self._history = []          # (text, command) from Gemini, oldest first, after the seeds
+        self._seen = set()          # Dedupe keys of the seeds and self._history
+        self._recorded = 0          # Examples ever added to self._history; fit() catches up from it
+        self._index = None          # _SparseIndex, replaced as a whole under the lock
+        self._lock = threading.Lock()
+        self._seen.update(SEED_KEYS)
+        for text, command in self._load_history():
+            self._seen.add(self._key(text, command))
+            self._history.append((text, command))
+
+    @staticmethod
+    def _key(text, command):
+        return normalize_transcript(text), command
+
+    def _load_history(self):
+        # The newest max_history distinct decisions. A file holding more than twice that many lines
+        # is rewritten with just those, so it doesn't grow without bound.
+        records = {}
+        line_count = 0
+        if not self.history_path or not os.path.exists(self.history_path):
+            return []
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line_count += 1
+                    try:
+                        record = json.loads(line)
+                        key = self._key(record["text"], record["command"])
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue  # Skip partially written or malformed lines
+                    if key in SEED_KEYS:
+                        continue
+                    records.pop(key, None) # Re-recorded: moves to the newest position
+                    records[key] = (record["text"], record["command"], line if line.endswith("\n") else line + "\n")
+        except OSError as e:
+            print(f"Warning: could not read intent history '{self.history_path}': {e}")
+            return []
+        kept = list(records.values())[-self.max_history:]
+        if line_count > 2 * self.max_history:
+            self._rewrite_history([line for _, _, line in kept])
+        return [(text, command) for text, command, _ in kept]
+
+    def _rewrite_history(self, lines):
+        # Decisions another process appends between the read and the replace are lost; they are
+        # only training data, and Gemini makes them again.
+        tmp_path = f"{self.history_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.history_path)
+        except OSError as e:
+            print(f"Warning: could not compact intent history '{self.history_path}': {e}")
+
+    def record_decision(self, transcribed_text, result):
+        # Gemini's answers become training data, indexed at once.
+        command = result.get("command")
+        if not transcribed_text or not command or result.get("error"):
+            return
+        if command == "run":
+            return # A program's command line can't be extracted locally; those always go to Gemini
+        key = self._key(transcribed_text, command)
+        with self._lock:
+            if key in self._seen:
+                return # Already an example; the history file doesn't need it twice either
+            self._seen.add(key)
+            self._history.append((transcribed_text, command))
+            self._recorded += 1
+            index = self._index
+            if index is not None:
+                index.add(self._count_features(transcribed_text), command)
+            refit = index is not None and (index.n_rows > index.n_examples * (1 + self.REFIT_GROWTH)
+                                           or len(self._history) > self.max_history * (1 + self.REFIT_GROWTH))
+        if self.history_path:
+            record = {"text": transcribed_text, "command": command, "argument": result.get("argument") or "",
+                      "ts": time.time()}
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.history_path)), exist_ok=True)
+                with open(self.history_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"Warning: could not append to intent history '{self.history_path}': {e}")
+        if refit:
+            self.fit()
+
+    def _count_features(self, text):
+        counts = {}
+        for feature in extract_features(text, self.n_features):
+            counts[feature] = counts.get(feature, 0) + 1
+        return counts
+
+    @property
+    def labels(self):
+        index = self._index
+        return list(index.labels) if index else []
+
+    def fit(self, examples=None):
+        # Builds the index over the seeds and the history (or the given examples) and publishes it.
+        with self._lock:
+            if examples is None:
+                if len(self._history) > self.max_history:
+                    del self._history[:len(self._history) - self.max_history]
+                    self._seen = set(SEED_KEYS).union(self._key(text, command) for text, command in self._history)
+                recorded = self._recorded
+                examples = SEED_EXAMPLES + self._history
+                catch_up = True
+            else:
+                catch_up = False
+        counts = [self._count_features(text) for text, _ in examples]
+        df = {}
+        for row in counts:
+            for feature in row:
+                df[feature] = df.get(feature, 0) + 1
+        idf = {feature: math.log((1 + len(examples)) / (1 + n)) + 1.0 for feature, n in df.items()}
+        index = _SparseIndex(idf, len(examples))
+        for row, (_, label) in zip(counts, examples):
+            index.add(row, label)
+        with self._lock:
+            if catch_up: # Decisions recorded while this fit ran
+                missed = self._recorded - recorded
+                for text, command in (self._history[-missed:] if missed else []):
+                    index.add(self._count_features(text), command)
+            self._index = index
+        return index
+
+    def predict(self, transcribed_text):
+        index = self._index or self.fit()
+        n_rows = index.n_rows # One snapshot for the whole prediction
+        query = _weigh(self._count_features(transcribed_text), index.idf)
+        if not query:
+            return {"command": "unknown", "argument": "", "confidence": 0.0}
+        similarities = {}
+        for feature, query_weight in query.items():
+            for row, weight in index.postings.get(feature, ()):
+                if row < n_rows:
+                    similarities[row] = similarities.get(row, 0.0) + query_weight * weight
+
+        # Best-matching example per class, then a softmax over classes for a confidence score.
+        # Classes with no example sharing a feature score 0; classes added after the snapshot don't count.
+        visible = [i for i, first_row in enumerate(list(index.label_first_row)) if first_row < n_rows]
+        class_scores = np.zeros(len(visible))
+        position = {label: i for i, label in enumerate(visible)}
+        for row, similarity in similarities.items():
+            i = position[index.row_labels[row]]
+            class_scores[i] = max(class_scores[i], similarity)
+        exp_scores = np.exp(self.temperature * (class_scores - class_scores.max()))
+        probabilities = exp_scores / exp_scores.sum()
+        best = int(np.argmax(probabilities))
+
+        command = index.labels[visible[best]]
+        confidence = float(probabilities[best])
+        argument = extract_argument(transcribed_text, command)
+        if command in COMMANDS_WITH_ARGUMENT and not argument:
+            confidence = 0.0  # A command without its target needs Gemini to work out what was meant
+        if MULTI_COMMAND_WORDS.intersection(transcribed_text.lower().replace(",", " ").split()):
+            confidence = 0.0  # Likely several commands, which the classifier can't split
+        return {"command": command, "argument": argument, "confidence": confidence}
+
+
+# --- Local resolution with Gemini fallback and accuracy tracking ---
+class LocalIntentEngine:
+    def __init__(self, classifier, threshold=0.75, audit_rate=0.1):
+        self.classifier = classifier
+        self.threshold = threshold
+        self.audit_rate = audit_rate  # Fraction of confident local answers also checked against Gemini
+        self.requests = 0
+        self.resolved_locally = 0
+        self.compared = 0
+        self.agreed = 0
+        self.fallbacks = 0  # Answered locally because Gemini was unavailable
+        self._lock = threading.Lock()
+
+    def resolve(self, transcribed_text, ask_llm):
+        prediction = self.classifier.predict(transcribed_text)
+        confident = prediction["confidence"] >= self.threshold
+        with self._lock:
+            self.requests += 1
+            if confident:
+                self.resolved_locally += 1
+        local_result = {"commands": [{"command": prediction["command"], "argument": prediction["argument"]}],
+                        "source": "local", "confidence": prediction["confidence"]}
+        if confident and random.random() >= self.audit_rate:
+            return local_result
+
+        llm_result = ask_llm(transcribed_text)
+        llm_commands = llm_result.get("commands") or []
+        # Only single-command answers are training examples; the classifier predicts one label.
+        if not llm_result.get("error") and len(llm_commands) == 1:
+            llm_command = llm_commands[0]
+            self.classifier.record_decision(transcribed_text, llm_command)
+            with self._lock:
+                self.compared += 1
+                if (llm_command.get("command") == prediction["command"]
+                        and (llm_command.get("argument") or "") == prediction["argument"]):
+                    self.agreed += 1
+        if confident and llm_result.get("error"):
+            # The audit call failed; the local answer is still good enough to use.
+            return local_result
+        if llm_result.get("unavailable") and prediction["command"] != "unknown" and prediction["confidence"] > 0:
+            # Gemini is down (timeouts, open circuit): fall back to the best local guess.
+            with self._lock:
+                self.fallbacks += 1
+            local_result["fallback"] = True
+            return local_result
+        return llm_result
+
+    def describe(self):
+        with self._lock:
+            local_pct = (self.resolved_locally / self.requests * 100) if self.requests else 0.0
+            agreement_pct = (self.agreed / self.compared * 100) if self.compared else 0.0
+            return (f"Local intents: {self.resolved_locally}/{self.requests} resolved locally ({local_pct:.1f}%), "
+                    f"agreement with Gemini {self.agreed}/{self.compared} ({agreement_pct:.1f}%), "
+                    f"{self.fallbacks} answered locally while Gemini was unavailable, "
+                    f"threshold {self.threshold:.2f}")
+
+
+def evaluate_history(history_path, folds=5, threshold=0.75):
+    # Offline report: k-fold over the logged Gemini decisions, seeds always in the training set.
+    records = []
+    if os.path.exists(history_path):
+        with open(history_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records.append((record["text"], record["command"], record.get("argument") or ""))
+                except (ValueError, KeyError, TypeError):
+                    continue
+    if not records:
+        return "No intent history to evaluate."
+    classifier = LocalIntentClassifier()
+    random.Random(0).shuffle(records)
+    local = correct = 0
+    for fold in range(folds):
+        test = records[fold::folds]
+        train = [(t, c) for i, (t, c, _) in enumerate(records) if i % folds != fold]
+        classifier.fit(SEED_EXAMPLES + train)
+        for text, command, argument in test:
+            prediction = classifier.predict(text)
+            if prediction["confidence"] >= threshold:
+                local += 1
+                if prediction["command"] == command and prediction["argument"] == argument:
+                    correct += 1
+    total = len(records)
+    accuracy = (correct / local * 100) if local else 0.0
+    return (f"{total} logged utterances: {local} ({local / total * 100:.1f}%) would resolve locally at "
+            f"threshold {threshold:.2f}, {correct} of those ({accuracy:.1f}%) match Gemini exactly.")
+
+
+if __name__ == "__main__":
+    default_path = os.path.join(os.getenv("VOICEOS_HOME", os.path.join(os.path.expanduser("~"), ".voiceos")),
+                                "intent_history.jsonl")
+    path = sys.argv[1] if len(sys.argv) > 1 else default_path
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.75
+    print(evaluate_history(path, threshold=threshold))
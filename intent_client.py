@@ -0,0 +1,247 @@
+import json
+import time
+import random
+import asyncio
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TransportError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# --- Transports ---
+# A transport turns a prompt into the model's raw response text. It is a plain blocking call that
+# must honour `timeout`; the client runs it on its own thread pool.
+class Transport:
+    name = "transport"
+
+    def generate(self, prompt, timeout):
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+
+class GeminiTransport(Transport):
+    name = "gemini"
+    # google.api_core exceptions that will fail the same way if retried.
+    NON_RETRYABLE_ERRORS = {"InvalidArgument", "PermissionDenied", "Unauthenticated", "NotFound",
+                            "FailedPrecondition"}
+
+    def __init__(self, api_key, model_name="gemini-1.5-flash-latest"):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        # JSON mode: the model answers with bare JSON instead of a markdown code block.
+        self.model = genai.GenerativeModel(model_name,
+                                           generation_config={"response_mime_type": "application/json"})
+        self.model_name = self.model.model_name
+
+    def generate(self, prompt, timeout):
+        try:
+            response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        except Exception as e:
+            raise TransportError(f"{type(e).__name__}: {e}",
+                                 retryable=type(e).__name__ not in self.NON_RETRYABLE_ERRORS)
+        feedback = getattr(response, "prompt_feedback", None)
+        if feedback is not None and getattr(feedback, "block_reason", None):
+            raise TransportError(f"Prompt blocked: {feedback.block_reason}", retryable=False)
+        try:
+            return response.text
+        except Exception as e:  # No candidates (e.g. safety filtered)
+            raise TransportError(f"Gemini returned no text: {e}", retryable=False)
+
+    def describe(self):
+        return f"gemini ({self.model_name})"
+
+
+class HTTPTransport(Transport):
+    # Speaks the tiny protocol of fake_llm_server.py: POST {"prompt": ...} -> {"text": ...}.
+    name = "http"
+
+    def __init__(self, url):
+        self.url = url
+
+    def generate(self, prompt, timeout):
+        request = urllib.request.Request(self.url, data=json.dumps({"prompt": prompt}).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read().decode("utf-8"))["text"]
+        except urllib.error.HTTPError as e:
+            raise TransportError(f"HTTP {e.code}", retryable=e.code == 429 or e.code >= 500)
+        except (urllib.error.URLError, OSError) as e:
+            raise TransportError(f"Connection error: {getattr(e, 'reason', e)}")
+        except (ValueError, KeyError) as e:
+            raise TransportError(f"Bad response from {self.url}: {e}", retryable=False)
+
+    def describe(self):
+        return f"http ({self.url})"
+
+
+# --- Circuit breaker ---
+# After `failure_threshold` consecutive failures the circuit opens and requests fail immediately
+# (the caller falls back to local handling). After `reset_seconds` one trial request is let through;
+# its outcome closes or re-opens the circuit.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+# --- Client ---
+# Every request gets an overall deadline. Within it, retryable failures are retried with jittered
+# exponential backoff, and an attempt that is slower than `hedge_after` gets a duplicate request;
+# whichever answers first wins. The event loop runs on a background thread so the blocking voice
+# pipeline can call generate() while async callers can await generate_async().
+class IntentClient:
+    def __init__(self, transport, deadline=8.0, attempt_timeout=4.0, max_retries=2, backoff=0.2,
+                 hedge_after=None, breaker=None, max_workers=8):
+        self.transport = transport
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after  # Seconds; None disables hedging
+        self.breaker = breaker or CircuitBreaker()
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="llm-loop")
+        self._thread.start()
+
+    def _count(self, field, amount=1):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def generate(self, prompt):
+        # Blocking entry point; raises TransportError, CircuitOpenError or asyncio.TimeoutError.
+        return asyncio.run_coroutine_threadsafe(self.generate_async(prompt), self._loop).result()
+
+    async def generate_async(self, prompt):
+        self._count("requests")
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"{self.transport.name} circuit open after repeated failures")
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self.deadline
+        attempt = 0
+        while True:
+            remaining = give_up_at - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                text = await asyncio.wait_for(self._hedged_attempt(prompt, min(self.attempt_timeout, remaining)),
+                                              timeout=remaining)
+                self.breaker.record_success()
+                return text
+            except (TransportError, asyncio.TimeoutError) as e:
+                retryable = getattr(e, "retryable", True)
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if not retryable or attempt >= self.max_retries or loop.time() + delay >= give_up_at:
+                    self._count("failures")
+                    self.breaker.record_failure()
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise TransportError(f"No response within {self.deadline:.1f}s deadline")
+                    raise
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(delay)
+
+    async def _hedged_attempt(self, prompt, timeout):
+        loop = asyncio.get_running_loop()
+        primary = loop.run_in_executor(self._executor, self.transport.generate, prompt, timeout)
+        if self.hedge_after is None or self.hedge_after >= timeout:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self._count("hedges")
+        hedge = loop.run_in_executor(self._executor, self.transport.generate, prompt,
+                                     max(0.1, timeout - self.hedge_after))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    for other in pending:
+                        # The loser keeps its worker until its own timeout; just drop its result.
+                        other.add_done_callback(lambda f: f.exception())
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        with self._stats_lock:
+            return {"transport": self.transport.describe(), "requests": self.requests,
+                    "failures": self.failures, "retries": self.retries, "hedges": self.hedges,
+                    "hedge_wins": self.hedge_wins, "rejected": self.rejected,
+                    "circuit": self.breaker.state, "circuit_trips": self.breaker.trips}
+
+    def describe(self):
+        s = self.stats()
+        hedging = f"hedge after {self.hedge_after:.2f}s" if self.hedge_after is not None else "hedging off"
+        return (f"AI client: {s['transport']}, {s['requests']} requests, {s['failures']} failed, "
+                f"{s['retries']} retries, {s['hedges']} hedged ({s['hedge_wins']} won by the hedge), "
+                f"{s['rejected']} rejected by open circuit; circuit {s['circuit']} "
+                f"(tripped {s['circuit_trips']}x); deadline {self.deadline:.1f}s, {hedging}")
+
+
+def create_transport(api_key=None, url=None, model_name="gemini-1.5-flash-latest"):
+    # A URL selects the local stand-in server (fake_llm_server.py); otherwise Gemini.
+    if url:
+        return HTTPTransport(url)
+    if not api_key:
+        raise TransportError("GEMINI_API_KEY not set", retryable=False)
+    return GeminiTransport(api_key, model_name)
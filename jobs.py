@@ -0,0 +1,100 @@
+import time
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, command, on_output=None, on_progress=None, output_backlog=None):
+        self.id = job_id
+        self.command = command
+        self.started_at = time.monotonic()
+        self.progress = ""
+        self.error = None  # Exception that ended the job, if any
+        self.cancel_requests = 0 # Ctrl+C presses; external commands escalate on repeats
+        self._cancel_event = threading.Event()
+        self._on_output = on_output
+        self._on_progress = on_progress
+        self._output_backlog = output_backlog # Returns how much written output is not shown yet
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_requests += 1
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        # Long-running commands call this between units of work.
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def write(self, string, tag="output"):
+        if self._on_output:
+            self._on_output(string, tag)
+
+    def wait_for_output_room(self, max_backlog, poll=0.01):
+        # Backpressure for commands that can produce output faster than it is displayed: blocks
+        # while the consumer is more than max_backlog characters behind. Returns early on cancel.
+        if self._output_backlog is None:
+            return
+        while self._output_backlog() > max_backlog and not self._cancel_event.wait(poll):
+            pass
+
+    def report_progress(self, message):
+        self.progress = message
+        if self._on_progress:
+            self._on_progress(self, message)
+
+
+# --- Worker pool for shell commands ---
+# Commands run here instead of on the Tk mainloop so a slow rm -r or ls never freezes the window.
+# Jobs that may run for as long as they like (external programs such as tail -f or ping) get a
+# thread of their own instead, so they never hold a pool worker that other tabs' commands wait for.
+class JobRunner:
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._ids = itertools.count(1)
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def submit(self, command, func, on_done, on_output=None, on_progress=None, output_backlog=None,
+               open_ended=False):
+        # func(job) returns the command's output string; on_done(job, output) runs on the worker.
+        job = Job(next(self._ids), command, on_output, on_progress, output_backlog)
+        with self._lock:
+            self._running[job.id] = job
+
+        def run():
+            try:
+                output = func(job)
+            except JobCancelled:
+                output = f"'{command}' cancelled."
+            except Exception as e:
+                job.error = e
+                output = f"An unexpected error occurred running '{command}': {e}"
+            finally:
+                with self._lock:
+                    self._running.pop(job.id, None)
+            on_done(job, output)
+
+        if open_ended:
+            threading.Thread(target=run, daemon=True, name=f"job-{job.id}").start()
+        else:
+            self._executor.submit(run)
+        return job
+
+    def running(self):
+        with self._lock:
+            return list(self._running.values())
+
+    def cancel_all(self):
+        jobs = self.running()
+        for job in jobs:
+            job.cancel()
+        return jobs
@@ -0,0 +1,217 @@
+import os
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+# --- HDR-style latency histogram ---
+# Values are recorded in microseconds into log-linear buckets: exact below 2**SUB_BUCKET_BITS,
+# then every power-of-two range is split into 2**(SUB_BUCKET_BITS - 1) equal buckets, so any value
+# is stored with under 1% relative error. Recording is one dict increment; memory grows with the
+# number of distinct buckets (bounded by the value range), not with the number of samples.
+class LatencyHistogram:
+    SUB_BUCKET_BITS = 8
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    HALF = SUB_BUCKETS >> 1
+
+    def __init__(self):
+        self.counts = {}  # bucket index -> samples
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    @classmethod
+    def bucket_index(cls, value_us):
+        if value_us < cls.SUB_BUCKETS:
+            return value_us
+        shift = value_us.bit_length() - cls.SUB_BUCKET_BITS
+        return cls.SUB_BUCKETS + (shift - 1) * cls.HALF + ((value_us >> shift) - cls.HALF)
+
+    @classmethod
+    def bucket_value(cls, index):
+        # Midpoint of the bucket, the value reported for percentiles.
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift = (index - cls.SUB_BUCKETS) // cls.HALF + 1
+        top = (index - cls.SUB_BUCKETS) % cls.HALF + cls.HALF
+        return (top << shift) + (1 << shift) // 2
+
+    def record(self, seconds):
+        value_us = max(0, int(seconds * 1_000_000))
+        index = self.bucket_index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        self.max_us = max(self.max_us, value_us)
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+
+    def percentile(self, p):
+        # Returns microseconds.
+        if not self.count:
+            return 0
+        rank = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_value(index), self.max_us)
+        return self.max_us
+
+    def summary(self):
+        mean_us = self.total_us / self.count if self.count else 0
+        return {"count": self.count, "mean_ms": mean_us / 1000, "min_ms": (self.min_us or 0) / 1000,
+                "p50_ms": self.percentile(50) / 1000, "p95_ms": self.percentile(95) / 1000,
+                "p99_ms": self.percentile(99) / 1000, "max_ms": self.max_us / 1000}
+
+
+# --- Per-stage timings and counters ---
+# One histogram per stage name ("asr", "llm", "render", ...) plus named counters (cache hits,
+# errors). Safe to call from any thread.
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def increment(self, counter, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return {"started_at": self.started_at, "exported_at": time.time(),
+                    "stages": {name: h.summary() for name, h in sorted(self._histograms.items())},
+                    "counters": dict(sorted(self._counters.items()))}
+
+    def export(self, path):
+        # Format follows the extension: .csv gets one row per stage (counters as count-only rows),
+        # anything else is JSON.
+        snapshot = self.snapshot()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            if path.lower().endswith(".csv"):
+                fields = ["name", "count", "mean_ms", "min_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                for name, summary in snapshot["stages"].items():
+                    writer.writerow({"name": name, **{k: round(v, 3) for k, v in summary.items()}})
+                for name, value in snapshot["counters"].items():
+                    writer.writerow({"name": name, "count": value})
+            else:
+                json.dump(snapshot, f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def describe(self):
+        snapshot = self.snapshot()
+        if not snapshot["stages"] and not snapshot["counters"]:
+            return "No metrics recorded yet."
+        lines = [f"{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, s in snapshot["stages"].items():
+            lines.append(f"{name:<22}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+                         f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+        if snapshot["counters"]:
+            lines.append("  ".join(f"{name}={value}" for name, value in snapshot["counters"].items()))
+        return "\n".join(lines)
+
+    def status_summary(self, stages):
+        # Compact p95 line for the status bar, e.g. "p95 asr 820ms | llm 640ms".
+        snapshot = self.snapshot()["stages"]
+        parts = [f"{name} {snapshot[name]['p95_ms']:.0f}ms" for name in stages if name in snapshot]
+        return f"p95 {' | '.join(parts)}" if parts else ""
+
+
+# --- Startup profile ---
+# Wall-clock phases of application start (imports, engine, window, background warm-up) and
+# milestones such as the first prompt, as offsets from `origin`. Phases are also recorded into
+# `metrics` as "startup.<phase>" so `stats` shows them.
+class StartupProfile:
+    def __init__(self, origin=None, metrics=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.origin_epoch = time.time() - (time.perf_counter() - self.origin)
+        self.metrics = metrics
+        self.phases = []     # (name, start offset, seconds, thread name)
+        self.milestones = {} # name -> offset; only the first mark counts
+        self._lock = threading.Lock()
+
+    def attach(self, metrics):
+        # Phases recorded before the metrics existed (imports, engine) are copied in.
+        with self._lock:
+            self.metrics = metrics
+            phases = list(self.phases)
+        for name, _start, seconds, _thread in phases:
+            metrics.record(f"startup.{name}", seconds)
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def phase(self, name):
+        start = self.elapsed()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.elapsed() - start)
+
+    def record(self, name, start, seconds):
+        # For phases that can't be wrapped in phase(), e.g. the imports before the profile existed.
+        with self._lock:
+            self.phases.append((name, start, seconds, threading.current_thread().name))
+        if self.metrics is not None:
+            self.metrics.record(f"startup.{name}", seconds)
+
+    def mark(self, name):
+        with self._lock:
+            if name in self.milestones:
+                return False
+            self.milestones[name] = self.elapsed()
+            return True
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "origin_epoch": self.origin_epoch,
+                "phases": [{"name": name, "start_ms": round(start * 1000, 3), "ms": round(seconds * 1000, 3),
+                            "thread": thread} for name, start, seconds, thread in self.phases],
+                "milestones": {name: round(offset * 1000, 3) for name, offset in self.milestones.items()},
+            }
+
+    def describe(self):
+        profile = self.to_dict()
+        lines = [f"{'phase':<22}{'start ms':>10}{'ms':>10}  thread"]
+        for p in sorted(profile["phases"], key=lambda p: p["start_ms"]):
+            lines.append(f"{p['name']:<22}{p['start_ms']:>10.1f}{p['ms']:>10.1f}  {p['thread']}")
+        for name, offset in sorted(profile["milestones"].items(), key=lambda item: item[1]):
+            lines.append(f"{'@ ' + name:<22}{offset:>10.1f}")
+        return "\n".join(lines)
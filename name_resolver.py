@@ -0,0 +1,281 @@
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+
+# --- Spoken name resolution ---
+# The AI turns "go to my project folder" into the literal argument "my project folder". When no
+# entry has that exact name, the spoken name is matched against the entries of the directory it
+# refers to, so `my_project-folder`, `MyProjectFolder` or `my-projekt-folder` are found without
+# another voice round trip. Each name is scored on
+#   normalized tokens:  case, separators, camelCase, "dot"/"underscore" and number words removed
+#   edit distance:      between the normalized names, and token by token
+#   phonetic keys:      a Soundex-style code of each token, so "foto" matches "photo"
+# A clear winner is used automatically; close runners-up are offered as a choice. For commands
+# that delete (resolve(..., cautious=True)) only normalized-exact matches are used automatically;
+# a fuzzy or phonetic one ("notes" for `nodes`) is always offered as a choice.
+
+AUTO_SCORE = 0.8       # A match at least this good is used without asking...
+AUTO_MARGIN = 0.1      # ...if the runner-up scores at least this much lower
+EXACT_SCORE = 0.95     # Normalized exact (or exact but for the extension); all destructive commands auto-apply
+CHOICE_SCORE = 0.55    # Matches offered as a choice when nothing is certain
+MAX_CHOICES = 5
+SCAN_ALL_BELOW = 500   # Smaller directories are scored exhaustively; larger ones via the n-gram index
+SHORTLIST = 100        # Entries scored in detail after the index lookup
+
+SPOKEN_SEPARATORS = {"dot", "point", "underscore", "dash", "hyphen", "minus", "space"}
+NUMBER_WORDS = {"zero": "0", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+                "seven": "7", "eight": "8", "nine": "9", "ten": "10", "eleven": "11", "twelve": "12",
+                "first": "1", "second": "2", "third": "3"}
+TOKEN_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+|[^\W\d_]+")
+PHONETIC_CODES = {}
+for _letters, _code in [("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")]:
+    for _letter in _letters:
+        PHONETIC_CODES[_letter] = _code
+
+
+def normalize_tokens(name):
+    # "My_Project-folder.TXT" -> ["my", "project", "folder", "txt"]; spoken "report dot t x t two"
+    # -> ["report", "t", "x", "t", "2"]. Single letters are kept, and joined by compact_key.
+    tokens = []
+    for token in TOKEN_PATTERN.findall(name):
+        token = token.lower()
+        if token in SPOKEN_SEPARATORS:
+            continue
+        if token.isdigit():
+            token = token.lstrip("0") or "0" # "file_007" is "file 7"
+        tokens.append(NUMBER_WORDS.get(token, token))
+    return tokens
+
+def compact_key(tokens):
+    return "".join(tokens)
+
+def phonetic_key(token):
+    # Soundex-like but untruncated: consonant classes, vowels dropped after the first letter,
+    # repeats collapsed. Digits are kept as they are.
+    if token.isdigit():
+        return token
+    token = token.replace("ph", "f").replace("ck", "k").replace("wr", "r").replace("kn", "n")
+    key = "0" if token[0] in "aeiouy" else ""
+    last = ""
+    for char in token:
+        code = PHONETIC_CODES.get(char, "")
+        if code and code != last:
+            key += code
+        if char not in "hw": # h and w don't separate repeated codes, as in Soundex
+            last = code
+    return key or token
+
+def edit_distance(a, b, limit=None):
+    # Levenshtein distance; returns limit + 1 as soon as the distance is known to exceed limit.
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    longest = max(len(a), len(b))
+    return 1.0 - edit_distance(a, b, limit=longest // 2) / longest
+
+def ngrams(key, n=3):
+    padded = f" {key} "
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+class NameIndex:
+    # Normalized forms of one directory listing. The n-gram index, used to shortlist entries in
+    # large directories, is only built by the first lookup that isn't a normalized exact match.
+    def __init__(self, listing):
+        self.listing = listing
+        self.entries = {}   # name -> (tokens, compact key, compact key without extension)
+        self.by_compact = {}
+        self._by_gram = None
+        self._phonetics = {}
+        for name in listing.names:
+            tokens = normalize_tokens(name)
+            if not tokens:
+                continue
+            compact = compact_key(tokens)
+            extension = os.path.splitext(name)[1]
+            extension_tokens = len(normalize_tokens(extension)) if extension != name else 0
+            stem_compact = compact_key(tokens[:-extension_tokens]) if 0 < extension_tokens < len(tokens) else compact
+            self.entries[name] = (tokens, compact, stem_compact)
+            self.by_compact.setdefault(compact, []).append(name)
+            if stem_compact != compact:
+                self.by_compact.setdefault(stem_compact, []).append(name)
+
+    def by_gram(self):
+        if self._by_gram is None:
+            by_gram = {}
+            for name, (_, compact, _) in self.entries.items():
+                for gram in ngrams(compact):
+                    postings = by_gram.get(gram)
+                    if postings is None:
+                        postings = by_gram[gram] = []
+                    postings.append(name)
+            self._by_gram = by_gram
+        return self._by_gram
+
+    def phonetics(self, name):
+        keys = self._phonetics.get(name)
+        if keys is None:
+            keys = self._phonetics[name] = [phonetic_key(token) for token in self.entries[name][0]]
+        return keys
+
+    def candidates(self, compact, allowed):
+        exact = [name for name in self.by_compact.get(compact, ()) if allowed(name)]
+        if len(exact) == 1:
+            return exact # Nothing else can score as well; skip the fuzzy search
+        if len(self.entries) < SCAN_ALL_BELOW:
+            return [name for name in self.entries if allowed(name)]
+        # N-grams shared by a large part of the directory ("fil" among file_00001...) say little
+        # and cost the most to count, so only the rarer ones vote.
+        by_gram = self.by_gram()
+        postings = sorted((by_gram.get(gram, ()) for gram in ngrams(compact)), key=len)
+        common = max(SHORTLIST, len(self.entries) // 8)
+        shared = Counter()
+        for names in [posting for posting in postings if len(posting) <= common] or postings[:1]:
+            shared.update(names)
+        found = set(exact)
+        for name, _ in shared.most_common():
+            if len(found) >= SHORTLIST:
+                break
+            if allowed(name):
+                found.add(name)
+        return list(found)
+
+    def score(self, tokens, compact, phonetics, name):
+        entry_tokens, entry_compact, stem_compact = self.entries[name]
+        if compact == entry_compact:
+            return 1.0
+        if compact == stem_compact:
+            return 0.95 # Extension left out: "remove report" for report.txt
+        entry_phonetics = self.phonetics(name)
+        character = max(similarity(compact, entry_compact), similarity(compact, stem_compact))
+        if "".join(phonetics) == "".join(entry_phonetics):
+            # Sounds the same; consonant classes alone are loose ("cat" ~ "cod"), so spelling counts too.
+            return 0.7 + 0.2 * character
+        # Tokens matched one to one: exactly, with one typo in a longer word, or by sound.
+        unmatched = list(zip(entry_tokens, entry_phonetics))
+        matched = 0.0
+        for token, phonetic in zip(tokens, phonetics):
+            for i, (entry_token, entry_phonetic) in enumerate(unmatched):
+                if token == entry_token:
+                    weight = 1.0
+                elif min(len(token), len(entry_token)) >= 4 and edit_distance(token, entry_token, 1) <= 1:
+                    weight = 0.9
+                elif phonetic == entry_phonetic:
+                    weight = 0.75
+                else:
+                    continue
+                matched += weight
+                del unmatched[i]
+                break
+        token_score = 2 * matched / (len(tokens) + len(entry_tokens))
+        return max(character, 0.95 * token_score)
+
+    def match(self, spoken, kind="any"):
+        # [(score, name)] best first. kind: "dir", "file" (not a directory) or "any".
+        tokens = normalize_tokens(spoken)
+        if not tokens:
+            return []
+        compact = compact_key(tokens)
+        phonetics = [phonetic_key(token) for token in tokens]
+        hidden = spoken.startswith(".")
+        is_dir = self.listing.is_dir
+
+        def allowed(name):
+            if name.startswith(".") and not hidden:
+                return False
+            return kind == "any" or is_dir[name] == (kind == "dir")
+
+        scored = []
+        for name in self.candidates(compact, allowed):
+            score = self.score(tokens, compact, phonetics, name)
+            if score >= CHOICE_SCORE:
+                scored.append((score, name))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored
+
+
+class Resolution:
+    def __init__(self, status, path, choices=None, score=1.0):
+        self.status = status          # "exact", "resolved", "ambiguous" or "none"
+        self.path = path              # Path to use ("resolved"), or the spoken one
+        self.choices = choices or []  # Candidate paths when "ambiguous"
+        self.score = score
+
+
+class NameResolver:
+    # Indexes are cached per directory and rebuilt only when the DirectoryCache listing they were
+    # built from is replaced, i.e. when the directory has changed.
+    def __init__(self, dir_cache, max_indexes=16):
+        self.dir_cache = dir_cache
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict() # Absolute path -> NameIndex
+        self._lock = threading.Lock()
+
+    def index(self, directory):
+        path = os.path.abspath(directory)
+        listing = self.dir_cache.listing(path)
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is not None and index.listing is listing:
+                self._indexes.move_to_end(path)
+                return index
+        index = NameIndex(listing)
+        with self._lock:
+            self._indexes[path] = index
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def resolve(self, spoken, kind="any", cwd=None, cautious=False):
+        # Resolves a spoken path one component at a time; components that exist are kept as they
+        # are. Only the last component is matched against `kind`, the others must be directories.
+        # Relative paths are looked up in cwd (default: the process cwd) and returned relative.
+        # cautious: only normalized-exact matches are resolved, anything fuzzier is a choice.
+        base = cwd or ""
+        expanded = os.path.expanduser(spoken)
+        if not spoken or os.path.lexists(os.path.join(base, expanded)):
+            return Resolution("exact", spoken)
+        resolved = os.sep if os.path.isabs(expanded) else ""
+        parts = [part for part in expanded.split(os.sep) if part]
+        worst = 1.0
+        for i, part in enumerate(parts):
+            candidate = os.path.join(resolved, part) if resolved else part
+            if part in ("", ".", "..") or os.path.lexists(os.path.join(base, candidate)):
+                resolved = candidate
+                continue
+            last = i == len(parts) - 1
+            try:
+                matches = self.index(os.path.join(base, resolved) or ".").match(part, kind if last else "dir")
+            except OSError:
+                return Resolution("none", spoken, score=0.0)
+            rest = parts[i + 1:]
+            if not matches:
+                return Resolution("none", spoken, score=0.0)
+            best_score, best = matches[0]
+            runner_up = matches[1][0] if len(matches) > 1 else 0.0
+            # A normalized exact match (or exact but for the extension) wins unless it has a twin.
+            decisive = best_score >= EXACT_SCORE > runner_up
+            if not decisive and (cautious or best_score < AUTO_SCORE or best_score - runner_up < AUTO_MARGIN):
+                choices = [os.path.join(resolved, name, *rest) if resolved else os.path.join(name, *rest)
+                           for _, name in matches[:MAX_CHOICES]]
+                return Resolution("ambiguous", spoken, choices, best_score)
+            worst = min(worst, best_score)
+            resolved = os.path.join(resolved, best) if resolved else best
+        return Resolution("resolved", resolved, score=worst)
@@ -0,0 +1,137 @@
+import time
+import queue
+import threading
+import itertools
+
+
+class PipelineItem:
+    def __init__(self, seq, payload):
+        self.seq = seq
+        self.payload = payload
+        self.submitted_at = time.monotonic()
+        self.queued_at = self.submitted_at  # When the item entered its current stage's queue
+
+
+class PipelineStage:
+    def __init__(self, name, func, maxsize):
+        self.name = name
+        self.func = func
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.thread = None
+
+
+# --- Staged pipeline ---
+# Each stage runs on its own worker thread and hands its result to the next stage through a
+# bounded queue, so stage N can work on one utterance while stage N+1 handles the previous one.
+# One worker per stage and FIFO queues keep commands in the order they were spoken; a full queue
+# blocks (or rejects) the producer, which is the backpressure. A stage function returns None to
+# drop the item (e.g. speech that wasn't understood).
+class Pipeline:
+    def __init__(self, stages, maxsize=4, on_error=None, on_complete=None, metrics=None):
+        self.stages = [PipelineStage(name, func, maxsize) for name, func in stages]
+        self.on_error = on_error        # on_error(stage_name, item, exception)
+        self.on_complete = on_complete  # on_complete(item, latency_seconds)
+        self.metrics = metrics          # Optional metrics.Metrics: per-stage and queue-wait timings
+        self.completed = 0
+        self.started_at = None
+        self._seq = itertools.count(1)
+        self._cancelled = set()
+        self._cancel_before = 0  # Items with a lower sequence number were cancelled in bulk
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.started_at is not None:
+            return
+        self.started_at = time.monotonic()
+        for index, stage in enumerate(self.stages):
+            stage.thread = threading.Thread(target=self._worker, args=(index,), daemon=True,
+                                            name=f"pipeline-{stage.name}")
+            stage.thread.start()
+
+    def stage_index(self, stage_name):
+        for index, stage in enumerate(self.stages):
+            if stage.name == stage_name:
+                return index
+        raise ValueError(f"Unknown pipeline stage '{stage_name}'")
+
+    def submit(self, payload, stage=None, block=False):
+        # Returns the item's sequence number, or None if the stage queue is full.
+        index = 0 if stage is None else self.stage_index(stage)
+        item = PipelineItem(next(self._seq), payload)
+        try:
+            self.stages[index].queue.put(item, block=block)
+        except queue.Full:
+            return None
+        return item.seq
+
+    def cancel(self, seq):
+        with self._lock:
+            self._cancelled.add(seq)
+
+    def cancel_all(self):
+        # Everything submitted so far is dropped at its next stage boundary.
+        with self._lock:
+            self._cancel_before = next(self._seq)
+            self._cancelled.clear()
+        for stage in self.stages:
+            try:
+                while True:
+                    stage.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+    def is_cancelled(self, item):
+        with self._lock:
+            return item.seq < self._cancel_before or item.seq in self._cancelled
+
+    def pending(self):
+        return sum(stage.queue.qsize() for stage in self.stages)
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage.queue.get()
+            if self.is_cancelled(item):
+                continue
+            if self.metrics:
+                self.metrics.record(f"voice.{stage.name}.wait", time.monotonic() - item.queued_at)
+            start = time.perf_counter()
+            try:
+                result = stage.func(item.payload)
+            except Exception as e:
+                result = None
+                if self.on_error:
+                    self.on_error(stage.name, item, e)
+            finally:
+                elapsed = time.perf_counter() - start
+                stage.busy_seconds += elapsed
+                stage.processed += 1
+                if self.metrics:
+                    self.metrics.record(f"voice.{stage.name}", elapsed)
+            if result is None or self.is_cancelled(item):
+                continue
+            if next_stage is None:
+                self.completed += 1
+                if self.metrics:
+                    self.metrics.record("voice.total", time.monotonic() - item.submitted_at)
+                if self.on_complete:
+                    self.on_complete(item, time.monotonic() - item.submitted_at)
+                continue
+            item.payload = result
+            item.queued_at = time.monotonic()
+            next_stage.queue.put(item)  # Blocks while the next stage is backed up
+
+    def describe(self):
+        lines = []
+        elapsed_minutes = (time.monotonic() - self.started_at) / 60 if self.started_at else 0
+        rate = self.completed / elapsed_minutes if elapsed_minutes else 0.0
+        lines.append(f"Voice pipeline: {self.completed} commands completed ({rate:.1f}/min), "
+                     f"{self.pending()} queued")
+        for stage in self.stages:
+            mean_ms = stage.busy_seconds / stage.processed * 1000 if stage.processed else 0.0
+            lines.append(f"  {stage.name:<10} processed {stage.processed:>5}  mean {mean_ms:7.0f} ms  "
+                         f"queued {stage.queue.qsize()}")
+        return "\n".join(lines)
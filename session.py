@@ -0,0 +1,52 @@
+import os
+import stat
+import itertools
+
+
+# --- Shell sessions ---
+# A session is one shell: its working directory plus, in the GUI, its own command history and
+# scrollback log. Built-ins resolve relative paths against session.cwd explicitly instead of the
+# process-wide cwd, so sessions in different tabs, and jobs still running for them on the worker
+# pool, never see each other's `cd`. Nothing in the engine calls os.chdir.
+_session_ids = itertools.count(1)
+
+
+def resolve_path(cwd, path):
+    # Joins a command operand onto a session's directory; absolute operands stay as they are.
+    # Without a cwd (plain function use) paths are left relative to the process cwd, as before.
+    return os.path.join(cwd, path) if cwd else path
+
+
+class Session:
+    def __init__(self, cwd=None, name=None, history=None, log=None):
+        self.id = next(_session_ids)
+        self.cwd = os.path.realpath(cwd or os.getcwd())
+        self.name = name or f"shell {self.id}"
+        self.history = history  # CommandHistory, or None
+        self.log = log          # SessionLog for scrollback trimmed from the screen, or None
+
+    def resolve(self, path):
+        return resolve_path(self.cwd, path)
+
+    def change_directory(self, path):
+        # Same checks and errors as os.chdir (FileNotFoundError, NotADirectoryError,
+        # PermissionError), and like os.getcwd() afterwards the new cwd has symlinks resolved.
+        target = os.path.realpath(self.resolve(path))
+        if not stat.S_ISDIR(os.stat(target).st_mode):
+            raise NotADirectoryError(f"Not a directory: '{path}'")
+        if not os.access(target, os.X_OK):
+            raise PermissionError(f"Permission denied: '{path}'")
+        self.cwd = target
+        return target
+
+    def ensure_cwd(self):
+        # The directory can be removed from under the session (e.g. by another tab). Falls back
+        # to the home directory; returns True when it had to.
+        if os.path.isdir(self.cwd):
+            return False
+        self.cwd = os.path.expanduser("~")
+        return True
+
+    def close(self):
+        if self.log:
+            self.log.close()
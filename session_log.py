@@ -0,0 +1,76 @@
+import os
+import re
+import time
+import threading
+
+
+# --- Append-only session log ---
+# Text trimmed from the terminal widget (scrollback overflow or `clear`) is appended here, so the
+# widget stays small while the full session remains searchable on disk. Several sessions of one
+# process (tabs) tell their logs apart by label.
+class SessionLog:
+    def __init__(self, log_dir, label=None):
+        self.log_dir = log_dir
+        suffix = f"-{label}" if label else ""
+        self.path = os.path.join(log_dir, f"session-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{suffix}.log")
+        self.lines_written = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._write_error_reported = False
+
+    def append(self, content):
+        if not content:
+            return
+        if not content.endswith("\n"):
+            content += "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(self.log_dir, exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(content)
+                self._file.flush()
+                self.lines_written += content.count("\n")
+            except OSError as e:
+                # Losing scrollback is better than breaking the shell; report it once and carry on.
+                # The file is reopened on the next append, so the log resumes if the disk recovers.
+                if not self._write_error_reported:
+                    print(f"Warning: could not write session log '{self.path}': {e}")
+                    self._write_error_reported = True
+                if self._file:
+                    try:
+                        self._file.close()
+                    except OSError:
+                        pass
+                self._file = None
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def search(self, pattern, use_regex=False, max_results=200):
+        # Streams the log line by line; yields (line_number, line) for matching lines.
+        matcher = compile_matcher(pattern, use_regex)
+        if not os.path.exists(self.path):
+            return
+        with self._lock:
+            if self._file:
+                self._file.flush()
+        found = 0
+        with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            for line_number, line in enumerate(f, start=1):
+                if matcher(line):
+                    yield line_number, line.rstrip("\n")
+                    found += 1
+                    if found >= max_results:
+                        return
+
+
+def compile_matcher(pattern, use_regex=False):
+    if use_regex:
+        regex = re.compile(pattern, re.IGNORECASE)
+        return lambda line: regex.search(line) is not None
+    lowered = pattern.lower()
+    return lambda line: lowered in line.lower()
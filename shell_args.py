@@ -0,0 +1,235 @@
+import os
+import re
+import shlex
+import fnmatch
+
+GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+class Word(str):
+    # An operand from split_arguments that remembers what was quoted: glob is the word with its
+    # quoted or escaped *, ? and [ made literal for fnmatch, or None when nothing unquoted can glob,
+    # so rm "*.log" removes the file named *.log and a spoken name quoted on purpose stays one name.
+    glob = None
+
+
+def _word(value, glob, globbing):
+    word = Word(value)
+    word.glob = glob if globbing else None
+    return word
+
+
+def split_arguments(arg_string):
+    # Shell-style word splitting: quotes group words ("my folder"), backslashes escape on POSIX.
+    # Returns Words. Raises ValueError on unbalanced quotes.
+    if os.name == "nt":
+        # Non-posix splitting keeps backslashes in Windows paths but also keeps the quotes; drop them.
+        words = []
+        for word in shlex.split(arg_string, posix=False):
+            if len(word) > 1 and word[0] == word[-1] and word[0] in "\"'":
+                words.append(_word(word[1:-1], None, False))
+            else:
+                words.append(_word(word, word, GLOB_CHARS.search(word)))
+        return words
+    # The POSIX rules of shlex.split, tracking which characters were quoted.
+    words = []
+    value = glob = None # Word being read; None between words
+    globbing = False    # It has an unquoted glob character
+    quote = ""
+    i = 0
+    while i < len(arg_string):
+        c = arg_string[i]
+        if quote:
+            if c == quote:
+                quote = ""
+            else:
+                if c == "\\" and quote == '"' and arg_string[i + 1:i + 2] in ['"', "\\"]:
+                    i += 1
+                    c = arg_string[i]
+                value += c
+                glob += f"[{c}]" if c in "*?[" else c
+        elif c.isspace():
+            if value is not None:
+                words.append(_word(value, glob, globbing))
+                value = glob = None
+        else:
+            if value is None:
+                value = glob = ""
+                globbing = False
+            if c in "\"'":
+                quote = c
+            elif c == "\\":
+                if i + 1 == len(arg_string):
+                    raise ValueError("No escaped character")
+                i += 1
+                c = arg_string[i]
+                value += c
+                glob += f"[{c}]" if c in "*?[" else c
+            else:
+                value += c
+                glob += c
+                globbing = globbing or c in "*?["
+        i += 1
+    if quote:
+        raise ValueError("No closing quotation")
+    if value is not None:
+        words.append(_word(value, glob, globbing))
+    return words
+
+
+def quote_argument(argument):
+    # Inverse of split_arguments for a single operand, e.g. a spoken name with spaces.
+    if os.name != "nt":
+        return shlex.quote(argument)
+    return f'"{argument}"' if any(c.isspace() for c in argument) or not argument else argument
+
+
+def split_pipeline(line):
+    # Splits a command line at unquoted "|" into the commands of a pipeline (a single command when
+    # there is none). Raises ValueError when a command is missing, as in "ls |" or "a || b".
+    stages = []
+    start = 0
+    quote = ""
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if quote:
+            if c == quote:
+                quote = ""
+            elif c == "\\" and quote == '"' and os.name != "nt":
+                i += 1
+        elif c in "\"'":
+            quote = c
+        elif c == "\\" and os.name != "nt":
+            i += 1
+        elif c == "|":
+            stages.append(line[start:i].strip())
+            start = i + 1
+        i += 1
+    stages.append(line[start:].strip())
+    if len(stages) > 1 and not all(stages):
+        raise ValueError("missing command in pipeline")
+    return stages
+
+
+def split_last_word(line):
+    # For Tab completion: splits off the word being typed at the end of `line`. Returns
+    # (head, word, quote): head is the line up to that word, word its unquoted value and quote the
+    # quote character it was typed with ("" if none; the quote may still be open).
+    start = 0
+    quote = ""       # Quote currently open
+    word_quote = ""  # First quote used in the current word
+    value = []
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if quote:
+            if c == quote:
+                quote = ""
+            elif c == "\\" and quote == '"' and os.name != "nt" and line[i + 1:i + 2] in ['"', "\\"]:
+                i += 1
+                value.append(line[i])
+            else:
+                value.append(c)
+        elif c.isspace():
+            start = i + 1
+            word_quote = ""
+            value = []
+        elif c in "\"'":
+            quote = c
+            word_quote = word_quote or c
+        elif c == "\\" and os.name != "nt" and i + 1 < len(line):
+            i += 1
+            value.append(line[i])
+        else:
+            value.append(c)
+        i += 1
+    return line[:start], "".join(value), word_quote
+
+
+def quote_completion(value, quote="", closed=True):
+    # Renders a completed operand so split_arguments reads it back as `value`. Partial completions
+    # leave the quote open so the user can keep typing the name.
+    if not quote and quote_argument(value) == value:
+        return value
+    if not quote or quote in value:
+        quote = "'" if '"' in value else '"'
+    if closed and quote in value:
+        return quote_argument(value)
+    return quote + value + (quote if closed else "")
+
+
+def split_options(arguments, known_flags):
+    # Separates leading single-letter flags (-p, -rf) from operands; "--" ends the options.
+    flags = set()
+    operands = []
+    parsing_options = True
+    for argument in arguments:
+        if parsing_options and argument == "--":
+            parsing_options = False
+        elif parsing_options and argument.startswith("-") and len(argument) > 1:
+            for flag in argument[1:]:
+                if flag not in known_flags:
+                    raise ValueError(f"Unknown option '-{flag}'")
+                flags.add(flag)
+        else:
+            operands.append(argument)
+    return flags, operands
+
+
+def expand_globs(operands, cwd=None):
+    # Expands *, ? and [...] in the last path component of the operands that were not quoted (a
+    # Word's glob; plain strings are taken as typed unquoted). All patterns that share a directory
+    # are matched during a single os.scandir of that directory, so "rm *.log *.tmp" reads the
+    # directory once. Patterns that match nothing are kept literally, as a POSIX shell does.
+    # Relative directories are read from cwd (default: the process cwd); matches stay relative.
+    patterns_by_dir = {}
+    for index, operand in enumerate(operands):
+        pattern = operand.glob if isinstance(operand, Word) else operand
+        if pattern is None:
+            continue
+        directory, name = os.path.split(pattern)
+        if GLOB_CHARS.search(name) and not GLOB_CHARS.search(directory):
+            patterns_by_dir.setdefault(directory, []).append((index, name))
+
+    matches = {}
+    for directory, patterns in patterns_by_dir.items():
+        compiled = [(index, re.compile(fnmatch.translate(name)), name.startswith(".")) for index, name in patterns]
+        for index, _, _ in compiled:
+            matches[index] = []
+        try:
+            with os.scandir(os.path.join(cwd or "", directory) or ".") as entries:
+                for entry in entries:
+                    for index, regex, match_hidden in compiled:
+                        if (match_hidden or not entry.name.startswith(".")) and regex.match(entry.name):
+                            matches[index].append(os.path.join(directory, entry.name) if directory else entry.name)
+        except OSError:
+            pass  # Unreadable directory: leave the patterns literal so the command reports the error
+
+    expanded = []
+    for index, operand in enumerate(operands):
+        if matches.get(index):
+            expanded.extend(sorted(matches[index]))
+        else:
+            expanded.append(operand)
+    return expanded
+
+
+class FailedOutput(str):
+    # Command output that reports a failure; multi-command utterances stop at the first one.
+    pass
+
+
+def summarize_batch(succeeded, errors, success_message, max_errors=10):
+    # One result for a whole batch: the single message for one operand, a count plus the first
+    # few errors for many. Returned as FailedOutput when any operand failed.
+    if len(succeeded) + len(errors) == 1:
+        return succeeded[0][1] if succeeded else FailedOutput(errors[0])
+    lines = [success_message.format(count=len(succeeded), total=len(succeeded) + len(errors))]
+    if errors:
+        lines.append(f"{len(errors)} error(s):")
+        lines.extend(f"  {error}" for error in errors[:max_errors])
+        if len(errors) > max_errors:
+            lines.append(f"  ... and {len(errors) - max_errors} more")
+        return FailedOutput("\n".join(lines))
+    return "\n".join(lines)
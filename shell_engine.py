@@ -0,0 +1,1055 @@
+import os
+import sys
+import json
+import time
+import shutil
+import stat
+import threading
+
+from dir_cache import DirectoryCache
+from external_commands import parse_pipeline, run_pipeline, program_name, voice_program
+from intent_cache import IntentCache
+from name_resolver import NameResolver
+from session import Session, resolve_path
+from jobs import Job, JobCancelled
+from metrics import Metrics
+from shell_args import split_arguments, split_options, expand_globs, summarize_batch, quote_argument, FailedOutput, \
+    split_last_word, split_pipeline, quote_completion, GLOB_CHARS
+from trash import Trash
+
+
+# --- Shell functions with string outputs ---
+# Operands are resolved against `cwd` (a session's working directory) but reported as given.
+def remove_tree_with_progress(path, job):
+    # Same result as shutil.rmtree, but checks for cancellation and reports entries removed.
+    mode = os.lstat(path).st_mode
+    if stat.S_ISLNK(mode):
+        raise OSError("Cannot call rmtree on a symbolic link")
+    if not stat.S_ISDIR(mode):
+        raise NotADirectoryError(path)
+    removed = 0
+    stack = [(path, False)]
+    while stack:
+        current, children_done = stack.pop()
+        if children_done:
+            os.rmdir(current)
+            removed += 1
+            continue
+        stack.append((current, True))
+        with os.scandir(current) as entries:
+            for entry in entries:
+                job.check_cancelled()
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, False))
+                else:
+                    os.unlink(entry.path)
+                    removed += 1
+                    if removed % 500 == 0:
+                        job.report_progress(f"{removed} entries removed")
+    return removed
+
+def removeDirectory(directories, job=None, trash=None, cwd=None, force=False):
+    succeeded = []
+    errors = []
+    if not directories:
+        return FailedOutput("No directories specified for removal.")
+    for index, dir_name in enumerate(directories, start=1):
+        if not dir_name.strip():
+            errors.append("Error: Empty directory name specified.")
+            continue
+        if job and len(directories) > 1:
+            job.report_progress(f"{index}/{len(directories)} directories")
+        path = resolve_path(cwd, dir_name)
+        try:
+            if trash is not None:
+                try:
+                    item = trash.stage(path)
+                    succeeded.append((dir_name, f"Directory '{dir_name}' moved to trash and will be purged in the "
+                                                f"background (restore with 'trash restore {item['id']}')."))
+                    continue
+                except (FileNotFoundError, NotADirectoryError, PermissionError):
+                    raise
+                except OSError:
+                    pass # No staging area on that filesystem: delete in place below
+            if job is None:
+                shutil.rmtree(path) # Use shutil.rmtree for non-empty directories
+            else:
+                remove_tree_with_progress(path, job)
+            succeeded.append((dir_name, f"Directory '{dir_name}' and its contents removed."))
+        except JobCancelled:
+            errors.append(f"Removal of '{dir_name}' cancelled ({job.progress or 'partially removed'}).")
+            break
+        except FileNotFoundError:
+            if not force:
+                errors.append(f"Directory '{dir_name}' not found.")
+        except NotADirectoryError:
+            errors.append(f"Error: '{dir_name}' is not a directory.")
+        except PermissionError:
+            errors.append(f"Permission denied to remove '{dir_name}'.")
+        except OSError as e:
+            errors.append(f"OS error removing '{dir_name}': {e}")
+        except Exception as e:
+            errors.append(f"An unexpected error occurred with '{dir_name}': {e}")
+    if not succeeded and not errors:
+        return "" # rm -rf on directories that don't exist
+    return summarize_batch(succeeded, errors, "Removed {count} of {total} directories.")
+
+def trash_command(arg_string, trash):
+    if trash is None:
+        return "Trash is disabled (VOICEOS_TRASH=0)."
+    parts = arg_string.split(maxsplit=1)
+    subcommand = parts[0].lower() if parts else "list"
+    if subcommand == "list":
+        items = trash.items()
+        if not items:
+            return "Trash is empty."
+        lines = [f"{item['id']}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['staged_at']))}  "
+                 f"{item['original_path']}" for item in items]
+        return "\n".join(lines)
+    if subcommand == "restore":
+        if len(parts) < 2:
+            return "Usage: trash restore <id or directory name>"
+        try:
+            item = trash.restore(parts[1].strip())
+            return f"Restored '{item['original_path']}'."
+        except KeyError:
+            return f"Nothing in the trash matches '{parts[1].strip()}' (it may already be purged)."
+        except FileExistsError:
+            return f"Cannot restore: '{parts[1].strip()}' already exists at its original location."
+        except OSError as e:
+            return f"Error restoring '{parts[1].strip()}': {e}"
+    if subcommand == "purge":
+        count = len(trash.items())
+        trash.purge_now()
+        return f"Purging {count} item(s) in the background."
+    return "Usage: trash [list | restore <id or name> | purge]"
+
+def removeFile(files, job=None, force=False, cwd=None):
+    succeeded = []
+    errors = []
+    if not files:
+        return FailedOutput("No files specified for removal.")
+    for index, file_name in enumerate(files, start=1):
+        if not file_name.strip():
+            errors.append("Error: Empty file name specified.")
+            continue
+        if job and index % 200 == 0:
+            job.check_cancelled()
+            job.report_progress(f"{index}/{len(files)} files")
+        try:
+            os.remove(resolve_path(cwd, file_name))
+            succeeded.append((file_name, f"File '{file_name}' removed."))
+        except FileNotFoundError:
+            if not force:
+                errors.append(f"File '{file_name}' not found.")
+        except PermissionError:
+            errors.append(f"Permission denied for '{file_name}'.")
+        except IsADirectoryError:
+             errors.append(f"Cannot remove '{file_name}'. It is a directory. Use 'rm -r' for directories.")
+        except OSError as e:
+            errors.append(f"OS error removing '{file_name}': {e}")
+        except Exception as e:
+            errors.append(f"An unexpected error occurred with '{file_name}': {e}")
+    if not succeeded and not errors:
+        return "" # rm -f on files that don't exist
+    return summarize_batch(succeeded, errors, "Removed {count} of {total} files.")
+
+
+def makeFile(file_names, job=None, cwd=None):
+    succeeded = []
+    errors = []
+    if not file_names:
+        return FailedOutput("Error: No file name specified.")
+    for index, file_name in enumerate(file_names, start=1):
+        if not file_name.strip():
+            errors.append("Error: No file name specified.")
+            continue
+        if job and index % 200 == 0:
+            job.check_cancelled()
+            job.report_progress(f"{index}/{len(file_names)} files")
+        try:
+            with open(resolve_path(cwd, file_name), 'a') as f:
+                pass
+            succeeded.append((file_name, f"File '{file_name}' ensured/created."))
+        except PermissionError:
+            errors.append(f"Permission denied: Unable to create/access '{file_name}'.")
+        except Exception as e:
+            errors.append(f"An error occurred creating file '{file_name}': {e}")
+    return summarize_batch(succeeded, errors, "Created/updated {count} of {total} files.")
+
+def makeDirectory(directory_names, parents=False, job=None, cwd=None):
+    succeeded = []
+    errors = []
+    if not directory_names:
+        return FailedOutput("Error: No directory name specified.")
+    for index, directory_name in enumerate(directory_names, start=1):
+        if not directory_name.strip():
+            errors.append("Error: No directory name specified.")
+            continue
+        if job and index % 200 == 0:
+            job.check_cancelled()
+            job.report_progress(f"{index}/{len(directory_names)} directories")
+        path = resolve_path(cwd, directory_name)
+        try:
+            if parents:
+                os.makedirs(path, exist_ok=True) # mkdir -p: create parents, existing is fine
+            else:
+                os.mkdir(path)
+            succeeded.append((directory_name, f"Directory '{directory_name}' created."))
+        except FileExistsError:
+            errors.append(f"Directory '{directory_name}' already exists." if os.path.isdir(path)
+                          else f"Error: '{directory_name}' already exists and is not a directory.")
+        except PermissionError:
+            errors.append(f"Permission denied: Unable to create '{directory_name}'.")
+        except FileNotFoundError:
+            errors.append(f"Error creating directory '{directory_name}': Path not found. "
+                          "Create parent directories first (or use mkdir -p).")
+        except Exception as e:
+            errors.append(f"An error occurred creating directory '{directory_name}': {e}")
+    return summarize_batch(succeeded, errors, "Created {count} of {total} directories.")
+
+def changeDirectory(path, session):
+    if not path.strip() and path != "..":
+        if not path.strip():
+          return FailedOutput("Error: No directory path specified for cd.")
+    try:
+        return f"Changed to {session.change_directory(path)}"
+    except FileNotFoundError:
+        return FailedOutput(f"The system cannot find the path specified: '{path}'")
+    except NotADirectoryError:
+        return FailedOutput(f"Not a directory: '{path}'")
+    except PermissionError:
+        return FailedOutput(f"Permission denied for path: '{path}'")
+    except Exception as e:
+        return FailedOutput(f"Error changing directory to '{path}': {e}")
+
+
+def getPresentWorkingDirectory(session):
+    return session.cwd
+
+LS_DEFAULT_LIMIT = int(os.getenv("VOICEOS_LS_LIMIT", "5000"))
+LS_USAGE = "Usage: ls [-l] [-a] [-S|-t|--sort=name|size|time|none] [-r] [--limit=N] [directory]"
+
+def parse_ls_options(arg_string):
+    options = {"long": False, "all": False, "sort": "none", "reverse": False, "limit": LS_DEFAULT_LIMIT,
+               "path": "."}
+    operands = []
+    for token in split_arguments(arg_string): # Quoted names keep their spaces, as for the other commands
+        if token.startswith("--sort="):
+            options["sort"] = token[len("--sort="):]
+            if options["sort"] not in ["name", "size", "time", "none"]:
+                raise ValueError(f"Invalid sort key '{options['sort']}'.")
+        elif token.startswith("--limit="):
+            options["limit"] = int(token[len("--limit="):])
+            if options["limit"] < 0:
+                raise ValueError(f"Invalid limit '{options['limit']}'; use 0 for no limit.")
+        elif token.startswith("-") and len(token) > 1:
+            for flag in token[1:]:
+                if flag == "l": options["long"] = True
+                elif flag == "a": options["all"] = True
+                elif flag == "S": options["sort"] = "size"
+                elif flag == "t": options["sort"] = "time"
+                elif flag == "r": options["reverse"] = True
+                else: raise ValueError(f"Unknown option '-{flag}'.")
+        else:
+            operands.append(token)
+    if len(operands) > 1:
+        raise ValueError(f"Only one directory can be listed; quote names with spaces, e.g. ls {quote_argument(' '.join(operands))}")
+    if operands:
+        options["path"] = operands[0]
+    return options
+
+def format_ls_entry(entry, long_format):
+    if not long_format:
+        return entry.name
+    try:
+        st = entry.stat(follow_symlinks=False) # Served from the DirEntry cache where the OS provides it
+    except OSError:
+        return f"?????????? {'?':>12}  {'?':16}  {entry.name}"
+    modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(st.st_mtime))
+    suffix = "/" if stat.S_ISDIR(st.st_mode) else ""
+    return f"{stat.filemode(st.st_mode)} {st.st_size:>12}  {modified}  {entry.name}{suffix}"
+
+def iter_directory_chunks(options, job=None, cache=None, first_chunk=50, chunk_size=500):
+    # Yields lists of formatted entries. Unsorted listings stream straight from os.scandir, so the
+    # first chunk appears after a constant amount of work however large the directory is. With a
+    # DirectoryCache an unchanged directory isn't rescanned, and a complete scan fills the cache.
+    listing = cache.get(options["path"]) if cache else None
+    if listing is not None:
+        source = iter(listing.entries)
+    else:
+        source = cache.scan(options["path"]) if cache else os.scandir(options["path"])
+    try:
+        entries = (e for e in source if options["all"] or not e.name.startswith("."))
+        if options["sort"] != "none":
+            sort_keys = {"name": lambda e: e.name.lower(),
+                         "size": lambda e: e.stat(follow_symlinks=False).st_size,
+                         "time": lambda e: e.stat(follow_symlinks=False).st_mtime}
+            # Size and time sort largest/newest first, like ls.
+            descending = options["sort"] in ["size", "time"]
+            entries = iter(sorted(entries, key=sort_keys[options["sort"]],
+                                  reverse=descending != options["reverse"]))
+        elif options["reverse"]:
+            entries = iter(list(entries)[::-1])
+
+        limit = options["limit"]
+        emitted = 0
+        chunk = []
+        target = first_chunk
+        for entry in entries:
+            if limit and emitted >= limit:
+                if chunk:
+                    yield chunk
+                yield None # Signals that the listing was truncated
+                return
+            chunk.append(format_ls_entry(entry, options["long"]))
+            emitted += 1
+            if len(chunk) >= target:
+                if job: job.check_cancelled()
+                yield chunk
+                chunk = []
+                target = chunk_size
+        if chunk:
+            yield chunk
+    finally:
+        if listing is None:
+            source.close() # Stopped early (limit, cancel): release the scandir handle now
+
+def list_directory(arg_string="", job=None, cache=None, cwd=None):
+    try:
+        options = parse_ls_options(arg_string)
+    except ValueError as e:
+        return FailedOutput(f"ls: {e}\n{LS_USAGE}")
+    separator = "\n" if options["long"] else "  "
+    parts = []
+    count = 0
+    truncated = False
+    try:
+        for chunk in iter_directory_chunks(dict(options, path=resolve_path(cwd, options["path"])), job, cache):
+            if chunk is None:
+                truncated = True
+                break
+            count += len(chunk)
+            rendered = separator.join(chunk) + separator
+            if job:
+                job.write(rendered) # Streamed to the widget chunk by chunk
+                job.report_progress(f"{count} entries listed")
+            else:
+                parts.append(rendered)
+    except FileNotFoundError:
+        return FailedOutput("Error: Current working directory not found." if options["path"] == "." else
+                            f"Error: Directory '{options['path']}' not found.")
+    except NotADirectoryError:
+        return FailedOutput(f"Error: '{options['path']}' is not a directory.")
+    except PermissionError:
+        return FailedOutput("Error: Permission denied to list current directory." if options["path"] == "." else
+                            f"Error: Permission denied to list '{options['path']}'.")
+    except JobCancelled:
+        return FailedOutput(f"\nls cancelled after {count} entries.")
+    except Exception as e:
+        return FailedOutput(f"Error listing directory: {e}")
+
+    footer = f"\n(listing limited to {options['limit']} entries; use --limit=0 to show all)" if truncated else ""
+    if job:
+        return footer.strip()
+    return "".join(parts).rstrip() + footer
+
+
+# --- Command parsing ---
+KNOWN_COMMANDS = ["ls", "pwd", "cd", "mkdir", "touch", "rm", "rm -r", "clear"]
+BUILTIN_COMMANDS = KNOWN_COMMANDS + ["cache", "intents", "ai", "trash", "stats"] # Everything else is a program
+MAX_COMMANDS_PER_UTTERANCE = 10
+ARGUMENT_COMMANDS = ["cd", "mkdir", "touch", "rm", "ls", "trash", "stats"]
+
+# Commands whose operands are completed as paths -> whether only directories are offered.
+COMPLETION_COMMANDS = {"cd": True, "mkdir": True, "rm": False, "touch": False}
+COMPLETION_LIST_LIMIT = 100
+# Commands whose spoken operands are matched against existing entries -> kind of entry expected.
+SPOKEN_NAME_KINDS = {"cd": "dir", "ls": "any", "rm": "file", "rm -r": "dir"}
+DESTRUCTIVE_COMMANDS = {"rm", "rm -r"} # Spoken names are only replaced by normalized-exact matches
+
+def parse_command(command_str, argument_commands=ARGUMENT_COMMANDS):
+    parts = command_str.split(maxsplit=2)
+    base_cmd_part1 = parts[0] if len(parts) > 0 else ""
+    base_cmd_part2 = parts[1] if len(parts) > 1 else ""
+
+    full_base_command = base_cmd_part1.lower() # Match commands case-insensitively
+    arg_string = ""
+
+    if full_base_command == "rm" and base_cmd_part2.lower() == "-r":
+        full_base_command = "rm -r"
+        arg_string = parts[2] if len(parts) > 2 else ""
+    elif full_base_command in argument_commands:
+        arg_string = command_str[len(base_cmd_part1):].strip()
+    return full_base_command, base_cmd_part2, arg_string
+
+def run_batch_command(full_base_command, arg_string, job=None, trash=None, cwd=None):
+    # mkdir/touch/rm take any number of quoted operands and glob patterns.
+    known_flags = {"mkdir": "p", "touch": "", "rm": "rRf", "rm -r": "rRf"}[full_base_command]
+    try:
+        flags, operands = split_options(split_arguments(arg_string), known_flags)
+    except ValueError as e:
+        return FailedOutput(f"{full_base_command}: {e}")
+    operands = expand_globs(operands, cwd)
+    if full_base_command == "mkdir":
+        return makeDirectory(operands, parents="p" in flags, job=job, cwd=cwd)
+    if full_base_command == "touch":
+        return makeFile(operands, job, cwd)
+    if full_base_command == "rm -r" or "r" in flags or "R" in flags:
+        if not operands: return FailedOutput("No directory specified for rm -r.")
+        return removeDirectory(operands, job, trash, cwd, force="f" in flags)
+    if not operands: return FailedOutput("No file specified for rm.")
+    return removeFile(operands, job, force="f" in flags, cwd=cwd)
+
+
+# --- Intent prompt and response parsing ---
+def build_intent_prompt(transcribed_text, programs=()):
+    # programs: the voice allowlist. When there is one, "run <command line>" is offered as well.
+    run_command = run_rules = run_example = ""
+    if programs:
+        run_command = f"""
+    9. run <command line> (run a program; only these programs are allowed: {", ".join(programs)})"""
+        run_rules = """
+    - For run, "argument" is the complete command line: the program followed by its arguments and options."""
+        run_example = f"""
+    User speech: "run {programs[0]} please" -> [{{"command": "run", "argument": "{programs[0]}"}}]"""
+    prompt = f"""
+    You are an AI assistant for a voice-controlled shell.
+    User's speech: "{transcribed_text}"
+
+    Your task is to identify which of the following {9 if programs else 8} shell commands the user intends to execute and extract any necessary arguments.
+    The user may ask for several commands in one sentence; return all of them, in the order they should run.
+    The supported commands are:
+    1. ls (list directory contents)
+    2. pwd (print working directory)
+    3. cd <directory_name> (change directory to <directory_name>)
+    4. mkdir <directory_name> (make directory named <directory_name>)
+    5. touch <file_name> (create/update file named <file_name>)
+    6. rm <file_name> (remove file named <file_name>)
+    7. rm -r <directory_name> (remove directory named <directory_name>, recursively)
+    8. clear (clear the terminal screen){run_command}
+
+    Argument Processing Rules:
+    - Convert spoken numbers to digits (e.g., "one" to "1").
+    - Interpret spoken characters: "dot" or "period" -> ".", "underscore" or "underline" -> "_", "slash" -> "/", "backslash" -> "\\", "dash" or "hyphen" -> "-"
+    - File/directory names can contain spaces. Preserve them.
+
+    Respond ONLY with a JSON array of command objects in the following format:
+    [{{"command": "COMMAND_NAME", "argument": "ARGUMENT_VALUE"}}]
+
+    - If the command does not take an argument (ls, pwd, clear), "argument" should be an empty string.
+    - For commands like cd, mkdir, touch, rm, rm -r, "argument" should be the identified file/directory name (one name per command object).{run_rules}
+    - If the user's speech is unclear, ambiguous, or any part of it does not map to the supported commands, respond with:
+      [{{"command": "unknown", "argument": ""}}]
+
+    Examples:
+    User speech: "list the files" -> [{{"command": "ls", "argument": ""}}]
+    User speech: "where am I?" -> [{{"command": "pwd", "argument": ""}}]
+    User speech: "go to my project folder" -> [{{"command": "cd", "argument": "my project folder"}}]
+    User speech: "make a directory called test results version one" -> [{{"command": "mkdir", "argument": "test results version one"}}]
+    User speech: "create a file report dot txt" -> [{{"command": "touch", "argument": "report.txt"}}]
+    User speech: "delete the file log_backup_file.data" -> [{{"command": "rm", "argument": "log_backup_file.data"}}]
+    User speech: "remove the old_stuff directory" -> [{{"command": "rm -r", "argument": "old_stuff"}}]
+    User speech: "clear the screen" -> [{{"command": "clear", "argument": ""}}]
+    User speech: "make folders alpha, beta and gamma and go into alpha" -> [{{"command": "mkdir", "argument": "alpha"}}, {{"command": "mkdir", "argument": "beta"}}, {{"command": "mkdir", "argument": "gamma"}}, {{"command": "cd", "argument": "alpha"}}]
+    User speech: "what is two plus two" -> [{{"command": "unknown", "argument": ""}}]{run_example}
+
+    User speech: "{transcribed_text}"
+    JSON Response:
+    """
+    return prompt
+
+def parse_intent_response(response_text):
+    # JSON mode returns bare JSON, so no markdown code fences to strip.
+    try:
+        ai_json = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from AI: {e}. Raw response text: {response_text}")
+        return {"commands": [], "error": f"JSON decode error: {e}"}
+    if isinstance(ai_json, dict):
+        ai_json = [ai_json] # A single object is still accepted
+
+    if isinstance(ai_json, list) and ai_json and \
+            all(isinstance(c, dict) and "command" in c and "argument" in c for c in ai_json):
+        if len(ai_json) > MAX_COMMANDS_PER_UTTERANCE:
+            # Rejected whole rather than cut short: running the first ten of a longer list would
+            # silently drop the rest of what was asked for.
+            return {"commands": [], "error": f"{len(ai_json)} commands in one request; at most "
+                                             f"{MAX_COMMANDS_PER_UTTERANCE} can be run at a time."}
+        commands = [{"command": c["command"], "argument": c.get("argument") or ""} for c in ai_json]
+        return {"commands": commands}
+    print(f"Error: AI response malformed structure. Raw: {response_text}")
+    return {"commands": [], "error": "Malformed AI response structure."}
+
+def format_commands(commands):
+    full_commands = []
+    for c in commands:
+        command_name, argument = c["command"], c["argument"]
+        if command_name == "run":
+            full_commands.append(argument) # Already a command line
+            continue
+        # Quoted so a spoken name with spaces stays one operand.
+        full_commands.append(f"{command_name} {quote_argument(argument)}" if argument else command_name)
+    return full_commands
+
+
+# --- Headless shell engine ---
+# Parses and runs commands and resolves spoken text to commands without touching any GUI.
+# Front ends (the Tk window, the CLI runner, benchmarks) render the CommandResults themselves and
+# can register extra commands that need their own state (e.g. `search` over the window's text).
+# Commands run in a Session (engine.session unless another is passed), whose cwd they resolve
+# paths against; several sessions can run commands at the same time. Lines that aren't built-in or
+# registered commands, and pipelines, run as programs (see external_commands.py); from voice only
+# the programs on the voice allowlist do.
+class CommandResult:
+    def __init__(self, command, name, output, ok=True, elapsed=0.0, action=None, choices=None,
+                 exit_status=None):
+        self.command = command  # The command line as given
+        self.name = name        # Parsed base command ("rm -r", "ls", ...)
+        self.output = output
+        self.ok = ok
+        self.elapsed = elapsed
+        self.action = action    # Something the front end must do itself, e.g. "clear"
+        self.choices = choices or [] # Command lines to pick from when a spoken name was ambiguous
+        self.exit_status = exit_status # Of an external command (the last program of a pipeline)
+
+    def to_dict(self):
+        return {"command": self.command, "name": self.name, "output": self.output, "ok": self.ok,
+                "elapsed_ms": round(self.elapsed * 1000, 3), "action": self.action, "choices": self.choices,
+                "exit_status": self.exit_status}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["command"], data["name"], data["output"], data["ok"], data["elapsed_ms"] / 1000,
+                   data.get("action"), data.get("choices"), data.get("exit_status"))
+
+
+class ShellEngine:
+    def __init__(self, intent_cache=None, local_intent_engine=None, intent_client=None, trash=None,
+                 metrics=None, metrics_file=None, dir_cache=None, session=None, external_commands=True,
+                 voice_allowlist=()):
+        self.intent_cache = intent_cache
+        self.local_intent_engine = local_intent_engine  # None: every utterance goes to the LLM
+        self.intent_client = intent_client              # None: AI features unavailable
+        self.trash = trash                              # None: rm -r deletes in place
+        self.metrics = metrics or Metrics(enabled=False)
+        self.metrics_file = metrics_file
+        self.dir_cache = dir_cache or DirectoryCache() # Shared by ls, Tab completion and name resolution
+        self.name_resolver = NameResolver(self.dir_cache)
+        self.session = session or Session() # Default session, starting in the process cwd
+        self.external_commands = external_commands # False: anything not built in is an unknown command
+        self.voice_allowlist = sorted(voice_allowlist) # Programs voice commands may run
+        self.intents_pending = False # True while load_intent_components() runs in the background
+        self.argument_commands = list(ARGUMENT_COMMANDS)
+        self._handlers = {}
+
+    @property
+    def ai_ready(self):
+        return self.intent_client is not None
+
+    def register(self, name, func, takes_arguments=False):
+        # func(arg_string, base_cmd_part2, job, session) returns the output string (FailedOutput on
+        # failure).
+        self._handlers[name] = func
+        if takes_arguments and name not in self.argument_commands:
+            self.argument_commands.append(name)
+
+    def parse(self, command_str):
+        return parse_command(command_str, self.argument_commands)
+
+    def execute(self, command_str, job=None, spoken=False, session=None):
+        # spoken=True for commands that came from speech: names that don't exist are first
+        # resolved to the entry they most likely mean (see resolve_names).
+        command_str = command_str.strip()
+        session = session or self.session
+        note = ""
+        if spoken:
+            command_str, note, choices = self.resolve_names(command_str, session)
+            if choices:
+                lines = "\n".join(f"  {i}) {choice}" for i, choice in enumerate(choices, start=1))
+                question = "Several names match; which one did you mean?" if len(choices) > 1 else \
+                    "No exact match; did you mean this?"
+                return CommandResult(command_str, self.parse(command_str)[0], f"{question}\n{lines}", ok=False,
+                                     choices=choices)
+        full_base_command, base_cmd_part2, arg_string = self.parse(command_str)
+        start = time.perf_counter()
+        action = None
+        exit_status = None
+        external = self.is_external(command_str, full_base_command)
+        if external:
+            output, exit_status = self.run_external(command_str, job, session, spoken)
+        elif full_base_command == "clear" and "clear" not in self._handlers:
+            output = ""
+            action = "clear"
+        else:
+            output = self.run_builtin(command_str, full_base_command, base_cmd_part2, arg_string, job, session)
+        elapsed = time.perf_counter() - start
+        ok = not isinstance(output, FailedOutput)
+        if full_base_command:
+            self.metrics.record("cmd.external" if external else f"cmd.{full_base_command}", elapsed)
+            if not ok:
+                self.metrics.increment("command_errors")
+        output = str(output or "")
+        if note:
+            output = f"{note}\n{output}" if output else note
+        return CommandResult(command_str, full_base_command, output, ok, elapsed, action, exit_status=exit_status)
+
+    def is_external(self, command_str, full_base_command):
+        # Registered commands take their arguments verbatim ("search -r a|b"); for everything else
+        # an unquoted "|" makes a pipeline of programs, built-in names included.
+        if not self.external_commands or not full_base_command or full_base_command in self._handlers:
+            return False
+        if full_base_command not in BUILTIN_COMMANDS:
+            return True
+        try:
+            return len(split_pipeline(command_str)) > 1
+        except ValueError:
+            return True # Reported by run_external
+
+    def run_external(self, command_str, job=None, session=None, spoken=False):
+        # Returns (output, exit status); the status is None when nothing could be started.
+        session = session or self.session
+        try:
+            stages = parse_pipeline(command_str, session.cwd)
+        except ValueError as e:
+            return FailedOutput(f"Error: {e}"), None
+        if spoken:
+            for argv in stages:
+                if program_name(argv[0]) not in self.voice_allowlist:
+                    refusal = "Type it, or add it to VOICEOS_VOICE_ALLOWLIST."
+                elif voice_program(argv[0]) is None:
+                    refusal = "Say the name of a program on PATH, not a path."
+                else:
+                    argv[0] = voice_program(argv[0]) # Resolved now: never a program in the cwd
+                    continue
+                self.metrics.increment("voice_commands_refused")
+                return FailedOutput(f"'{argv[0]}' can't be run by voice. {refusal}"), None
+        try:
+            return run_pipeline(stages, job, session.cwd)
+        except FileNotFoundError as e:
+            return FailedOutput(f"Unknown command: '{e.filename or stages[0][0]}'"), None
+        except PermissionError as e:
+            return FailedOutput(f"Permission denied: '{e.filename or stages[0][0]}'"), None
+        except OSError as e:
+            return FailedOutput(f"Error running '{command_str}': {e}"), None
+
+    def resolve_names(self, command_str, session=None):
+        # Replaces operands that don't exist with the entry they most likely name, e.g. the spoken
+        # "my project folder" with my_project-folder. Returns (command line, note for the user,
+        # choices): choices are alternative command lines when no match is clearly best.
+        session = session or self.session
+        full_base_command, _, arg_string = self.parse(command_str)
+        kind = SPOKEN_NAME_KINDS.get(full_base_command)
+        if not kind or not arg_string:
+            return command_str, "", []
+        try:
+            arguments = split_arguments(arg_string)
+        except ValueError:
+            return command_str, "", []
+        if full_base_command == "cd":
+            arguments = [" ".join(arguments)] # cd keeps unquoted spaces
+        head = command_str[:len(command_str) - len(arg_string)]
+        notes = []
+        with self.metrics.timer("resolve"):
+            for i, argument in enumerate(arguments):
+                if argument.startswith("-") or GLOB_CHARS.search(argument):
+                    continue
+                resolution = self.name_resolver.resolve(argument, kind, session.cwd,
+                                                        cautious=full_base_command in DESTRUCTIVE_COMMANDS)
+                if resolution.status == "ambiguous":
+                    self.metrics.increment("names_ambiguous")
+                    choices = [head + " ".join(quote_argument(a) for a in arguments[:i] + [choice] + arguments[i + 1:])
+                               for choice in resolution.choices]
+                    return command_str, "", choices
+                if resolution.status == "resolved":
+                    self.metrics.increment("names_resolved")
+                    notes.append(f"No '{argument}' here; using '{resolution.path}'.")
+                    arguments[i] = resolution.path
+        if not notes:
+            return command_str, "", []
+        return head + " ".join(quote_argument(a) for a in arguments), "\n".join(notes), []
+
+    def run_builtin(self, command_str, full_base_command, base_cmd_part2, arg_string, job=None, session=None):
+        session = session or self.session
+        output = ""
+        if full_base_command in self._handlers:
+            output = self._handlers[full_base_command](arg_string, base_cmd_part2, job, session)
+        elif full_base_command == "pwd":
+            output = getPresentWorkingDirectory(session)
+        elif full_base_command == "ls":
+            output = list_directory(arg_string, job, self.dir_cache, session.cwd)
+        elif full_base_command == "cd":
+            try:
+                output = changeDirectory(" ".join(split_arguments(arg_string)), session) # Unquoted spaces are kept
+                if not isinstance(output, FailedOutput):
+                    self.dir_cache.prefetch(session.cwd) # Ready for the first Tab in the new directory
+            except ValueError as e:
+                output = FailedOutput(f"cd: {e}")
+        elif full_base_command in ["mkdir", "touch", "rm", "rm -r"]:
+            output = run_batch_command(full_base_command, arg_string, job, self.trash, session.cwd)
+        elif full_base_command in ["cache", "intents", "ai"] and self.intents_pending:
+            output = "AI components are still loading; try again in a moment."
+        elif full_base_command == "cache":
+            if self.intent_cache is None:
+                output = "Intent cache disabled."
+            elif base_cmd_part2.lower() == "clear":
+                self.intent_cache.clear()
+                output = "Intent cache cleared."
+            else:
+                output = self.intent_cache.describe()
+        elif full_base_command == "intents":
+            output = self.local_intent_engine.describe() if self.local_intent_engine else "Local intents disabled."
+        elif full_base_command == "trash":
+            output = trash_command(arg_string, self.trash)
+        elif full_base_command == "stats":
+            output = self.stats_command(arg_string)
+        elif full_base_command == "ai":
+            output = self.intent_client.describe() if self.intent_client else "AI client not configured."
+        elif not full_base_command : # Handles empty input after stripping
+            pass # Just go to new prompt
+        else:
+            output = FailedOutput(f"Unknown command: '{command_str}'")
+        return output
+
+    def stats_command(self, arg_string):
+        parts = arg_string.split(maxsplit=1)
+        subcommand = parts[0].lower() if parts else ""
+        if not subcommand:
+            return self.metrics.describe()
+        if subcommand == "reset":
+            self.metrics.reset()
+            return "Metrics reset."
+        if subcommand == "export":
+            path = os.path.expanduser(parts[1].strip()) if len(parts) > 1 else self.metrics_file
+            if not path:
+                return FailedOutput("Usage: stats export <file.json | file.csv>")
+            try:
+                return f"Metrics written to {self.metrics.export(path)}"
+            except OSError as e:
+                return FailedOutput(f"Error writing metrics to '{path}': {e}")
+        return FailedOutput("Usage: stats [reset | export [file.json | file.csv]]")
+
+    # --- Tab completion ---
+    def complete(self, line, scan=True, session=None):
+        # Completes the last word of a typed line: command names first, then paths for
+        # COMPLETION_COMMANDS. Returns (new line, candidates to list when ambiguous). With
+        # scan=False it returns None instead of reading an uncached directory, so a UI thread can
+        # hand that case to a background thread.
+        start = time.perf_counter()
+        session = session or self.session
+        head, word, quote = split_last_word(line)
+        words = head.split()
+        if not words:
+            names = sorted(set(KNOWN_COMMANDS + self.argument_commands + list(self._handlers)) - {"unknown"})
+            matches = [name for name in names if name.startswith(word)]
+            if len(matches) == 1:
+                return head + matches[0] + " ", []
+            common = os.path.commonprefix(matches) if matches else word
+            return head + common, matches if common == word else []
+        if words[0] not in COMPLETION_COMMANDS or word.startswith("-"):
+            return line, []
+
+        directory, prefix = os.path.split(word)
+        path = session.resolve(directory) if directory else session.cwd
+        try:
+            listing = self.dir_cache.listing(path) if scan else self.dir_cache.get(path)
+        except OSError:
+            return line, []
+        if listing is None:
+            return None
+        dirs_only = COMPLETION_COMMANDS[words[0]]
+        matches = listing.matching(prefix, dirs_only) or listing.matching_folded(prefix, dirs_only)
+        self.metrics.record("complete", time.perf_counter() - start)
+        if not matches:
+            return line, []
+        if len(matches) == 1:
+            is_dir = listing.is_dir[matches[0]]
+            value = os.path.join(directory, matches[0]) + ("/" if is_dir else "")
+            return head + quote_completion(value, quote, closed=True) + ("" if is_dir else " "), []
+        # Sorted matches share the prefix that their first and last entries share.
+        common = os.path.commonprefix([matches[0], matches[-1]])
+        if len(common) > len(prefix) or (common and not common.startswith(prefix)): # Longer, or case fixed
+            return head + quote_completion(os.path.join(directory, common), quote, closed=False), []
+        shown = [name + ("/" if listing.is_dir[name] else "") for name in matches[:COMPLETION_LIST_LIMIT]]
+        if len(matches) > COMPLETION_LIST_LIMIT:
+            shown.append(f"... and {len(matches) - COMPLETION_LIST_LIMIT} more")
+        return line, shown
+
+    # --- Speech -> commands ---
+    # Results have the form {"commands": [{"command": ..., "argument": ...}, ...]} in the order the
+    # user asked for them, plus "error" when interpretation failed.
+    def resolve_intent(self, transcribed_text):
+        cached_result = self.intent_cache.get(transcribed_text) if self.intent_cache else None
+        if cached_result is not None:
+            self.metrics.increment("intent_cache_hits")
+            cached_result["cached"] = True
+            return cached_result
+        self.metrics.increment("intent_cache_misses")
+
+        if self.local_intent_engine is not None:
+            ai_result = self.local_intent_engine.resolve(transcribed_text, self.ask_llm)
+        else:
+            ai_result = self.ask_llm(transcribed_text)
+        if ai_result.get("source") == "local":
+            self.metrics.increment("intent_local")
+        if self.intent_cache and not ai_result.get("fallback"): # Guesses made while Gemini was down aren't remembered
+            self.intent_cache.put(transcribed_text, ai_result)
+        return ai_result
+
+    def ask_llm(self, transcribed_text):
+        if self.intent_client is None:
+            return {"commands": [], "error": "Gemini AI not available."}
+        from intent_client import CircuitOpenError, TransportError # Already loaded with the client
+        try:
+            with self.metrics.timer("llm"):
+                response_text = self.intent_client.generate(build_intent_prompt(transcribed_text,
+                                                                                self.voice_allowlist))
+        except CircuitOpenError as e:
+            self.metrics.increment("llm_circuit_open")
+            # Backend unhealthy: "unavailable" lets the local engine answer instead.
+            return {"commands": [], "error": f"{e}; using local handling.", "unavailable": True}
+        except TransportError as e:
+            self.metrics.increment("llm_errors")
+            error_message = f"Error calling Gemini API: {e}"
+            print(error_message)
+            return {"commands": [], "error": error_message, "unavailable": e.retryable}
+        result = parse_intent_response(response_text)
+        if result.get("error"):
+            self.metrics.increment("llm_errors")
+        return result
+
+    def interpret(self, transcribed_text):
+        # Returns (full command lines, error message, raw AI result). The whole utterance is
+        # rejected if any part of it isn't a known command.
+        ai_result = self.resolve_intent(transcribed_text)
+        commands = ai_result.get("commands") or []
+        error_msg = ai_result.get("error")
+        if error_msg and not commands:
+            return [], f"AI Error: {error_msg}", ai_result
+
+        # "run" is only offered to the AI when there is a voice allowlist; execute() enforces it.
+        known = KNOWN_COMMANDS + (["run"] if self.voice_allowlist else [])
+        unmapped = [c["command"] for c in commands if c["command"] not in known
+                    or (c["command"] == "run" and not c["argument"].strip())]
+        if not commands or unmapped:
+            message = f"AI could not map speech to a known command. (AI result: '{', '.join(unmapped)}')"
+            if unmapped == ["unknown"] and len(commands) == 1 and not commands[0]["argument"] and not error_msg:
+                message = "Sorry, I didn't understand that command."
+            return [], message, ai_result
+        return format_commands(commands), None, ai_result
+
+    def close_session(self, session):
+        session.close() # RemoteEngine also closes the daemon's side of it
+
+    def close(self):
+        if self.intent_cache:
+            self.intent_cache.flush() # Entries still waiting for their delayed save
+        if self.metrics.enabled and self.metrics_file:
+            try:
+                self.metrics.export(self.metrics_file)
+            except OSError as e:
+                print(f"Could not write metrics to '{self.metrics_file}': {e}")
+
+
+def create_engine(data_dir=None, on_trash_error=None, on_trash_purged=None, load_intents=True):
+    # Builds an engine from the VOICEOS_* environment settings (see the README). With
+    # load_intents=False the AI side is left for load_intent_components(), which front ends run in
+    # the background so typed commands work while NumPy and the Gemini SDK are still importing.
+    data_dir = data_dir or os.getenv("VOICEOS_HOME", os.path.join(os.path.expanduser("~"), ".voiceos"))
+
+    # --- Trash ---
+    # rm -r renames directories into a staging area and returns at once; a background purger deletes
+    # them after VOICEOS_TRASH_PURGE_DELAY seconds. Until then `trash restore` brings them back.
+    trash = None
+    if os.getenv("VOICEOS_TRASH", "1") != "0":
+        trash = Trash(os.path.join(data_dir, "trash"),
+                      purge_delay=float(os.getenv("VOICEOS_TRASH_PURGE_DELAY", "60")),
+                      workers=int(os.getenv("VOICEOS_TRASH_WORKERS", "8")),
+                      on_error=on_trash_error, on_purged=on_trash_purged)
+        trash.start()
+
+    # --- Metrics ---
+    # Per-stage latency histograms and counters, shown by `stats` and written on close().
+    metrics = Metrics(enabled=os.getenv("VOICEOS_METRICS", "1") != "0")
+    metrics_file = os.getenv("VOICEOS_METRICS_FILE", os.path.join(data_dir, "metrics.json"))
+
+    # --- External commands ---
+    # Typed lines that aren't built-ins run as programs unless VOICEOS_EXTERNAL_COMMANDS=0. Voice
+    # commands may only run the programs in VOICEOS_VOICE_ALLOWLIST (comma-separated, empty: none).
+    voice_allowlist = [name.strip() for name in os.getenv("VOICEOS_VOICE_ALLOWLIST", "").split(",") if name.strip()]
+
+    engine = ShellEngine(trash=trash, metrics=metrics, metrics_file=metrics_file,
+                         dir_cache=DirectoryCache(int(os.getenv("VOICEOS_DIR_CACHE_SIZE", "64"))),
+                         external_commands=os.getenv("VOICEOS_EXTERNAL_COMMANDS", "1") != "0",
+                         voice_allowlist=voice_allowlist)
+    if load_intents:
+        load_intent_components(engine, data_dir)
+    return engine
+
+
+def load_intent_components(engine, data_dir=None, profile=None):
+    # Imports and initializes the intent side (Gemini SDK, NumPy classifier, cache) and attaches it
+    # to the engine. This is the slow part of startup; phases are timed into `profile` (a
+    # StartupProfile) when given, else into the engine's metrics as "startup.<phase>".
+    data_dir = data_dir or os.getenv("VOICEOS_HOME", os.path.join(os.path.expanduser("~"), ".voiceos"))
+    engine.intents_pending = True
+    try:
+        _load_intent_components(engine, data_dir, profile)
+    finally:
+        engine.intents_pending = False
+    return engine
+
+
+def _load_intent_components(engine, data_dir, profile):
+    if profile is not None:
+        phase = profile.phase
+    else:
+        phase = lambda name: engine.metrics.timer(f"startup.{name}")
+
+    with phase("import.intents"):
+        from intent_classifier import LocalIntentClassifier, LocalIntentEngine
+        from intent_client import IntentClient, CircuitBreaker, create_transport
+
+    # --- Intent Cache ---
+    # Remembers how Gemini mapped a (normalized) transcript so repeated phrases skip the network.
+    with phase("intent_cache"):
+        engine.intent_cache = IntentCache(
+            path=os.getenv("VOICEOS_INTENT_CACHE_FILE", os.path.join(data_dir, "intent_cache.json")),
+            max_entries=int(os.getenv("VOICEOS_INTENT_CACHE_SIZE", "512")),
+            ttl_seconds=float(os.getenv("VOICEOS_INTENT_CACHE_TTL", str(7 * 24 * 3600))),
+        )
+
+    # --- Local Intent Classifier ---
+    # Resolves confident utterances on-device; only uncertain ones are sent to Gemini. Fitted here
+    # so the first utterance doesn't pay for it.
+    if os.getenv("VOICEOS_LOCAL_INTENTS", "1") != "0":
+        with phase("intent_classifier"):
+            classifier = LocalIntentClassifier(history_path=os.getenv(
+                "VOICEOS_INTENT_HISTORY_FILE", os.path.join(data_dir, "intent_history.jsonl")),
+                max_history=int(os.getenv("VOICEOS_INTENT_HISTORY_SIZE", "5000")))
+            classifier.fit()
+            engine.local_intent_engine = LocalIntentEngine(
+                classifier,
+                threshold=float(os.getenv("VOICEOS_LOCAL_INTENT_THRESHOLD", "0.75")),
+                audit_rate=float(os.getenv("VOICEOS_LOCAL_INTENT_AUDIT_RATE", "0.1")),
+            )
+
+    # --- Gemini AI Setup ---
+    # Requests go through IntentClient: per-request deadline, bounded retries, optional hedging and a
+    # circuit breaker. VOICEOS_LLM_URL swaps Gemini for the local stand-in (fake_llm_server.py).
+    # Attached last: ai_ready turning true means the whole intent side is usable.
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    llm_url = os.getenv("VOICEOS_LLM_URL")
+    if not gemini_api_key and not llm_url:
+        print("Error: GEMINI_API_KEY not found in .env file. Voice AI features will be limited.")
+        return
+    try:
+        with phase("ai_client"):
+            hedge_after = os.getenv("VOICEOS_AI_HEDGE_AFTER")
+            engine.intent_client = IntentClient(
+                create_transport(gemini_api_key, llm_url),
+                deadline=float(os.getenv("VOICEOS_AI_DEADLINE", "8")),
+                attempt_timeout=float(os.getenv("VOICEOS_AI_ATTEMPT_TIMEOUT", "4")),
+                max_retries=int(os.getenv("VOICEOS_AI_RETRIES", "2")),
+                hedge_after=float(hedge_after) if hedge_after else None,
+                breaker=CircuitBreaker(failure_threshold=int(os.getenv("VOICEOS_AI_BREAKER_FAILURES", "5")),
+                                       reset_seconds=float(os.getenv("VOICEOS_AI_BREAKER_RESET", "30"))),
+            )
+        print(f"Gemini AI initialized successfully with transport: {engine.intent_client.transport.describe()}.")
+    except Exception as e:
+        print(f"Error initializing Gemini AI: {e}. Voice AI features will be limited.")
+
+
+# --- Command-line runner ---
+#   python shell_engine.py -c "mkdir demo" -c "cd demo"    run commands
+#   python shell_engine.py script.txt                      run a script, one command per line
+#   python shell_engine.py --say "make a folder called x"  resolve speech with the AI, then run it
+#   python shell_engine.py -c "git log | head -3"          anything that isn't built in runs as a program
+#   python shell_engine.py                                 interactive prompt
+def run_lines(engine, lines, as_json=False, stop_on_error=False, spoken=False):
+    # Output that commands stream (programs, ls) is written as it arrives, except with --json.
+    failures = 0
+    last_written = "\n"
+
+    def write_output(string, tag):
+        nonlocal last_written
+        stream = sys.stderr if tag == "error" else sys.stdout
+        stream.write(string)
+        stream.flush()
+        last_written = string[-1]
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        last_written = "\n"
+        job = None if as_json else Job(0, line, on_output=write_output)
+        result = engine.execute(line, job, spoken=spoken)
+        if last_written != "\n":
+            print()
+        if as_json:
+            print(json.dumps(result.to_dict()))
+        elif result.action == "clear":
+            if sys.stdout.isatty():
+                print("\033[2J\033[H", end="")
+        elif result.output:
+            print(result.output)
+        if not result.ok:
+            failures += 1
+            if stop_on_error:
+                break
+    return failures
+
+def main(argv=None):
+    import argparse
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    parser = argparse.ArgumentParser(description="Run VoiceOS shell commands without the GUI.")
+    parser.add_argument("script", nargs="?", help="File with one command per line ('-' for stdin)")
+    parser.add_argument("-c", dest="commands", action="append", default=[], help="Command to run (repeatable)")
+    parser.add_argument("--say", action="append", default=[], help="Spoken text to interpret and run (repeatable)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON result per command")
+    parser.add_argument("--stop-on-error", action="store_true", help="Stop at the first failing command")
+    args = parser.parse_args(argv)
+
+    # Only --say needs the AI side; the interactive prompt loads it in the background.
+    engine = create_engine(load_intents=bool(args.say))
+    failures = 0
+    try:
+        for utterance in args.say:
+            full_commands, error, _ = engine.interpret(utterance)
+            if error:
+                print(error, file=sys.stderr)
+                failures += 1
+                continue
+            # An utterance always stops at its first failure, as in the GUI.
+            failures += run_lines(engine, full_commands, args.json, stop_on_error=True, spoken=True)
+        lines = list(args.commands)
+        if not args.script and not args.say and not lines and not sys.stdin.isatty():
+            args.script = "-" # Piped input is a script, not an interactive session
+        if args.script:
+            with (sys.stdin if args.script == "-" else open(args.script, "r", encoding="utf-8")) as f:
+                lines.extend(f.read().splitlines())
+        failures += run_lines(engine, lines, args.json, args.stop_on_error)
+
+        if not args.say and not lines:
+            engine.intents_pending = True
+            threading.Thread(target=load_intent_components, args=(engine,), daemon=True).start()
+            while True:
+                try:
+                    line = input(f"{engine.session.cwd} $ ")
+                except EOFError:
+                    break
+                if line.strip() == "exit":
+                    break
+                run_lines(engine, [line])
+    finally:
+        engine.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
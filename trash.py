@@ -0,0 +1,331 @@
+import os
+import json
+import stat
+import time
+import uuid
+import threading
+try:
+    import fcntl
+except ImportError: # Windows: index saves are merged but not locked
+    fcntl = None
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def parallel_rmtree(path, workers=8, on_error=None):
+    # Deletes a tree with several threads: each task scans one directory with os.scandir,
+    # unlinks its files and queues its subdirectories; directories are then removed deepest first.
+    # Returns (entries_removed, errors).
+    directories = []
+    errors = []
+    removed = 0
+    lock = threading.Lock()
+
+    def report(message):
+        with lock:
+            errors.append(message)
+        if on_error:
+            on_error(message)
+
+    def scan(directory):
+        nonlocal removed
+        subdirectories = []
+        unlinked = 0
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                        else:
+                            os.unlink(entry.path)
+                            unlinked += 1
+                    except OSError as e:
+                        report(f"Could not delete '{entry.path}': {e}")
+        except OSError as e:
+            report(f"Could not read '{directory}': {e}")
+        with lock:
+            removed += unlinked
+            directories.extend(subdirectories)
+        return subdirectories
+
+    directories.append(path)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="purge") as executor:
+        pending = {executor.submit(scan, path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for subdirectory in future.result():
+                    pending.add(executor.submit(scan, subdirectory))
+
+    for directory in sorted(directories, key=lambda d: d.count(os.sep), reverse=True):
+        try:
+            os.rmdir(directory)
+            removed += 1
+        except OSError as e:
+            report(f"Could not remove directory '{directory}': {e}")
+    return removed, errors
+
+
+def describe_purge_errors(original_path, removed, errors, max_shown=3):
+    # One message per purged item, however many of its files failed: an unreadable tree would
+    # otherwise flood the status line and the session log with a message per file.
+    shown = "; ".join(errors[:max_shown])
+    more = f"; ... and {len(errors) - max_shown} more" if len(errors) > max_shown else ""
+    return (f"Purged '{original_path}' with {len(errors)} error(s), {removed} entries removed: "
+            f"{shown}{more}")
+
+
+def process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        return True # os.kill would terminate it; leave other processes' claims alone
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True # Exists, owned by someone else
+    return True
+
+
+def existing_ancestor(path):
+    # The path itself, or its nearest parent that exists: where it would be created.
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+
+def find_mount_point(path):
+    path = os.path.abspath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+# --- Staging area for rm -r ---
+# Removing a directory renames it into a staging area on the same filesystem (instant, atomic)
+# and a background purger deletes it later. Until then the item can be restored. Several
+# processes (windows, the daemon) can share one trash: each saves the index merged with what the
+# others wrote, and an item is claimed by renaming it to <staged path>.purging-<pid> before it is
+# purged, so only one deletes it. Claims left by a process that died mid-purge are finished by the
+# next purger to start.
+class Trash:
+    def __init__(self, home_dir, purge_delay=60.0, workers=8, on_error=None, on_purged=None):
+        self.home_dir = home_dir
+        self.index_path = os.path.join(home_dir, "index.json")
+        self.purge_delay = purge_delay  # Seconds an item stays restorable
+        self.workers = workers
+        self.on_error = on_error        # on_error(message), called from the purger thread, once per item
+        self.on_purged = on_purged      # on_purged(item, entries_removed, errors)
+        self._items = {}
+        self._removed = set()   # Ids purged or restored here, not yet dropped from the index on disk
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._load_index()
+
+    # --- Index persistence, so restore and purging survive a restart ---
+    def _load_index(self):
+        for item in self._read_index():
+            self._items[item["id"]] = item
+
+    def _read_index(self, existing_only=True):
+        # Items whose staged directory still exists; the others were purged or restored.
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return [item for item in items if isinstance(item, dict) and "id" in item
+                and (not existing_only or os.path.lexists(item.get("staged_path", "")))]
+
+    def _file_lock(self):
+        # Held while the index is read, merged and replaced, on a sidecar file as in CommandHistory.
+        if fcntl is None:
+            return None
+        lock_file = open(self.index_path + ".lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _save_index(self):
+        lock_file = None
+        try:
+            os.makedirs(self.home_dir, exist_ok=True)
+            lock_file = self._file_lock()
+            on_disk = self._read_index()
+            with self._lock:
+                removed = set(self._removed)
+                items = {item["id"]: item for item in on_disk if item["id"] not in removed}
+                items.update(self._items) # Entries other processes wrote are kept
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(list(items.values()), f)
+            os.replace(tmp_path, self.index_path)
+            with self._lock:
+                self._removed -= removed
+        except OSError as e:
+            if self.on_error:
+                self.on_error(f"Could not save trash index: {e}")
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def _staging_dir_for(self, path):
+        # rename() only works within one filesystem, so pick a staging directory on the target's
+        # device: the trash home, else one at the filesystem's mount point (like .Trash-<uid>).
+        # The device is checked before anything is created.
+        device = os.lstat(path).st_dev
+        uid = os.getuid() if hasattr(os, "getuid") else "user"
+        for candidate in [os.path.join(self.home_dir, "items"),
+                          os.path.join(find_mount_point(path), f".voiceos-trash-{uid}")]:
+            try:
+                if os.stat(existing_ancestor(candidate)).st_dev != device:
+                    continue
+                os.makedirs(candidate, exist_ok=True)
+                if os.stat(candidate).st_dev == device: # A mount point may sit in between
+                    return candidate
+            except OSError:
+                continue
+        raise OSError(f"No staging directory available on the same filesystem as '{path}'")
+
+    def _release_staging_dir(self, staged_path):
+        # Staging directories outside the trash home are removed once empty.
+        staging_dir = os.path.dirname(staged_path)
+        if os.path.abspath(staging_dir) != os.path.abspath(os.path.join(self.home_dir, "items")):
+            try:
+                os.rmdir(staging_dir)
+            except OSError:
+                pass # Still holds other items
+
+    def stage(self, path):
+        # Same preconditions as shutil.rmtree; raises FileNotFoundError, NotADirectoryError, OSError.
+        mode = os.lstat(path).st_mode
+        if stat.S_ISLNK(mode):
+            raise OSError("Cannot call rmtree on a symbolic link")
+        if not stat.S_ISDIR(mode):
+            raise NotADirectoryError(path)
+        original_path = os.path.abspath(path)
+        item_id = uuid.uuid4().hex[:8]
+        staged_path = os.path.join(self._staging_dir_for(path), f"{item_id}-{os.path.basename(original_path)}")
+        os.rename(path, staged_path)
+        item = {"id": item_id, "original_path": original_path, "staged_path": staged_path,
+                "staged_at": time.time()}
+        with self._lock:
+            self._items[item_id] = item
+        self._save_index()
+        self._wake.set()
+        return item
+
+    def find(self, key):
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+            matches = [item for item in self._items.values()
+                       if os.path.basename(item["original_path"]) == key or item["original_path"] == key]
+        # The most recently removed item wins when several share a name.
+        return max(matches, key=lambda item: item["staged_at"]) if matches else None
+
+    def restore(self, key):
+        item = self.find(key)
+        if item is None:
+            raise KeyError(key)
+        if os.path.lexists(item["original_path"]):
+            raise FileExistsError(item["original_path"])
+        with self._lock:
+            if item["id"] not in self._items:
+                raise KeyError(key)  # Purged in the meantime
+            del self._items[item["id"]]
+        try:
+            os.rename(item["staged_path"], item["original_path"])
+        except FileNotFoundError:
+            with self._lock:
+                self._removed.add(item["id"])
+            self._save_index()
+            raise KeyError(key) # Purged or restored by another process
+        except OSError:
+            with self._lock:
+                self._items[item["id"]] = item
+            raise
+        with self._lock:
+            self._removed.add(item["id"])
+        self._release_staging_dir(item["staged_path"])
+        self._save_index()
+        return item
+
+    def items(self):
+        with self._lock:
+            return sorted(self._items.values(), key=lambda item: item["staged_at"])
+
+    # --- Background purger ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._purge_loop, daemon=True, name="trash-purger")
+            self._thread.start()
+
+    def purge_now(self):
+        with self._lock:
+            for item in self._items.values():
+                item["staged_at"] = 0
+        self._wake.set()
+
+    def _purge_loop(self):
+        self._reclaim_orphans()
+        while True:
+            self._wake.wait(timeout=max(1.0, self.purge_delay / 4))
+            self._wake.clear()
+            now = time.time()
+            with self._lock:
+                due = [item for item in self._items.values() if now - item["staged_at"] >= self.purge_delay]
+            for item in due:
+                with self._lock:
+                    if item["id"] not in self._items:
+                        continue  # Restored while waiting
+                    del self._items[item["id"]]
+                    self._removed.add(item["id"])
+                # Claimed by renaming it: another process sharing the trash then finds it gone.
+                claimed_path = f"{item['staged_path']}.purging-{os.getpid()}"
+                try:
+                    os.rename(item["staged_path"], claimed_path)
+                except FileNotFoundError:
+                    self._save_index()
+                    continue  # Purged or restored by another process
+                except OSError:
+                    claimed_path = item["staged_path"]
+                removed, errors = parallel_rmtree(claimed_path, self.workers)
+                self._release_staging_dir(item["staged_path"])
+                self._save_index()
+                if errors and self.on_error:
+                    self.on_error(describe_purge_errors(item["original_path"], removed, errors))
+                if self.on_purged:
+                    self.on_purged(item, removed, errors)
+
+    def _reclaim_orphans(self):
+        # Items claimed by a purger that died before finishing. They are out of the index already
+        # (their staged path is gone), so the staging directories are scanned for the claims.
+        staging_dirs = {os.path.join(self.home_dir, "items")}
+        staging_dirs.update(os.path.dirname(item.get("staged_path", "")) for item in self._read_index(existing_only=False))
+        for staging_dir in staging_dirs:
+            try:
+                with os.scandir(staging_dir) as entries:
+                    orphans = [entry.path for entry in entries if ".purging" in entry.name]
+            except OSError:
+                continue
+            for path in orphans:
+                staged_path, _, owner = path.rpartition(".purging")
+                pid = int(owner[1:]) if owner[1:].isdigit() else None # None: claims made before the pid was added
+                if pid is not None and process_alive(pid):
+                    continue # Still being purged
+                claimed_path = f"{staged_path}.purging-{os.getpid()}"
+                try:
+                    os.rename(path, claimed_path)
+                except OSError:
+                    continue # Reclaimed by another process first
+                removed, errors = parallel_rmtree(claimed_path, self.workers)
+                self._release_staging_dir(staged_path)
+                if errors and self.on_error:
+                    self.on_error(describe_purge_errors(staged_path, removed, errors))
@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import deque
+
+
+# --- Event queue between worker threads and the Tk mainloop ---
+# Tk widgets may only be touched from the mainloop thread. Workers post text, status messages and
+# callables here; the mainloop drains the queue on a root.after tick. Consecutive writes with the
+# same tag are merged into one text.insert and the view is scrolled once per frame. Each frame
+# inserts at most max_chars_per_frame characters, so a burst of output is spread over frames
+# instead of freezing the window; backlog(target) tells a fast producer how far behind its own
+# widget is, so one tab's flood never slows down the programs of another. Text can
+# name the widget it is for (one per tab); without one it goes to the current default target,
+# looked up when it is written.
+class UIEventQueue:
+    TEXT = "text"
+    STATUS = "status"
+    CALL = "call"
+
+    def __init__(self, interval_ms=16, max_chars_per_frame=64 * 1024, status_interval=0.1, metrics=None):
+        self.interval_ms = interval_ms
+        self.max_chars_per_frame = max_chars_per_frame
+        self.status_interval = status_interval  # Minimum seconds between status bar redraws
+        self._events = deque()  # append() from any thread; only the mainloop pops
+        self._backlogs = {}     # Target (None = default) -> characters posted but not yet inserted
+        self._backlog_lock = threading.Lock()
+        self._pending_status = None
+        self._last_status_time = 0.0
+        self._root = None
+        self._text_widget = None
+        self._status_var = None
+        self._on_insert = None
+        self.metrics = metrics  # Optional metrics.Metrics: time spent rendering each non-empty frame
+
+    def attach(self, root, text_widget, status_var, on_insert=None):
+        self._root = root
+        self._text_widget = text_widget
+        self._status_var = status_var
+        self._on_insert = on_insert  # on_insert(widget) once per frame per widget written to (e.g. to trim scrollback)
+        self._root.after(self.interval_ms, self._tick)
+
+    def set_target(self, text_widget):
+        # Mainloop only: where text posted without a target goes from now on.
+        self._text_widget = text_widget
+
+    def post_text(self, string, tag=None, target=None):
+        if string:
+            with self._backlog_lock:
+                self._backlogs[target] = self._backlogs.get(target, 0) + len(string)
+            self._events.append((self.TEXT, string, (tag, target)))
+
+    def backlog(self, target=None):
+        # How far the window is behind the text posted to target; fast producers wait on this.
+        return self._backlogs.get(target, 0)
+
+    def post_status(self, message):
+        self._events.append((self.STATUS, message, None))
+
+    def post_call(self, func, *args):
+        self._events.append((self.CALL, func, args))
+
+    def _tick(self):
+        try:
+            self.drain()
+        finally:
+            self._root.after(self.interval_ms, self._tick)
+
+    def drain(self):
+        if self.metrics and self._events:
+            with self.metrics.timer("render"):
+                self._drain()
+        else:
+            self._drain()
+
+    def flush(self):
+        # Mainloop only: inserts everything posted so far, ignoring the per-frame budget. Call it
+        # before writing to a widget directly, so text printed earlier lands before it. Also safe
+        # from a call the queue is running: whatever is still queued was posted before it.
+        while self._events:
+            self._drain(float("inf"))
+
+    def _drain(self, budget=None):
+        budget = budget or self.max_chars_per_frame
+        run_key = None # (tag, widget) of the run being collected
+        run_chunks = []
+        inserted = []  # Widgets written to this frame, in order
+
+        def flush_run():
+            nonlocal run_chunks
+            if run_chunks:
+                tag, widget = run_key
+                if widget is not None and widget.winfo_exists(): # Its tab may have been closed
+                    widget.insert("end", "".join(run_chunks), tag or ())
+                    if widget not in inserted:
+                        inserted.append(widget)
+                run_chunks = []
+
+        while self._events and budget > 0:
+            kind, payload, extra = self._events.popleft()
+            if kind == self.TEXT:
+                if len(payload) > budget:
+                    # Put the rest back at the front; it is written on the next frame.
+                    self._events.appendleft((kind, payload[budget:], extra))
+                    payload = payload[:budget]
+                key = (extra[0], extra[1] or self._text_widget)
+                if run_chunks and key != run_key:
+                    flush_run()
+                run_key = key
+                run_chunks.append(payload)
+                budget -= len(payload)
+                with self._backlog_lock:
+                    left = self._backlogs[extra[1]] - len(payload)
+                    if left:
+                        self._backlogs[extra[1]] = left
+                    else:
+                        del self._backlogs[extra[1]] # Closed tabs' widgets don't pile up here
+            elif kind == self.STATUS:
+                self._pending_status = payload
+            else:
+                flush_run()
+                payload(*extra)
+        flush_run()
+        for widget in inserted:
+            if self._on_insert:
+                self._on_insert(widget)
+            widget.see("end")
+
+        now = time.monotonic()
+        if self._pending_status is not None and now - self._last_status_time >= self.status_interval:
+            self._status_var.set(self._pending_status)
+            self._pending_status = None
+            self._last_status_time = now
@@ -0,0 +1,518 @@
+import os
+import sys
+import json
+import time
+import base64
+import signal
+import socket
+import asyncio
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from daemon_client import default_socket_path, encode_message, DaemonError, MAX_MESSAGE, PARSE_ERROR, \
+    INVALID_REQUEST, METHOD_NOT_FOUND, INVALID_PARAMS, NOT_UNDERSTOOD, NO_SPEECH, ASR_ERROR, \
+    UNKNOWN_SESSION, BUSY
+from jobs import Job, JobCancelled
+from session import Session
+from shell_engine import create_engine, load_intent_components, CommandResult
+
+VERSION = 1
+
+
+# --- VoiceOS daemon ---
+# One process holds the warm parts (ASR model, intent cache and classifier, AI client, directory
+# cache) and serves any number of front ends over a Unix socket, speaking the JSON-RPC 2.0 of
+# daemon_client.py. The asyncio loop only reads, parses and writes; anything that can block runs
+# on a pool of VOICEOS_DAEMON_WORKERS threads, except the COMMAND_METHODS: they run programs that
+# may never finish on their own (tail -f), so each gets a thread of its own and never holds a pool
+# worker. Every connection is read continuously, so "cancel" and the other INLINE_METHODS are
+# answered however busy the pool is. A client may have VOICEOS_DAEMON_CLIENT_QUEUE requests in
+# flight (more are refused with BUSY, so one client can't take every slot or fill the daemon's
+# memory), and across all clients VOICEOS_DAEMON_QUEUE pool-bound requests run or wait for a
+# worker, the rest waiting their turn in arrival order. Speech recognition holds one of VOICEOS_DAEMON_ASR_SLOTS, as a local model doesn't
+# get faster with more threads.
+#   ping {wait}                      status; with wait, once the AI side has loaded
+#   session.open {cwd}, session.close {session}
+#   execute {command, session, spoken, stream, ack}   result of one command line, output streamed
+#   cancel {request}                 Ctrl+C for a running execute (again to escalate)
+#   ack {request, chars}             notification: this much streamed output was consumed
+#   interpret {text}                 spoken text -> {commands, error, ai_result}
+#   recognize {audio, sample_rate, sample_width}  base64 PCM -> {text}
+#   say {text, session}              interpret, then run the commands until one fails
+#   voice {audio, ..., session}      recognize, then as say
+#   complete {line, session}, describe, stats, shutdown
+# Sessions belong to the connection that opened them and are closed with it. A connection that
+# sends no session gets one of its own, starting in the daemon's cwd.
+INLINE_METHODS = {"cancel", "ack", "session.open", "session.close", "shutdown"} # Never block; run on the loop
+COMMAND_METHODS = {"execute", "say", "voice"} # May run for as long as a program does; own thread each
+
+
+def param(params, name, kind=str, default=None, required=True):
+    value = params.get(name, default)
+    if value is None and not required:
+        return None
+    if not isinstance(value, kind):
+        raise DaemonError(f"Parameter '{name}' is missing or not a {kind.__name__}.", INVALID_PARAMS)
+    return value
+
+
+class Connection:
+    # One client. Writes happen on the loop; worker threads queue theirs with send_threadsafe and
+    # see what is still unsent through backlog(), which Job.wait_for_output_room uses.
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.sessions = {}       # Daemon session id -> Session, opened by this client
+        self.default_session = None
+        self.jobs = {}           # Request id -> Job of a running execute
+        self.unacked = {}        # Request id -> characters streamed and not yet acked, with ack
+        self.pending = 0         # Pool-bound requests admitted and not yet answered
+        self._queued = 0         # Bytes handed to the loop but not yet written
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        self._write(encode_message(message))
+
+    def send_threadsafe(self, message):
+        data = encode_message(message)
+        with self._lock:
+            self._queued += len(data)
+        self.loop.call_soon_threadsafe(self._write, data, len(data))
+
+    def _write(self, data, queued=0):
+        if queued:
+            with self._lock:
+                self._queued -= queued
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def count_unacked(self, request_id, chars):
+        with self._lock:
+            if chars > 0 or request_id in self.unacked:
+                self.unacked[request_id] = max(0, self.unacked.get(request_id, 0) + chars)
+
+    def backlog(self):
+        transport = self.writer.transport
+        buffered = transport.get_write_buffer_size() if transport and not transport.is_closing() else 0
+        return self._queued + buffered
+
+    def close(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        self.writer.close()
+
+
+class VoiceOSDaemon:
+    def __init__(self, engine, workers=8, max_pending=64, max_client_pending=16, asr_slots=2, vad=True):
+        self.engine = engine
+        self.metrics = engine.metrics
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_client_pending = max_client_pending
+        self.vad_enabled = vad
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="daemon")
+        self.asr_slots = threading.Semaphore(asr_slots)
+        self.started_at = time.time()
+        self.connections = set()
+        self.handlers = set()    # Tasks serving the connections
+        self.pending = 0 # Pool-bound requests admitted and not yet answered, all clients
+        self.sr = None
+        self.asr_backend = None
+        self.audio_preprocessor = None
+        self.speech_error = None
+        self.asr_ready = threading.Event()
+        self.intents_ready = threading.Event()
+        self._stopping = None
+        self.methods = {
+            "ping": self.ping, "session.open": self.open_session, "session.close": self.close_session,
+            "execute": self.execute, "cancel": self.cancel, "ack": self.ack, "interpret": self.interpret,
+            "recognize": self.recognize, "say": self.say, "voice": self.voice, "complete": self.complete,
+            "describe": self.describe, "stats": self.stats, "shutdown": self.shutdown,
+        }
+
+    # --- Warm-up ---
+    # Both halves load in the background, so typed commands are served at once; methods that need
+    # one of them wait for it.
+    def start_warm_up(self):
+        self.engine.intents_pending = True
+        threading.Thread(target=self.warm_up_intents, daemon=True, name="warm-intents").start()
+        threading.Thread(target=self.warm_up_speech, daemon=True, name="warm-speech").start()
+
+    def warm_up_intents(self):
+        try:
+            load_intent_components(self.engine)
+        except Exception as e:
+            print(f"Error loading the intent components: {e}")
+        finally:
+            self.intents_ready.set()
+
+    def warm_up_speech(self):
+        try:
+            with self.metrics.timer("startup.speech"):
+                import speech_recognition as sr
+                from asr_backends import load_asr_backend
+                self.sr = sr
+                self.asr_backend = load_asr_backend()
+                if self.vad_enabled:
+                    from audio_preprocess import AudioPreprocessor
+                    self.audio_preprocessor = AudioPreprocessor()
+            print(f"Speech recognition ready: {self.asr_backend.describe()}")
+        except ImportError as e:
+            self.speech_error = f"Speech recognition unavailable in the daemon: {e}"
+            print(self.speech_error)
+        finally:
+            self.asr_ready.set()
+
+    def status(self):
+        return {"version": VERSION, "pid": os.getpid(), "ai_ready": self.engine.ai_ready,
+                "asr_ready": self.asr_backend is not None, "intents_ready": self.intents_ready.is_set(),
+                "connections": len(self.connections), "pending": self.pending,
+                "sessions": sum(len(conn.sessions) for conn in self.connections),
+                "uptime": round(time.time() - self.started_at, 3)}
+
+    # --- Server ---
+    async def serve(self, path):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.max_pending)
+        claim_socket(path)
+        old_umask = os.umask(0o177) # Owner only from the start; the socket runs commands as us
+        try:
+            server = await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_MESSAGE)
+        finally:
+            os.umask(old_umask)
+        os.chmod(path, 0o600)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+        print(f"VoiceOS daemon listening on {path} (pid {os.getpid()}, {self.workers} workers, "
+              f"{self.max_pending} requests in flight at most, {self.max_client_pending} per client).")
+        self.start_warm_up()
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+            for conn in list(self.connections):
+                conn.close()
+            if self.handlers: # Let them see the closed connections and return
+                await asyncio.wait(self.handlers, timeout=1.0)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            print("VoiceOS daemon stopped.")
+
+    async def handle_connection(self, reader, writer):
+        conn = Connection(asyncio.get_running_loop(), writer)
+        self.connections.add(conn)
+        self.handlers.add(asyncio.current_task())
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # Longer than MAX_MESSAGE
+                    conn.send(error_response(None, DaemonError("Message too large.", INVALID_REQUEST)))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self.dispatch(conn, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            self.handlers.discard(asyncio.current_task())
+            self.connections.discard(conn)
+            for task in tasks:
+                task.cancel() # Requests still waiting for a slot; running ones finish on their worker
+            conn.close() # Cancels its running commands; their workers finish and are discarded
+
+    async def dispatch(self, conn, line):
+        request_id = None
+        method = None
+        respond = True # Requests that can't be parsed are answered with id null
+        admitted = False
+        start = time.perf_counter()
+        try:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                raise DaemonError("Parse error.", PARSE_ERROR)
+            if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+                raise DaemonError("Invalid request.", INVALID_REQUEST)
+            request_id = message.get("id")
+            respond = "id" in message # Notifications (no id) get no response
+            params = message.get("params") or {}
+            if not isinstance(params, dict):
+                raise DaemonError("Params must be an object.", INVALID_PARAMS)
+            method = message["method"]
+            handler = self.methods.get(method)
+            if handler is None:
+                raise DaemonError(f"Unknown method '{method}'.", METHOD_NOT_FOUND)
+            if method in INLINE_METHODS:
+                result = handler(conn, request_id, params)
+            else:
+                if conn.pending >= self.max_client_pending:
+                    raise DaemonError(f"Too many requests in flight ({conn.pending}); wait for some to finish.", BUSY)
+                conn.pending += 1
+                admitted = True
+                if method in COMMAND_METHODS:
+                    result = await run_on_own_thread(f"daemon-{method}", handler, conn, request_id, params)
+                else:
+                    self.pending += 1
+                    try:
+                        async with self.slots: # Waits, in arrival order, while the daemon is full
+                            result = await asyncio.get_running_loop().run_in_executor(self.pool, handler, conn,
+                                                                                     request_id, params)
+                    finally:
+                        self.pending -= 1
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except DaemonError as e:
+            response = error_response(request_id, e)
+        except Exception as e:
+            print(f"Error handling '{method}': {e!r}")
+            response = error_response(request_id, DaemonError(f"Internal error: {e}"))
+        finally:
+            if admitted:
+                conn.pending -= 1
+        if method in self.methods and method != "ack": # Acks are per chunk, not requests
+            self.metrics.record(f"daemon.{method}", time.perf_counter() - start)
+            if "error" in response:
+                self.metrics.increment("daemon_errors")
+        if respond:
+            conn.send(response)
+            try:
+                await conn.writer.drain()
+            except ConnectionError:
+                pass
+
+    # --- Sessions ---
+    def open_session(self, conn, request_id, params):
+        cwd = param(params, "cwd", required=False)
+        if cwd is not None and not os.path.isdir(cwd):
+            raise DaemonError(f"Not a directory: '{cwd}'", INVALID_PARAMS)
+        session = Session(cwd)
+        conn.sessions[session.id] = session
+        return {"session": session.id, "cwd": session.cwd}
+
+    def close_session(self, conn, request_id, params):
+        session = conn.sessions.pop(param(params, "session", int), None)
+        if session is not None:
+            session.close()
+        return {"closed": session is not None}
+
+    def session_for(self, conn, params):
+        session_id = params.get("session")
+        if session_id is None:
+            if conn.default_session is None:
+                conn.default_session = Session()
+            return conn.default_session
+        session = conn.sessions.get(session_id)
+        if session is None:
+            raise DaemonError(f"Unknown session {session_id!r}.", UNKNOWN_SESSION)
+        return session
+
+    # --- Commands ---
+    def run_command(self, conn, request_id, command, session, spoken=False, stream=True, ack=False):
+        # With stream, output is sent as "output" notifications while the command runs and the
+        # command can be cancelled. Output is held back while the connection's socket is behind
+        # and, with ack, while the client hasn't acked what it was sent of this request, so a
+        # client consuming one request slowly doesn't hold up its others.
+        job = None
+        if stream:
+            def on_output(text, tag):
+                if ack:
+                    conn.count_unacked(request_id, len(text))
+                conn.send_threadsafe({"jsonrpc": "2.0", "method": "output",
+                                      "params": {"request": request_id, "text": text, "tag": tag}})
+            job = Job(request_id, command, on_output=on_output,
+                      output_backlog=lambda: conn.backlog() + conn.unacked.get(request_id, 0))
+            conn.jobs[request_id] = job
+        try:
+            result = self.engine.execute(command, job, spoken, session)
+        except JobCancelled:
+            result = CommandResult(command, self.engine.parse(command)[0], f"'{command}' cancelled.", ok=False)
+        finally:
+            conn.jobs.pop(request_id, None)
+            conn.unacked.pop(request_id, None)
+        if job is not None and job.cancelled:
+            result.ok = False
+        return dict(result.to_dict(), cwd=session.cwd)
+
+    def execute(self, conn, request_id, params):
+        session = self.session_for(conn, params)
+        return self.run_command(conn, request_id, param(params, "command"), session,
+                                bool(params.get("spoken")), bool(params.get("stream", True)), bool(params.get("ack")))
+
+    def cancel(self, conn, request_id, params):
+        job = conn.jobs.get(params.get("request"))
+        if job is not None:
+            job.cancel()
+        return {"cancelled": job is not None}
+
+    def ack(self, conn, request_id, params):
+        conn.count_unacked(params.get("request"), -param(params, "chars", int))
+        return None
+
+    def complete(self, conn, request_id, params):
+        completion = self.engine.complete(param(params, "line"), session=self.session_for(conn, params))
+        line, candidates = completion
+        return {"line": line, "candidates": candidates}
+
+    # --- Speech ---
+    def interpret_text(self, text):
+        self.intents_ready.wait()
+        full_commands, error, ai_result = self.engine.interpret(text)
+        return {"commands": full_commands, "error": error, "ai_result": ai_result}
+
+    def interpret(self, conn, request_id, params):
+        return self.interpret_text(param(params, "text"))
+
+    def recognize_audio(self, params):
+        self.asr_ready.wait()
+        if self.asr_backend is None:
+            raise DaemonError(self.speech_error, ASR_ERROR)
+        try:
+            audio = self.sr.AudioData(base64.b64decode(param(params, "audio"), validate=True),
+                                      param(params, "sample_rate", int, 16000), param(params, "sample_width", int, 2))
+        except ValueError as e:
+            raise DaemonError(f"Bad audio: {e}", INVALID_PARAMS)
+        if self.audio_preprocessor is not None:
+            with self.metrics.timer("vad"):
+                audio, _ = self.audio_preprocessor.process(audio, target_rate=self.asr_backend.sample_rate)
+            if audio is None:
+                raise DaemonError("No speech detected.", NO_SPEECH)
+        with self.asr_slots, self.metrics.timer("asr"):
+            try:
+                return self.asr_backend.recognize(audio).lower()
+            except self.sr.UnknownValueError:
+                raise DaemonError(f"Speech recognition ({self.asr_backend.name}) could not understand audio.",
+                                  NOT_UNDERSTOOD)
+            except self.sr.RequestError as e:
+                raise DaemonError(f"Speech recognition service error; {e}", ASR_ERROR)
+
+    def recognize(self, conn, request_id, params):
+        return {"text": self.recognize_audio(params)}
+
+    def say(self, conn, request_id, params, text=None):
+        # An utterance stops at its first failing command, as in the GUI.
+        session = self.session_for(conn, params)
+        text = text if text is not None else param(params, "text")
+        interpreted = self.interpret_text(text)
+        results = []
+        if not interpreted["error"]:
+            for command in interpreted["commands"]:
+                result = self.run_command(conn, request_id, command, session, spoken=True,
+                                          stream=bool(params.get("stream", True)))
+                results.append(result)
+                if not result["ok"]:
+                    break
+        return dict(interpreted, text=text, results=results, cwd=session.cwd)
+
+    def voice(self, conn, request_id, params):
+        self.session_for(conn, params) # Unknown session: fail before recognizing
+        return self.say(conn, request_id, params, text=self.recognize_audio(params))
+
+    # --- Introspection ---
+    def describe(self, conn, request_id, params):
+        status = self.status()
+        daemon = (f"VoiceOS daemon (pid {status['pid']}): up {status['uptime']:.0f} s, "
+                  f"{status['connections']} clients, {status['sessions']} sessions, "
+                  f"{status['pending']} requests in flight, {self.workers} workers.")
+        asr = self.asr_backend.describe() if self.asr_backend else (self.speech_error or "Speech recognition loading.")
+        preprocessor = self.audio_preprocessor.describe() if self.audio_preprocessor else "Audio preprocessing off."
+        cache = self.engine.intent_cache.describe() if self.engine.intent_cache else ""
+        return {"daemon": daemon, "asr": asr, "preprocessor": preprocessor, "intent_cache": cache}
+
+    def stats(self, conn, request_id, params):
+        return dict(self.metrics.snapshot(), daemon=self.status())
+
+    def ping(self, conn, request_id, params):
+        if params.get("wait"):
+            self.intents_ready.wait()
+        return self.status()
+
+    def shutdown(self, conn, request_id, params):
+        self._stopping.set()
+        return {"stopping": True}
+
+
+def run_on_own_thread(name, func, *args):
+    # Like run_in_executor, on a new thread that ends with func: nothing waits for a free worker.
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return # Cancelled before the thread got going (the client disconnected)
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True, name=name).start()
+    return asyncio.wrap_future(future)
+
+def error_response(request_id, error):
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": error.code, "message": str(error)}}
+
+
+def claim_socket(path):
+    # A socket file left by a daemon that died is removed; one that still answers is not ours.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise RuntimeError(f"A VoiceOS daemon is already listening on '{path}'.")
+    finally:
+        probe.close()
+
+
+def main(argv=None):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    parser = argparse.ArgumentParser(description="Serve VoiceOS commands, intents and speech recognition "
+                                                 "to front ends over a Unix socket.")
+    parser.add_argument("--socket", default=default_socket_path(), help="Socket path (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("VOICEOS_DAEMON_WORKERS", "8")),
+                        help="Worker threads for commands, intents and recognition")
+    parser.add_argument("--max-pending", type=int, default=int(os.getenv("VOICEOS_DAEMON_QUEUE", "64")),
+                        help="Requests in flight at most, across all clients")
+    parser.add_argument("--max-client-pending", type=int, default=int(os.getenv("VOICEOS_DAEMON_CLIENT_QUEUE", "16")),
+                        help="Requests in flight at most from one client")
+    args = parser.parse_args(argv)
+    if not hasattr(asyncio, "start_unix_server"):
+        print("The VoiceOS daemon needs Unix domain sockets, which this platform lacks.", file=sys.stderr)
+        return 1
+
+    engine = create_engine(load_intents=False) # The AI side loads in the background, see start_warm_up
+    daemon = VoiceOSDaemon(engine, workers=args.workers, max_pending=args.max_pending,
+                           max_client_pending=args.max_client_pending,
+                           asr_slots=int(os.getenv("VOICEOS_DAEMON_ASR_SLOTS", "2")),
+                           vad=os.getenv("VOICEOS_VAD", "1") != "0")
+    try:
+        asyncio.run(daemon.serve(args.socket))
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())